@@ -0,0 +1,344 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs Cloud Monitoring Notification Integration app with aiohttp.
+
+This is an asyncio-native alternative to main.py that accepts the same
+Pub/Sub push requests and answers them with the same messages and HTTP
+status codes. Since delivering a notification is almost entirely spent
+waiting on the Jira server, a single process can keep hundreds of
+deliveries in flight. The number of deliveries handled at once is capped
+by MAX_IN_FLIGHT_REQUESTS (lowered while the third party service is slow,
+see admission_control.py), requests over the cap are refused with a 429
+status, and all deliveries share one connection pool.
+
+To serve it with gunicorn:
+
+  $ gunicorn --bind :8080 --worker-class aiohttp.GunicornWebWorker async_main:app
+"""
+
+import asyncio
+import collections
+import functools
+import logging
+import os
+
+import aiohttp
+from aiohttp import web
+
+import config
+from utilities import (pubsub, jira_notification_handler, jira_async_client, jira_auth,
+                       admission_control, graceful_shutdown, keyed_locks, ttl_cache,
+                       flap_suppression, digest, micro_batch, issue_templates, routing,
+                       monitoring_notification, push_auth)
+
+
+app_config = config.load()
+logging.basicConfig(level=app_config.LOGGING_LEVEL)
+
+# logger inherits the logging level and handlers of the root logger
+logger = logging.getLogger(__name__)
+
+# the client of a Jira server and the state bound to it
+_JiraServer = collections.namedtuple(
+    '_JiraServer', ['jira_client', 'issue_batcher', 'search_batcher', 'issue_metadata_cache'])
+
+
+async def handle_pubsub_message(request):
+    # only pushes of the configured subscription are accepted, if configured;
+    # the certificates were fetched at startup, so this does not block
+    push_token_verifier = request.app['push_token_verifier']
+    if push_token_verifier is not None:
+        try:
+            push_token_verifier.verify(request.headers.get('Authorization'))
+        except push_auth.AuthenticationError as e:
+            logger.warning(e)
+            return web.Response(text=str(e), status=401)
+        except push_auth.CertsFetchError as e:
+            logger.error(e)
+            return web.Response(text=str(e), status=503)
+
+    # refuse new work when over capacity, so Pub/Sub slows down its pushes; the
+    # request body is not read yet, so the memory held by requests stays bounded
+    try:
+        with request.app['admission_control'].admit():
+            return await _handle_admitted_pubsub_message(request)
+    except admission_control.OverloadedError as e:
+        logger.warning(e)
+        return web.Response(text=str(e), status=429)
+
+
+async def _handle_admitted_pubsub_message(request):
+    # decode the notification straight from the body (which is only read if
+    # it is JSON, like Flask does); oversized bodies are refused before they
+    # are read in full
+    app_settings = request.app['config']
+    try:
+        body = None
+        if request.content_type == 'application/json':
+            body = await pubsub.read_body_async(request.content,
+                                                app_settings['MAX_REQUEST_BYTES'],
+                                                request.content_length)
+        monitoring_notification_dict = pubsub.decode_notification(
+            body, app_settings['MAX_NOTIFICATION_BYTES'])
+    except pubsub.PayloadTooLargeError as e:
+        logger.error(e)
+        return web.Response(text=str(e), status=413)
+    except pubsub.Error as e:
+        logger.error(e)
+        return web.Response(text=str(e), status=400)
+
+    # refuse new work once a shutdown began, so Pub/Sub redelivers it elsewhere
+    try:
+        with request.app['graceful_shutdown'].delivery():
+            message, status = await send_monitoring_notification_to_third_party(
+                request.app, monitoring_notification_dict)
+    except graceful_shutdown.ShuttingDownError as e:
+        logger.warning(e)
+        return web.Response(text=str(e), status=503)
+    return web.Response(text=message, status=status)
+
+
+async def send_monitoring_notification_to_third_party(app, notification):
+    """Send a given monitoring notification to a third party service.
+
+    Args:
+        app: The aiohttp application holding the config and Jira client.
+        notification: The dictionary containing the notification data.
+
+    Returns:
+        A tuple containing an HTTP response message and HTTP status code
+        indicating whether or not sending the notification to the third
+        party service was successful.
+    """
+    app_settings = app['config']
+    try:
+        # parsed and validated once, for routing and for the handler
+        parsed_notification = monitoring_notification.parse(
+            notification, jira_notification_handler.REQUIRED_INCIDENT_FIELDS)
+        jira_server, jira_project = _route(app, parsed_notification.incident)
+        await jira_notification_handler.update_jira_based_on_monitoring_notification_async(
+            jira_server.jira_client,
+            jira_project,
+            app_settings['CLOSED_JIRA_ISSUE_STATUS'],
+            parsed_notification,
+            app['handler_options']._replace(
+                issue_batcher=jira_server.issue_batcher,
+                search_batcher=jira_server.search_batcher,
+                issue_metadata_cache=jira_server.issue_metadata_cache,
+                digest_destination=_digest_destination(app)))
+
+    except (jira_notification_handler.Error, monitoring_notification.Error, digest.Error,
+            jira_async_client.Error) as e:
+        logger.error(e)
+        return (str(e), 400)
+
+    return ('', 200)
+
+
+def _digest_destination(app):
+    """Returns where the digest is reported: the default project, whatever the route."""
+    if app['digest'] is None:
+        return None
+    return jira_notification_handler.DigestDestination(
+        jira_client=app['jira_client'], jira_project=app['config']['JIRA_PROJECT'],
+        issue_metadata_cache=app['issue_metadata_cache'])
+
+
+def _route(app, incident):
+    """Returns the _JiraServer and the project to deliver the notification of an incident to."""
+    destination = app['router'].match(incident)
+    if destination is None or destination.jira_url is None:
+        jira_server = _JiraServer(jira_client=app['jira_client'],
+                                  issue_batcher=app['issue_batcher'],
+                                  search_batcher=app['search_batcher'],
+                                  issue_metadata_cache=app['issue_metadata_cache'])
+        if destination is None:
+            return jira_server, app['config']['JIRA_PROJECT']
+        return jira_server, destination.jira_project
+    return app['jira_servers'].get(destination.jira_url), destination.jira_project
+
+
+def _create_jira_server(app, session, jira_url):
+    """Creates the client (and the state bound to it) of a Jira server routed to.
+
+    The client shares the connection pool of the app, and authenticates
+    with the same credentials as the default one.
+    """
+    app_settings = app['config']
+    jira_client = jira_async_client.AsyncJiraClient(jira_url, session,
+                                                    jira_auth.from_config(app_settings))
+    issue_batcher = None
+    if app_settings['BULK_CREATE_MAX_BATCH_SIZE'] > 1:
+        issue_batcher = micro_batch.AsyncMicroBatcher(
+            functools.partial(jira_notification_handler.create_issues_in_bulk_async,
+                              jira_client),
+            app_settings['BULK_CREATE_MAX_BATCH_SIZE'],
+            app_settings['BULK_CREATE_MAX_DELAY_SECONDS'])
+    search_batcher = None
+    if app_settings['CLOSE_SEARCH_MAX_BATCH_SIZE'] > 1:
+        search_batcher = micro_batch.AsyncMicroBatcher(
+            functools.partial(jira_notification_handler.search_open_issues_in_bulk_async,
+                              jira_client, app_settings['CLOSED_JIRA_ISSUE_STATUS']),
+            app_settings['CLOSE_SEARCH_MAX_BATCH_SIZE'],
+            app_settings['CLOSE_SEARCH_MAX_DELAY_SECONDS'])
+    return _JiraServer(jira_client=jira_client, issue_batcher=issue_batcher,
+                       search_batcher=search_batcher,
+                       issue_metadata_cache=_create_issue_metadata_cache(
+                           app_settings['ISSUE_METADATA_TTL_SECONDS'],
+                           app['router'].projects(jira_url)))
+
+
+def _create_issue_metadata_cache(ttl_seconds, jira_projects):
+    """Returns a cache for the metadata of the projects of a server, or None if disabled."""
+    if ttl_seconds <= 0:
+        return None
+    return ttl_cache.TtlCache(len(jira_projects), ttl_seconds)
+
+
+def _default_server_projects(app):
+    """Returns the projects issues may be created in on the default Jira server."""
+    return app['router'].projects() | {app['config']['JIRA_PROJECT']}
+
+
+async def _create_issues_in_bulk(app, field_list):
+    """Creates a batch of issues with the app's Jira client."""
+    return await jira_notification_handler.create_issues_in_bulk_async(
+        app['jira_client'], field_list)
+
+
+async def _search_open_issues_in_bulk(app, incident_id_labels):
+    """Searches for the issues of a batch of incidents with the app's Jira client."""
+    return await jira_notification_handler.search_open_issues_in_bulk_async(
+        app['jira_client'], app['config']['CLOSED_JIRA_ISSUE_STATUS'], incident_id_labels)
+
+
+async def _jira_client_context(app):
+    """Creates the Jira client and its shared connection pool for the app's lifetime."""
+    app_settings = app['config']
+    connector = aiohttp.TCPConnector(limit=app_settings['HTTP_POOL_SIZE'])
+    timeout = aiohttp.ClientTimeout(total=app_settings['HTTP_TIMEOUT_SECONDS'])
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        app['jira_client'] = jira_async_client.AsyncJiraClient(
+            app_settings['JIRA_URL'], session, jira_auth.from_config(app_settings))
+        app['jira_servers'] = routing.DestinationPool(
+            functools.partial(_create_jira_server, app, session),
+            app_settings['JIRA_SERVER_POOL_SIZE'])
+        # fails the start of the app if issues cannot be created as configured
+        # in the projects of the default server
+        if app['issue_metadata_cache'] is not None:
+            for jira_project in sorted(_default_server_projects(app)):
+                await jira_notification_handler.load_issue_metadata_async(
+                    app['jira_client'], jira_project, app['issue_metadata_cache'])
+        yield
+        # handlers have finished (or were cancelled) by now; flush while the
+        # connection pool is still open
+        app['graceful_shutdown'].wait_and_flush()
+        if app['digest'] is not None:
+            try:
+                await jira_notification_handler.flush_digest_async(
+                    _digest_destination(app), app['digest'], force=True)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Failed to flush the digest, its notifications stay spooled')
+
+
+async def _fetch_push_auth_certs(app):
+    """Fetches the certificates push tokens are verified with, before requests are served."""
+    await asyncio.get_running_loop().run_in_executor(
+        None, app['push_token_verifier'].refresh_certs)
+
+
+async def _begin_shutdown(app):
+    """Refuses new deliveries once aiohttp begins its graceful shutdown.
+
+    aiohttp then waits for the in-flight handlers (for at most the
+    gunicorn graceful timeout) before it runs the cleanup contexts.
+    """
+    app['graceful_shutdown'].begin()
+
+
+def create_app(settings):
+    """Creates the aiohttp application.
+
+    Args:
+        settings: A config object whose uppercase attributes are used as
+            the settings of the application (e.g. the result of config.load()).
+
+    Returns:
+        The aiohttp application.
+    """
+    aiohttp_app = web.Application()
+    aiohttp_app['config'] = {key: getattr(settings, key)
+                             for key in dir(settings) if key.isupper()}
+    aiohttp_app.cleanup_ctx.append(_jira_client_context)
+    aiohttp_app['graceful_shutdown'] = graceful_shutdown.GracefulShutdown(
+        settings.SHUTDOWN_GRACE_PERIOD_SECONDS)
+    aiohttp_app['admission_control'] = admission_control.AdmissionController(
+        settings.MAX_IN_FLIGHT_REQUESTS, settings.ADMISSION_TARGET_LATENCY_SECONDS)
+    aiohttp_app['incident_locks'] = keyed_locks.KeyedLocks(lock_factory=asyncio.Lock)
+    aiohttp_app['pending_closes'] = ttl_cache.TtlCache(
+        settings.PENDING_CLOSE_MAX_INCIDENTS, settings.PENDING_CLOSE_TTL_SECONDS)
+    aiohttp_app['flap_suppressor'] = flap_suppression.FlapSuppressor(
+        settings.FLAP_SUPPRESSION_WINDOW_SECONDS,
+        settings.FLAP_SUPPRESSION_POLICY_WINDOW_SECONDS,
+        settings.FLAP_SUPPRESSION_MAX_INCIDENTS,
+        settings.REOPENED_JIRA_ISSUE_STATUS)
+    aiohttp_app['issue_templates'] = issue_templates.IssueTemplates(
+        settings.ISSUE_SUMMARY_TEMPLATE, settings.ISSUE_DESCRIPTION_TEMPLATE,
+        settings.ISSUE_POLICY_TEMPLATES,
+        max_summary_length=settings.ISSUE_SUMMARY_MAX_LENGTH,
+        max_description_length=settings.ISSUE_DESCRIPTION_MAX_LENGTH)
+    aiohttp_app['router'] = routing.Router(settings.JIRA_ROUTES)
+    aiohttp_app['issue_metadata_cache'] = _create_issue_metadata_cache(
+        settings.ISSUE_METADATA_TTL_SECONDS, _default_server_projects(aiohttp_app))
+    aiohttp_app['issue_batcher'] = None
+    if settings.BULK_CREATE_MAX_BATCH_SIZE > 1:
+        aiohttp_app['issue_batcher'] = micro_batch.AsyncMicroBatcher(
+            functools.partial(_create_issues_in_bulk, aiohttp_app),
+            settings.BULK_CREATE_MAX_BATCH_SIZE, settings.BULK_CREATE_MAX_DELAY_SECONDS)
+    aiohttp_app['search_batcher'] = None
+    if settings.CLOSE_SEARCH_MAX_BATCH_SIZE > 1:
+        aiohttp_app['search_batcher'] = micro_batch.AsyncMicroBatcher(
+            functools.partial(_search_open_issues_in_bulk, aiohttp_app),
+            settings.CLOSE_SEARCH_MAX_BATCH_SIZE, settings.CLOSE_SEARCH_MAX_DELAY_SECONDS)
+    aiohttp_app['digest'] = None
+    if settings.DIGEST_POLICIES:
+        aiohttp_app['digest'] = digest.Digest(
+            settings.DIGEST_POLICIES, settings.DIGEST_INTERVAL_SECONDS,
+            settings.DIGEST_MAX_INCIDENTS, settings.DIGEST_SPOOL_DIRECTORY)
+    aiohttp_app['push_token_verifier'] = push_auth.from_config(aiohttp_app['config'])
+    if aiohttp_app['push_token_verifier'] is not None:
+        aiohttp_app.on_startup.append(_fetch_push_auth_certs)
+    # the options of the handler shared by all deliveries; those bound to the
+    # Jira server a notification is routed to are filled in for each delivery
+    aiohttp_app['handler_options'] = jira_notification_handler.HandlerOptions(
+        incident_locks=aiohttp_app['incident_locks'],
+        pending_closes=aiohttp_app['pending_closes'],
+        flap_suppressor=aiohttp_app['flap_suppressor'],
+        digest=aiohttp_app['digest'],
+        issue_templates=aiohttp_app['issue_templates'])
+    aiohttp_app.on_shutdown.append(_begin_shutdown)
+    aiohttp_app.router.add_post('/', handle_pubsub_message)
+    return aiohttp_app
+
+
+app = create_app(app_config)
+
+
+if __name__ == '__main__':
+    PORT = int(os.getenv('PORT')) if os.getenv('PORT') else 8080
+
+    # This is used when running locally. Gunicorn can be used to run the
+    # application on Cloud Run, see the module docstring.
+    web.run_app(app, host='127.0.0.1', port=PORT)
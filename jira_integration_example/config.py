@@ -29,17 +29,166 @@ class JiraConfig:
     DEBUG = False
     CLOSED_JIRA_ISSUE_STATUS = 'Done'
 
+    # Requests to Jira are authenticated according to JIRA_AUTH_MODE:
+    # 'oauth1' signs every request with OAuth1 RSA-SHA1 (JIRA_ACCESS_TOKEN,
+    # JIRA_ACCESS_TOKEN_SECRET, JIRA_CONSUMER_KEY and JIRA_KEY_CERT), 'basic'
+    # sends JIRA_USERNAME and JIRA_API_TOKEN (Jira Cloud), and 'bearer' sends
+    # JIRA_PERSONAL_ACCESS_TOKEN (Jira Server and Data Center 8.14+). Only the
+    # secrets of the selected mode are read. 'basic' and 'bearer' add a header
+    # to each request instead of computing an RSA signature.
+    JIRA_AUTH_MODE = 'oauth1'
+
+    # The Flask serving mode (main.py) talks to Jira with the jira library when
+    # JIRA_CLIENT is 'jira', or with the slim client of
+    # utilities/jira_rest_client.py when it is 'rest'. The slim client is faster
+    # to import, makes no request when it is created, signs OAuth1 requests
+    # without parsing the RSA key again for each of them and keeps at most
+    # JIRA_REST_POOL_SIZE connections open (set it to the gunicorn threads per
+    # worker). Its requests time out after HTTP_TIMEOUT_SECONDS, and the
+    # idempotent ones are retried up to JIRA_REST_MAX_RETRIES times.
+    JIRA_CLIENT = 'jira'
+    JIRA_REST_POOL_SIZE = 16
+    JIRA_REST_MAX_RETRIES = 2
+
+    # Settings of the asyncio serving mode (async_main.py). At most
+    # MAX_IN_FLIGHT_REQUESTS notifications are handled at once (further
+    # requests are refused with a 429 status), and all of them share a
+    # pool of at most HTTP_POOL_SIZE connections to the Jira server.
+    MAX_IN_FLIGHT_REQUESTS = 512
+    HTTP_POOL_SIZE = 100
+    HTTP_TIMEOUT_SECONDS = 30
+
+    # Cloud Run sends SIGKILL 10 seconds after SIGTERM. Deliveries in flight
+    # at SIGTERM are given this many seconds to finish, and deliveries that
+    # arrive after SIGTERM are refused with a 503 status, so that Pub/Sub
+    # redelivers them to another instance.
+    SHUTDOWN_GRACE_PERIOD_SECONDS = 8
+
+    # When more than ADMISSION_MAX_IN_FLIGHT notifications are being
+    # delivered at once, further notifications are refused with a 429
+    # status, so that Pub/Sub slows down its pushes instead of letting
+    # requests queue up. While deliveries take longer than
+    # ADMISSION_TARGET_LATENCY_SECONDS this limit is lowered, and it grows
+    # back once they are faster. ADMISSION_MAX_IN_FLIGHT should be lower than
+    # the gunicorn threads per worker, so that spare threads can refuse
+    # requests right away (the asyncio serving mode uses
+    # MAX_IN_FLIGHT_REQUESTS instead).
+    ADMISSION_MAX_IN_FLIGHT = 8
+    ADMISSION_TARGET_LATENCY_SECONDS = 5
+
+    # Pub/Sub push requests over MAX_REQUEST_BYTES are refused with a 413
+    # status while their body is read (right away if their Content-Length
+    # is over it), so they are never buffered in full. So are those whose
+    # notification is over MAX_NOTIFICATION_BYTES once base64-decoded.
+    MAX_REQUEST_BYTES = 512 * 1024
+    MAX_NOTIFICATION_BYTES = 256 * 1024
+
+    # Pub/Sub push requests must have an OIDC token of the push subscription's
+    # service account PUSH_AUTH_SERVICE_ACCOUNT_EMAIL, issued for
+    # PUSH_AUTH_AUDIENCE (the audience set on the subscription), when both are
+    # set (see utilities/push_auth.py), and are otherwise refused with a 401
+    # status. Google's signing certificates are fetched when a worker starts
+    # and refreshed in the background every PUSH_AUTH_CERTS_REFRESH_SECONDS.
+    # At most PUSH_AUTH_MAX_CACHED_TOKENS verified tokens are cached until
+    # they expire. Setting only one of PUSH_AUTH_AUDIENCE and
+    # PUSH_AUTH_SERVICE_ACCOUNT_EMAIL fails the start of the app.
+    PUSH_AUTH_AUDIENCE = None
+    PUSH_AUTH_SERVICE_ACCOUNT_EMAIL = None
+    PUSH_AUTH_CERTS_REFRESH_SECONDS = 60 * 60
+    PUSH_AUTH_MAX_CACHED_TOKENS = 1000
+
+    # Pub/Sub does not guarantee the order of the notifications, so the close
+    # of an incident can arrive before its open. Closed incidents without a
+    # Jira issue are remembered (at most PENDING_CLOSE_MAX_INCIDENTS of them,
+    # for PENDING_CLOSE_TTL_SECONDS each), and the issue created for a later
+    # open of such an incident is transitioned right away.
+    PENDING_CLOSE_MAX_INCIDENTS = 10000
+    PENDING_CLOSE_TTL_SECONDS = 6 * 60 * 60
+
+    # Noisy alerting policies open and close incidents for the same condition
+    # and resource many times an hour. An incident that opens within the
+    # debounce window of its policy after the issue of such an incident was
+    # closed transitions that issue to REOPENED_JIRA_ISSUE_STATUS and comments
+    # on it, instead of creating a new issue. The window is
+    # FLAP_SUPPRESSION_WINDOW_SECONDS unless the policy has its own in
+    # FLAP_SUPPRESSION_POLICY_WINDOW_SECONDS (0 turns the suppression off), and
+    # at most FLAP_SUPPRESSION_MAX_INCIDENTS closed issues are remembered.
+    FLAP_SUPPRESSION_WINDOW_SECONDS = 0
+    FLAP_SUPPRESSION_POLICY_WINDOW_SECONDS = {}
+    FLAP_SUPPRESSION_MAX_INCIDENTS = 10000
+    REOPENED_JIRA_ISSUE_STATUS = 'To Do'
+
+    # Notifications of the alerting policies in DIGEST_POLICIES do not get an
+    # issue each. They are collected and reported together in one issue once
+    # DIGEST_MAX_INCIDENTS were collected or DIGEST_INTERVAL_SECONDS passed
+    # since the first of them (checked when a notification is handled, since
+    # Cloud Run only allocates CPU while handling requests), and at shutdown.
+    # Until then they are spooled to a file in DIGEST_SPOOL_DIRECTORY, so that
+    # they survive a restart of the worker process.
+    DIGEST_POLICIES = []
+    DIGEST_INTERVAL_SECONDS = 60 * 60
+    DIGEST_MAX_INCIDENTS = 500
+    DIGEST_SPOOL_DIRECTORY = '/tmp/monitoring_digest'
+
+    # Issues to be created while a request to create issues is in flight
+    # wait for it and are then created together (at most
+    # BULK_CREATE_MAX_BATCH_SIZE of them, Jira accepts up to 50) with one
+    # request to Jira's bulk create endpoint, so that bursts of incidents do
+    # not make a request each. An issue created while no request is in
+    # flight waits BULK_CREATE_MAX_DELAY_SECONDS for others to join it. A
+    # batch size of 1 turns this off.
+    BULK_CREATE_MAX_BATCH_SIZE = 50
+    BULK_CREATE_MAX_DELAY_SECONDS = 0
+
+    # Likewise, the issues of incidents closed while a search is in flight are
+    # searched for together (at most CLOSE_SEARCH_MAX_BATCH_SIZE incidents per
+    # JQL query). A batch size of 1 turns this off.
+    CLOSE_SEARCH_MAX_BATCH_SIZE = 50
+    CLOSE_SEARCH_MAX_DELAY_SECONDS = 0
+
+    # The ids of the Jira project and issue type are looked up (and the fields
+    # required to create issues are checked) when a worker starts, failing the
+    # start if issues cannot be created as configured. Issues are then
+    # created with the ids, which are looked up again after
+    # ISSUE_METADATA_TTL_SECONDS. 0 turns this off, and issues are created
+    # with the project key and issue type name instead.
+    ISSUE_METADATA_TTL_SECONDS = 60 * 60
+
+    # The summary and description of the issue created for an open incident
+    # are rendered from these templates, in the str.format syntax with the
+    # fields of the notification's incident (e.g. '{severity}',
+    # '{documentation.content}' or '{policy_user_labels.team}', see
+    # utilities/issue_templates.py). ISSUE_POLICY_TEMPLATES maps policy names
+    # to their own 'summary' and/or 'description' templates. Templates are
+    # parsed when the app is created, failing its start if one is invalid.
+    # Rendered summaries and descriptions longer than ISSUE_SUMMARY_MAX_LENGTH
+    # and ISSUE_DESCRIPTION_MAX_LENGTH characters (the most Jira accepts) are
+    # cut at a word boundary and end with a truncation marker.
+    ISSUE_SUMMARY_TEMPLATE = '{condition_name} - {resource_name}'
+    ISSUE_DESCRIPTION_TEMPLATE = '{summary}\nSee: {url}'
+    ISSUE_POLICY_TEMPLATES = {}
+    ISSUE_SUMMARY_MAX_LENGTH = 255
+    ISSUE_DESCRIPTION_MAX_LENGTH = 32767
+
+    # Notifications are delivered to JIRA_PROJECT unless a route of
+    # JIRA_ROUTES matches them, by policy name, resource type and/or policy
+    # user labels (see utilities/routing.py). A route can also send issues
+    # to another Jira server (with the same credentials), whose clients are
+    # created on first use; those of at most JIRA_SERVER_POOL_SIZE servers
+    # are kept by each worker. Digests (see DIGEST_POLICIES) are always
+    # reported to JIRA_PROJECT on the default server. For example:
+    #   JIRA_ROUTES = [{'policy_names': ['disk policy'], 'project': 'STOR'},
+    #                  {'user_labels': {'team': 'web'}, 'project': 'WEB'}]
+    JIRA_ROUTES = []
+    JIRA_SERVER_POOL_SIZE = 8
+
 
 class ProdJiraConfig(JiraConfig):
     """Production Jira config."""
 
     def __init__(self):
-        self._jira_url = None
-        self._jira_access_token = None
-        self._jira_access_token_secret = None
-        self._jira_consumer_key = None
-        self._jira_key_cert = None
-        self._jira_project = None
+        # secret name -> its value, fetched on first use
+        self._secret_values = {}
         self._gcloud_project_id = os.environ.get('PROJECT_ID')
 
 
@@ -50,62 +199,69 @@ class ProdJiraConfig(JiraConfig):
 
     @property
     def JIRA_URL(self):
-        if self._jira_url is None:
-            secret = secrets.GoogleSecretManagerSecret(
-                self._gcloud_project_id, 'jira_url')
-            self._jira_url = secret.get_secret_value()
-
-        return self._jira_url
+        return self._secret_value('jira_url')
 
 
     @property
     def JIRA_ACCESS_TOKEN(self):
-        if self._jira_access_token is None:
-            secret = secrets.GoogleSecretManagerSecret(
-                self._gcloud_project_id, 'jira_access_token')
-            self._jira_access_token = secret.get_secret_value()
-
-        return self._jira_access_token
+        if self.JIRA_AUTH_MODE != 'oauth1':
+            return None
+        return self._secret_value('jira_access_token')
 
 
     @property
     def JIRA_ACCESS_TOKEN_SECRET(self):
-        if self._jira_access_token_secret is None:
-            secret = secrets.GoogleSecretManagerSecret(
-                self._gcloud_project_id, 'jira_access_token_secret')
-            self._jira_access_token_secret = secret.get_secret_value()
-
-        return self._jira_access_token_secret
+        if self.JIRA_AUTH_MODE != 'oauth1':
+            return None
+        return self._secret_value('jira_access_token_secret')
 
 
     @property
     def JIRA_CONSUMER_KEY(self):
-        if self._jira_consumer_key is None:
-            secret = secrets.GoogleSecretManagerSecret(
-                self._gcloud_project_id, 'jira_consumer_key')
-            self._jira_consumer_key = secret.get_secret_value()
-
-        return self._jira_consumer_key
+        if self.JIRA_AUTH_MODE != 'oauth1':
+            return None
+        return self._secret_value('jira_consumer_key')
 
 
     @property
     def JIRA_KEY_CERT(self):
-        if self._jira_key_cert is None:
-            secret = secrets.GoogleSecretManagerSecret(
-                self._gcloud_project_id, 'jira_key_cert')
-            self._jira_key_cert = secret.get_secret_value()
+        if self.JIRA_AUTH_MODE != 'oauth1':
+            return None
+        return self._secret_value('jira_key_cert')
+
 
-        return self._jira_key_cert
+    @property
+    def JIRA_USERNAME(self):
+        if self.JIRA_AUTH_MODE != 'basic':
+            return None
+        return self._secret_value('jira_username')
+
+
+    @property
+    def JIRA_API_TOKEN(self):
+        if self.JIRA_AUTH_MODE != 'basic':
+            return None
+        return self._secret_value('jira_api_token')
+
+
+    @property
+    def JIRA_PERSONAL_ACCESS_TOKEN(self):
+        if self.JIRA_AUTH_MODE != 'bearer':
+            return None
+        return self._secret_value('jira_personal_access_token')
 
 
     @property
     def JIRA_PROJECT(self):
-        if self._jira_project is None:
-            secret = secrets.GoogleSecretManagerSecret(
-                self._gcloud_project_id, 'jira_project')
-            self._jira_project = secret.get_secret_value()
+        return self._secret_value('jira_project')
+
+
+    def _secret_value(self, name):
+        if name not in self._secret_values:
+            secret = secrets.GoogleSecretManagerSecret(self._gcloud_project_id, name)
+            self._secret_values[name] = secret.get_secret_value()
 
-        return self._jira_project
+        return self._secret_values[name]
 
 
 class DevJiraConfig(JiraConfig):
@@ -118,66 +274,61 @@ class DevJiraConfig(JiraConfig):
 
 
     def __init__(self):
-        self._jira_url = None
-        self._jira_access_token = None
-        self._jira_access_token_secret = None
-        self._jira_consumer_key = None
-        self._jira_key_cert = None
-        self._jira_project = None
+        # environment variable name -> its value, read on first use
+        self._secret_values = {}
 
 
     @property
     def JIRA_URL(self):
-        if self._jira_url is None:
-            secret = secrets.EnvironmentVariableSecret('JIRA_URL')
-            self._jira_url = secret.get_secret_value()
-
-        return self._jira_url
+        return self._secret_value('JIRA_URL')
 
 
     @property
     def JIRA_ACCESS_TOKEN(self):
-        if self._jira_access_token is None:
-            secret = secrets.EnvironmentVariableSecret('JIRA_ACCESS_TOKEN')
-            self._jira_access_token = secret.get_secret_value()
-
-        return self._jira_access_token
+        return self._secret_value('JIRA_ACCESS_TOKEN')
 
 
     @property
     def JIRA_ACCESS_TOKEN_SECRET(self):
-        if self._jira_access_token_secret is None:
-            secret = secrets.EnvironmentVariableSecret('JIRA_ACCESS_TOKEN_SECRET')
-            self._jira_access_token_secret = secret.get_secret_value()
-
-        return self._jira_access_token_secret
+        return self._secret_value('JIRA_ACCESS_TOKEN_SECRET')
 
 
     @property
     def JIRA_CONSUMER_KEY(self):
-        if self._jira_consumer_key is None:
-            secret = secrets.EnvironmentVariableSecret('JIRA_CONSUMER_KEY')
-            self._jira_consumer_key = secret.get_secret_value()
-
-        return self._jira_consumer_key
+        return self._secret_value('JIRA_CONSUMER_KEY')
 
 
     @property
     def JIRA_KEY_CERT(self):
-        if self._jira_key_cert is None:
-            secret = secrets.EnvironmentVariableSecret('JIRA_KEY_CERT')
-            self._jira_key_cert = secret.get_secret_value()
+        return self._secret_value('JIRA_KEY_CERT')
+
+
+    @property
+    def JIRA_USERNAME(self):
+        return self._secret_value('JIRA_USERNAME')
 
-        return self._jira_key_cert
+
+    @property
+    def JIRA_API_TOKEN(self):
+        return self._secret_value('JIRA_API_TOKEN')
+
+
+    @property
+    def JIRA_PERSONAL_ACCESS_TOKEN(self):
+        return self._secret_value('JIRA_PERSONAL_ACCESS_TOKEN')
 
 
     @property
     def JIRA_PROJECT(self):
-        if self._jira_project is None:
-            secret = secrets.EnvironmentVariableSecret('JIRA_PROJECT')
-            self._jira_project = secret.get_secret_value()
+        return self._secret_value('JIRA_PROJECT')
+
+
+    def _secret_value(self, name):
+        if name not in self._secret_values:
+            secret = secrets.EnvironmentVariableSecret(name)
+            self._secret_values[name] = secret.get_secret_value()
 
-        return self._jira_project
+        return self._secret_values[name]
 
 
 class TestJiraConfig(JiraConfig):
@@ -194,7 +345,12 @@ class TestJiraConfig(JiraConfig):
     JIRA_ACCESS_TOKEN_SECRET = 'test-access-token-secret'
     JIRA_CONSUMER_KEY = 'test-consumer-key'
     JIRA_KEY_CERT = 'test-key-cert'
+    JIRA_USERNAME = 'test-user@example.com'
+    JIRA_API_TOKEN = 'test-api-token'
+    JIRA_PERSONAL_ACCESS_TOKEN = 'test-personal-access-token'
     JIRA_PROJECT = 'test-project'
+    # the test Jira credentials cannot look up the project
+    ISSUE_METADATA_TTL_SECONDS = 0
 
 
 _ENVIRONMENT_TO_CONFIG_MAPPING = {
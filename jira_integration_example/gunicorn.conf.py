@@ -0,0 +1,90 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Gunicorn config for the Jira integration.
+
+The app is preloaded in the master process, so that config.load() and the
+Secret Manager fetches happen once, before the workers are forked, no
+matter how many workers are configured. Each worker then creates its own
+third party clients (and connection pools) right after it is forked.
+
+On SIGTERM each worker stops taking new deliveries and drains the ones in
+flight for at most SHUTDOWN_GRACE_PERIOD_SECONDS (see config.py).
+
+See https://docs.gunicorn.org/en/stable/settings.html for all settings.
+"""
+
+import os
+import signal
+import sys
+
+import config as integration_config  # "config" is a gunicorn setting name
+
+# Secret Manager is accessed over gRPC in the master process before it forks.
+os.environ.setdefault('GRPC_ENABLE_FORK_SUPPORT', 'true')
+
+bind = f":{os.environ.get('PORT', '8080')}"
+# For environments with multiple CPU cores, increase the number of workers
+# to be equal to the cores available.
+workers = int(os.environ.get('GUNICORN_WORKERS', '1'))
+# keep more threads than ADMISSION_MAX_IN_FLIGHT (see config.py), so that
+# requests over capacity are refused instead of waiting for a thread
+threads = int(os.environ.get('GUNICORN_THREADS', '16'))
+timeout = 0
+preload_app = True
+graceful_timeout = integration_config.load().SHUTDOWN_GRACE_PERIOD_SECONDS
+
+
+def post_fork(server, worker):
+    import main  # pylint: disable=import-outside-toplevel
+    from gunicorn.arbiter import Arbiter  # pylint: disable=import-outside-toplevel
+    from utilities import jira_notification_handler  # pylint: disable=import-outside-toplevel
+
+    try:
+        main.init_worker_clients(main.app)
+    except jira_notification_handler.IssueMetadataError as e:
+        # issues cannot be created as configured, which no retry would fix:
+        # exiting with this code makes gunicorn stop instead of booting
+        # another worker
+        server.log.error('Worker %s failed to boot: %s', worker.pid, e)
+        sys.exit(Arbiter.WORKER_BOOT_ERROR)
+    except Exception as e:  # pylint: disable=broad-except
+        # the client is created again on the first request instead
+        server.log.warning('Worker %s could not create its clients: %s', worker.pid, e)
+
+
+def post_worker_init(worker):
+    import main  # pylint: disable=import-outside-toplevel
+
+    # On SIGTERM gunicorn stops accepting connections and waits for the
+    # requests it already accepted. Begin the shutdown right away as well,
+    # so the accepted requests that have not started yet are refused
+    # instead of making third party calls that may get cut off.
+    shutdown = main.app.extensions['graceful_shutdown']
+    gunicorn_handle_exit = worker.handle_exit
+
+    def handle_exit(sig, frame):
+        shutdown.begin()
+        gunicorn_handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_exit)
+
+
+def worker_exit(server, worker):
+    import main  # pylint: disable=import-outside-toplevel
+
+    abandoned = main.app.extensions['graceful_shutdown'].wait_and_flush()
+    if abandoned:
+        server.log.warning('Worker %s exited with %d deliveries in flight',
+                           worker.pid, abandoned)
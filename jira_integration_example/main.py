@@ -20,15 +20,20 @@
 """Runs Cloud Monitoring Notification Integration app with Flask."""
 
 # [START run_pubsub_server_setup]
+import collections
+import functools
 import logging
 import os
-import json
+import sys
+import threading
 
-from flask import Flask, request
-from jira import JIRA, JIRAError
+from flask import Flask, current_app, request
 
 import config
-from utilities import pubsub, jira_notification_handler
+from utilities import (pubsub, jira_notification_handler, admission_control,
+                       graceful_shutdown, keyed_locks, ttl_cache, flap_suppression, digest,
+                       micro_batch, issue_templates, routing, monitoring_notification,
+                       push_auth)
 
 
 app_config = config.load()
@@ -37,34 +42,70 @@ logging.basicConfig(level=app_config.LOGGING_LEVEL)
 # logger inherits the logging level and handlers of the root logger
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-app.config.from_object(app_config)
+# guards the lazy creation of the Jira client of this process
+_jira_client_lock = threading.Lock()
+
+# the client of a Jira server and the per-process state bound to it
+_JiraServer = collections.namedtuple(
+    '_JiraServer', ['jira_client', 'issue_batcher', 'search_batcher', 'issue_metadata_cache'])
 # [END run_pubsub_server_setup]
 
 
 # [START run_pubsub_handler]
-@app.route('/', methods=['POST'])
 def handle_pubsub_message():
-    pubsub_received_message = request.get_json()
+    # only pushes of the configured subscription are accepted, if configured
+    push_token_error = _verify_push_token()
+    if push_token_error is not None:
+        return push_token_error
 
-    # parse the Pub/Sub data
+    # decode the notification straight from the body, without a copy of the
+    # Pub/Sub message as a dictionary or of the data as a string; oversized
+    # bodies are refused before they are read in full
     try:
-        pubsub_data_string = pubsub.parse_data_from_message(pubsub_received_message)
-    except pubsub.DataParseError as e:
+        body = None
+        if request.is_json:
+            body = pubsub.read_body(request.stream, current_app.config['MAX_REQUEST_BYTES'],
+                                    request.content_length)
+        monitoring_notification_dict = pubsub.decode_notification(
+            body, current_app.config['MAX_NOTIFICATION_BYTES'])
+    except pubsub.PayloadTooLargeError as e:
+        logger.error(e)
+        return (str(e), 413)
+    except pubsub.Error as e:
         logger.error(e)
         return (str(e), 400)
 
-    # load the notification from the data
+    # refuse new work once a shutdown began, so Pub/Sub redelivers it elsewhere,
+    # and when over capacity, so Pub/Sub slows down its pushes
     try:
-        monitoring_notification_dict = json.loads(pubsub_data_string)
-    except json.JSONDecodeError as e:
-        logger.error(e)
-        return (f'Notification could not be decoded due to the following exception: {e}', 400)
-
-    return send_monitoring_notification_to_third_party(monitoring_notification_dict)
+        with current_app.extensions['graceful_shutdown'].delivery(), \
+                current_app.extensions['admission_control'].admit():
+            return send_monitoring_notification_to_third_party(monitoring_notification_dict)
+    except graceful_shutdown.ShuttingDownError as e:
+        logger.warning(e)
+        return (str(e), 503)
+    except admission_control.OverloadedError as e:
+        logger.warning(e)
+        return (str(e), 429)
 # [END run_pubsub_handler]
 
 
+def _verify_push_token():
+    """Returns the error response for a push without a valid token, or None if it is accepted."""
+    push_token_verifier = current_app.extensions['push_token_verifier']
+    if push_token_verifier is None:
+        return None
+    try:
+        push_token_verifier.verify(request.headers.get('Authorization'))
+    except push_auth.AuthenticationError as e:
+        logger.warning(e)
+        return (str(e), 401)
+    except push_auth.CertsFetchError as e:
+        logger.error(e)
+        return (str(e), 503)
+    return None
+
+
 def send_monitoring_notification_to_third_party(notification):
     """Send a given monitoring notification to a third party service.
 
@@ -78,24 +119,283 @@ def send_monitoring_notification_to_third_party(notification):
     """
 
     try:
-        oauth_dict = {'access_token': app.config['JIRA_ACCESS_TOKEN'],
-                      'access_token_secret': app.config['JIRA_ACCESS_TOKEN_SECRET'],
-                      'consumer_key': app.config['JIRA_CONSUMER_KEY'],
-                      'key_cert': app.config['JIRA_KEY_CERT']}
-        jira_client = JIRA(app.config['JIRA_URL'], oauth=oauth_dict)
+        # parsed and validated once, for routing and for the handler
+        parsed_notification = monitoring_notification.parse(
+            notification, jira_notification_handler.REQUIRED_INCIDENT_FIELDS)
+        jira_server, jira_project = _route(parsed_notification.incident)
         jira_notification_handler.update_jira_based_on_monitoring_notification(
-            jira_client,
-            app.config['JIRA_PROJECT'],
-            app.config['CLOSED_JIRA_ISSUE_STATUS'],
-            notification)
+            jira_server.jira_client,
+            jira_project,
+            current_app.config['CLOSED_JIRA_ISSUE_STATUS'],
+            parsed_notification,
+            current_app.extensions['handler_options']._replace(
+                issue_batcher=jira_server.issue_batcher,
+                search_batcher=jira_server.search_batcher,
+                issue_metadata_cache=jira_server.issue_metadata_cache,
+                digest_destination=_digest_destination()))
 
-    except (jira_notification_handler.Error, JIRAError) as e:
+    except (jira_notification_handler.Error, monitoring_notification.Error, digest.Error,
+            *_jira_client_errors()) as e:
         logger.error(e)
         return (str(e), 400)
 
     return ('', 200)
 
 
+def _route(incident):
+    """Returns the _JiraServer and the project to deliver the notification of an incident to."""
+    destination = current_app.extensions['router'].match(incident)
+    if destination is None:
+        return _default_jira_server(), current_app.config['JIRA_PROJECT']
+    if destination.jira_url is None:
+        return _default_jira_server(), destination.jira_project
+    jira_server = current_app.extensions['jira_servers'].get(destination.jira_url)
+    return jira_server, destination.jira_project
+
+
+def _digest_destination():
+    """Returns where the digest is reported: the default project, whatever the route.
+
+    This is also where it is flushed at shutdown (see _flush_digest_at_shutdown).
+    """
+    if current_app.extensions['digest'] is None:
+        return None
+    return jira_notification_handler.DigestDestination(
+        jira_client=get_jira_client(), jira_project=current_app.config['JIRA_PROJECT'],
+        issue_metadata_cache=current_app.extensions['issue_metadata_cache'])
+
+
+def _default_jira_server():
+    return _JiraServer(jira_client=get_jira_client(),
+                       issue_batcher=current_app.extensions['issue_batcher'],
+                       search_batcher=current_app.extensions['search_batcher'],
+                       issue_metadata_cache=current_app.extensions['issue_metadata_cache'])
+
+
+def _create_jira_server(flask_app, jira_url):
+    """Creates the client (and the state bound to it) of a Jira server routed to.
+
+    The client authenticates with the same credentials as the default one.
+    """
+    flask_config = flask_app.config
+    jira_client = _create_jira_client(dict(flask_config, JIRA_URL=jira_url))
+    issue_batcher = None
+    if flask_config['BULK_CREATE_MAX_BATCH_SIZE'] > 1:
+        issue_batcher = micro_batch.MicroBatcher(
+            functools.partial(jira_notification_handler.create_issues_in_bulk, jira_client),
+            flask_config['BULK_CREATE_MAX_BATCH_SIZE'],
+            flask_config['BULK_CREATE_MAX_DELAY_SECONDS'])
+    search_batcher = None
+    if flask_config['CLOSE_SEARCH_MAX_BATCH_SIZE'] > 1:
+        search_batcher = micro_batch.MicroBatcher(
+            functools.partial(jira_notification_handler.search_open_issues_in_bulk,
+                              jira_client, flask_config['CLOSED_JIRA_ISSUE_STATUS']),
+            flask_config['CLOSE_SEARCH_MAX_BATCH_SIZE'],
+            flask_config['CLOSE_SEARCH_MAX_DELAY_SECONDS'])
+    return _JiraServer(jira_client=jira_client, issue_batcher=issue_batcher,
+                       search_batcher=search_batcher,
+                       issue_metadata_cache=_create_issue_metadata_cache(
+                           flask_config['ISSUE_METADATA_TTL_SECONDS'],
+                           flask_app.extensions['router'].projects(jira_url)))
+
+
+def _create_issue_metadata_cache(ttl_seconds, jira_projects):
+    """Returns a cache for the metadata of the projects of a server, or None if disabled."""
+    if ttl_seconds <= 0:
+        return None
+    return ttl_cache.TtlCache(len(jira_projects), ttl_seconds)
+
+
+def get_jira_client():
+    """Returns the Jira client of the current process, creating it if needed.
+
+    The client (and the connection pool of its HTTP session) is shared by
+    all request threads of a process. It is normally created right after
+    gunicorn forks the process (see init_worker_clients), and otherwise
+    on the first request.
+    """
+    jira_client = current_app.extensions.get('jira_client')
+    if jira_client is None:
+        with _jira_client_lock:
+            jira_client = current_app.extensions.get('jira_client')
+            if jira_client is None:
+                jira_client = _create_jira_client(current_app.config)
+                current_app.extensions['jira_client'] = jira_client
+    return jira_client
+
+
+def _jira_client_errors():
+    """Returns the exception classes raised by the Jira clients that may be in use."""
+    from utilities import jira_rest_client  # pylint: disable=import-outside-toplevel
+    if 'jira' not in sys.modules:
+        # no JIRAError can be raised before a jira library client is created
+        return (jira_rest_client.Error,)
+    import jira  # pylint: disable=import-outside-toplevel
+    return (jira_rest_client.Error, jira.JIRAError)
+
+
+def _create_jira_client(flask_config):
+    # imported here, since the OAuth1 signing of jira_auth imports oauthlib
+    # and cryptography
+    from utilities import jira_auth  # pylint: disable=import-outside-toplevel
+    auth = jira_auth.from_config(flask_config)
+    return _JIRA_CLIENT_FACTORIES[flask_config['JIRA_CLIENT']](flask_config, auth)
+
+
+def _create_jira_library_client(flask_config, auth):
+    # imported here, since the jira package takes a noticeable part of the
+    # cold start to import
+    import jira  # pylint: disable=import-outside-toplevel
+    return jira.JIRA(flask_config['JIRA_URL'], **auth.jira_arguments())
+
+
+def _create_jira_rest_client(flask_config, auth):
+    # imported here, since the slim client imports requests
+    from utilities import jira_rest_client  # pylint: disable=import-outside-toplevel
+    return jira_rest_client.JiraRestClient(flask_config['JIRA_URL'], auth=auth,
+                                           timeout_seconds=flask_config['HTTP_TIMEOUT_SECONDS'],
+                                           pool_size=flask_config['JIRA_REST_POOL_SIZE'],
+                                           max_retries=flask_config['JIRA_REST_MAX_RETRIES'])
+
+
+_JIRA_CLIENT_FACTORIES = {
+    'jira': _create_jira_library_client,
+    'rest': _create_jira_rest_client
+}
+
+
+def init_worker_clients(flask_app):
+    """Creates the third party clients of the current process.
+
+    Meant to be called in each worker process after it is forked (see
+    post_fork in gunicorn.conf.py), so that connection pools are never
+    shared between processes and the first request of a worker does not
+    pay for creating them.
+
+    Args:
+        flask_app: The Flask app whose clients to create.
+    """
+    flask_app.extensions.pop('jira_client', None)
+    # clients of other servers created before the fork are not inherited either
+    flask_app.extensions['jira_servers'] = routing.DestinationPool(
+        functools.partial(_create_jira_server, flask_app),
+        flask_app.config['JIRA_SERVER_POOL_SIZE'])
+    if flask_app.extensions['push_token_verifier'] is not None:
+        flask_app.extensions['push_token_verifier'].refresh_certs()
+    with flask_app.app_context():
+        jira_client = get_jira_client()
+        # fails the start of the worker if issues cannot be created as
+        # configured in the projects of the default server
+        if flask_app.extensions['issue_metadata_cache'] is not None:
+            for jira_project in sorted(_default_server_projects(flask_app)):
+                jira_notification_handler.load_issue_metadata(
+                    jira_client, jira_project, flask_app.extensions['issue_metadata_cache'])
+
+
+def _default_server_projects(flask_app):
+    """Returns the projects issues may be created in on the default Jira server."""
+    return flask_app.extensions['router'].projects() | {flask_app.config['JIRA_PROJECT']}
+
+
+def _create_issues_in_bulk(flask_app, field_list):
+    """Creates a batch of issues with the Jira client of the current process."""
+    with flask_app.app_context():
+        return jira_notification_handler.create_issues_in_bulk(get_jira_client(), field_list)
+
+
+def _search_open_issues_in_bulk(flask_app, incident_id_labels):
+    """Searches for the issues of a batch of incidents with the process's Jira client."""
+    with flask_app.app_context():
+        return jira_notification_handler.search_open_issues_in_bulk(
+            get_jira_client(), current_app.config['CLOSED_JIRA_ISSUE_STATUS'],
+            incident_id_labels)
+
+
+def _flush_digest_at_shutdown(flask_app, remaining_seconds):
+    """Reports the notifications collected in the digest before the worker exits."""
+    logger.info('Flushing the digest with %.1f seconds left', remaining_seconds)
+    with flask_app.app_context():
+        jira_notification_handler.flush_digest(_digest_destination(),
+                                               current_app.extensions['digest'], force=True)
+
+
+def create_app(settings):
+    """Creates the Flask app.
+
+    All secrets are resolved here, when the config object is copied into
+    the Flask config. When gunicorn preloads the app (see gunicorn.conf.py),
+    this happens once in the master process and the resolved config is
+    inherited by every forked worker. No third party clients are created
+    here, since their connections must not be shared across a fork.
+
+    Args:
+        settings: The config object to use (e.g. the result of config.load()).
+
+    Returns:
+        The Flask app.
+    """
+    flask_app = Flask(__name__)
+    flask_app.config.from_object(settings)
+    flask_app.extensions['graceful_shutdown'] = graceful_shutdown.GracefulShutdown(
+        settings.SHUTDOWN_GRACE_PERIOD_SECONDS)
+    flask_app.extensions['admission_control'] = admission_control.AdmissionController(
+        settings.ADMISSION_MAX_IN_FLIGHT, settings.ADMISSION_TARGET_LATENCY_SECONDS)
+    # concurrent deliveries of the same incident (e.g. its open and close)
+    # are serialized, so they reach Jira in the order they were received
+    flask_app.extensions['incident_locks'] = keyed_locks.KeyedLocks()
+    flask_app.extensions['pending_closes'] = ttl_cache.TtlCache(
+        settings.PENDING_CLOSE_MAX_INCIDENTS, settings.PENDING_CLOSE_TTL_SECONDS)
+    flask_app.extensions['flap_suppressor'] = flap_suppression.FlapSuppressor(
+        settings.FLAP_SUPPRESSION_WINDOW_SECONDS,
+        settings.FLAP_SUPPRESSION_POLICY_WINDOW_SECONDS,
+        settings.FLAP_SUPPRESSION_MAX_INCIDENTS,
+        settings.REOPENED_JIRA_ISSUE_STATUS)
+    flask_app.extensions['issue_templates'] = issue_templates.IssueTemplates(
+        settings.ISSUE_SUMMARY_TEMPLATE, settings.ISSUE_DESCRIPTION_TEMPLATE,
+        settings.ISSUE_POLICY_TEMPLATES,
+        max_summary_length=settings.ISSUE_SUMMARY_MAX_LENGTH,
+        max_description_length=settings.ISSUE_DESCRIPTION_MAX_LENGTH)
+    flask_app.extensions['router'] = routing.Router(settings.JIRA_ROUTES)
+    # the clients of the other Jira servers routed to, see init_worker_clients
+    flask_app.extensions['jira_servers'] = routing.DestinationPool(
+        functools.partial(_create_jira_server, flask_app),
+        settings.JIRA_SERVER_POOL_SIZE)
+    flask_app.extensions['issue_metadata_cache'] = _create_issue_metadata_cache(
+        settings.ISSUE_METADATA_TTL_SECONDS, _default_server_projects(flask_app))
+    flask_app.extensions['issue_batcher'] = None
+    if settings.BULK_CREATE_MAX_BATCH_SIZE > 1:
+        flask_app.extensions['issue_batcher'] = micro_batch.MicroBatcher(
+            functools.partial(_create_issues_in_bulk, flask_app),
+            settings.BULK_CREATE_MAX_BATCH_SIZE, settings.BULK_CREATE_MAX_DELAY_SECONDS)
+    flask_app.extensions['search_batcher'] = None
+    if settings.CLOSE_SEARCH_MAX_BATCH_SIZE > 1:
+        flask_app.extensions['search_batcher'] = micro_batch.MicroBatcher(
+            functools.partial(_search_open_issues_in_bulk, flask_app),
+            settings.CLOSE_SEARCH_MAX_BATCH_SIZE, settings.CLOSE_SEARCH_MAX_DELAY_SECONDS)
+    # notifications of low priority policies are reported together in digests
+    flask_app.extensions['digest'] = None
+    if settings.DIGEST_POLICIES:
+        flask_app.extensions['digest'] = digest.Digest(
+            settings.DIGEST_POLICIES, settings.DIGEST_INTERVAL_SECONDS,
+            settings.DIGEST_MAX_INCIDENTS, settings.DIGEST_SPOOL_DIRECTORY)
+        flask_app.extensions['graceful_shutdown'].add_flush_callback(
+            functools.partial(_flush_digest_at_shutdown, flask_app))
+    flask_app.extensions['push_token_verifier'] = push_auth.from_config(flask_app.config)
+    # the options of the handler shared by all deliveries; those bound to the
+    # Jira server a notification is routed to are filled in for each delivery
+    flask_app.extensions['handler_options'] = jira_notification_handler.HandlerOptions(
+        incident_locks=flask_app.extensions['incident_locks'],
+        pending_closes=flask_app.extensions['pending_closes'],
+        flap_suppressor=flask_app.extensions['flap_suppressor'],
+        digest=flask_app.extensions['digest'],
+        issue_templates=flask_app.extensions['issue_templates'])
+    flask_app.add_url_rule('/', view_func=handle_pubsub_message, methods=['POST'])
+    return flask_app
+
+
+app = create_app(app_config)
+
+
 if __name__ == '__main__':
     PORT = int(os.getenv('PORT')) if os.getenv('PORT') else 8080
 
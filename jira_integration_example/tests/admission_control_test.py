@@ -0,0 +1,94 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for AdmissionController in admission_control.py."""
+
+import pytest
+
+from utilities import admission_control
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _deliver(controller, clock, latency_seconds):
+    with controller.admit():
+        clock.now += latency_seconds
+
+
+def test_delivery_is_counted_while_in_flight():
+    controller = admission_control.AdmissionController(
+        max_in_flight=2, target_latency_seconds=1)
+
+    with controller.admit():
+        assert controller.in_flight == 1
+
+    assert controller.in_flight == 0
+
+
+def test_delivery_is_refused_over_the_limit():
+    controller = admission_control.AdmissionController(
+        max_in_flight=2, target_latency_seconds=1)
+
+    with controller.admit(), controller.admit():
+        with pytest.raises(admission_control.OverloadedError):
+            with controller.admit():
+                pass
+        assert controller.in_flight == 2
+
+    assert controller.in_flight == 0
+
+
+def test_delivery_is_counted_as_completed_on_error():
+    controller = admission_control.AdmissionController(
+        max_in_flight=1, target_latency_seconds=1)
+
+    with pytest.raises(ValueError):
+        with controller.admit():
+            raise ValueError('third party error')
+
+    assert controller.in_flight == 0
+    with controller.admit():
+        pass
+
+
+def test_limit_decreases_while_deliveries_are_slow():
+    clock = _FakeClock()
+    controller = admission_control.AdmissionController(
+        max_in_flight=8, target_latency_seconds=1, min_in_flight=2, clock=clock)
+
+    for _ in range(100):
+        _deliver(controller, clock, latency_seconds=3)
+
+    assert controller.limit == 2
+    assert controller.average_latency_seconds == pytest.approx(3)
+
+
+def test_limit_recovers_once_deliveries_are_fast():
+    clock = _FakeClock()
+    controller = admission_control.AdmissionController(
+        max_in_flight=8, target_latency_seconds=1, clock=clock)
+
+    for _ in range(100):
+        _deliver(controller, clock, latency_seconds=3)
+    assert controller.limit == 1
+
+    for _ in range(100):
+        _deliver(controller, clock, latency_seconds=0.1)
+    assert controller.limit == 8
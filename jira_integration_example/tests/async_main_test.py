@@ -0,0 +1,218 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the asyncio serving mode in async_main.py."""
+
+import asyncio
+import base64
+import json
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import async_main
+import config
+from utilities import (admission_control, jira_async_client, monitoring_notification,
+                       push_auth)
+
+
+@pytest.fixture
+def app():
+    return async_main.create_app(config.TestJiraConfig())
+
+
+@pytest.fixture
+def post(app):
+    def post_to_app(**kwargs):
+        async def send():
+            async with TestClient(TestServer(app)) as client:
+                response = await client.post('/', **kwargs)
+                return response.status, await response.read()
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(send())
+        finally:
+            loop.close()
+
+    return post_to_app
+
+
+def test_empty_payload(post):
+    status, data = post(json='')
+
+    assert status == 400
+    assert b'invalid Pub/Sub message format' in data
+
+
+def test_invalid_payload(post):
+    status, data = post(json={'nomessage': 'invalid'})
+
+    assert status == 400
+    assert b'invalid Pub/Sub message format' in data
+
+
+def test_non_json_payload(post):
+    status, data = post(data='{"message": {}}')
+
+    assert status == 400
+    assert b'invalid Pub/Sub message format' in data
+
+
+def test_nonstring_notification_message(post):
+    status, data = post(json={'message': {'data': True}})
+
+    assert status == 400
+    assert b'data should be in a string format' in data
+
+
+def test_payload_without_push_token(app, post):
+    app['push_token_verifier'] = push_auth.PushTokenVerifier(
+        'https://notifications.example.com/', 'push@project.iam.gserviceaccount.com',
+        certs=push_auth.GoogleCerts(fetch_certs=dict))
+    status, data = post(json={'message': {'data': ''}}, headers={'Authorization': 'Basic a'})
+
+    assert status == 401
+    assert b'Push request is missing a bearer token' in data
+
+
+def test_oversized_payload(app, post):
+    app['config']['MAX_REQUEST_BYTES'] = 100
+    status, data = post(json={'message': {'data': 'a' * 100}})
+
+    assert status == 413
+    assert b'Pub/Sub push request is over 100 bytes' in data
+
+
+def test_invalid_notification_message(post):
+    data = base64.b64encode(b'invalid message').decode()
+
+    status, response_data = post(json={'message': {'data': data}})
+
+    assert status == 400
+    assert b'Notification could not be decoded' in response_data
+
+
+def test_incident_alert_message_with_invalid_state(post):
+    message = ('{"incident": {"state": "invalid_state", "condition_name": "test_condition",'
+               '"resource_name": "test_resource", "summary": "test_summary",'
+               '"url": "http://test-cloud.com", "incident_id": "0.abcdef123456"}}')
+    data = base64.b64encode(message.encode()).decode()
+
+    status, response_data = post(json={'message': {'data': data}})
+
+    assert status == 400
+    assert response_data == b'Incident state must be "open" or "closed"'
+
+
+def test_incident_alert_message(post, app, mocker):
+    message = ('{"incident": {"state": "open", "condition_name": "test_condition",'
+               '"resource_name": "test_resource", "summary": "test_summary",'
+               '"url": "http://test-cloud.com", "incident_id": "0.abcdef123456"}}')
+    data = base64.b64encode(message.encode()).decode()
+    calls = []
+
+    async def update_jira(*args, **kwargs):
+        calls.append((args, kwargs))
+
+    mocker.patch('async_main.jira_notification_handler.'
+                 'update_jira_based_on_monitoring_notification_async', new=update_jira)
+
+    status, _ = post(json={'message': {'data': data}})
+
+    assert status == 200
+    assert len(calls) == 1
+    (jira_client, jira_project, jira_status, notification, options), _ = calls[0]
+    assert isinstance(jira_client, jira_async_client.AsyncJiraClient)
+    assert jira_project == app['config']['JIRA_PROJECT']
+    assert jira_status == app['config']['CLOSED_JIRA_ISSUE_STATUS']
+    assert notification == monitoring_notification.parse(json.loads(message))
+    assert options == app['handler_options']._replace(
+        issue_batcher=app['issue_batcher'], search_batcher=app['search_batcher'],
+        issue_metadata_cache=app['issue_metadata_cache'])
+
+
+def test_incident_alert_message_with_jira_error(post, mocker):
+    message = ('{"incident": {"state": "open", "condition_name": "test_condition",'
+               '"resource_name": "test_resource", "summary": "test_summary",'
+               '"url": "http://test-cloud.com", "incident_id": "0.abcdef123456"}}')
+    data = base64.b64encode(message.encode()).decode()
+
+    async def update_jira(*args, **kwargs):
+        raise jira_async_client.JiraRequestError('jira error')
+
+    mocker.patch('async_main.jira_notification_handler.'
+                 'update_jira_based_on_monitoring_notification_async', new=update_jira)
+
+    status, response_data = post(json={'message': {'data': data}})
+
+    assert status == 400
+    assert response_data == b'jira error'
+
+
+def test_incident_alert_message_while_overloaded(app, post, mocker):
+    message = ('{"incident": {"state": "open", "condition_name": "test_condition",'
+               '"resource_name": "test_resource", "summary": "test_summary",'
+               '"url": "http://test-cloud.com", "incident_id": "0.abcdef123456"}}')
+    data = base64.b64encode(message.encode()).decode()
+    calls = []
+
+    async def update_jira(*args, **kwargs):
+        calls.append((args, kwargs))
+
+    mocker.patch('async_main.jira_notification_handler.'
+                 'update_jira_based_on_monitoring_notification_async', new=update_jira)
+    app['admission_control'] = admission_control.AdmissionController(
+        max_in_flight=1, target_latency_seconds=5)
+
+    with app['admission_control'].admit():
+        status, response_data = post(json={'message': {'data': data}})
+
+    assert status == 429
+    assert b'Service is overloaded' in response_data
+    assert not calls
+
+
+def test_incident_alert_message_routed_to_project(mocker):
+    class RoutedJiraConfig(config.TestJiraConfig):
+        JIRA_ROUTES = [{'policy_names': ['disk policy'], 'project': 'STOR'}]
+
+    message = ('{"incident": {"state": "open", "policy_name": "disk policy",'
+               '"condition_name": "test_condition", "resource_name": "test_resource",'
+               '"summary": "test_summary", "url": "http://test-cloud.com",'
+               '"incident_id": "0.abcdef123456"}}')
+    data = base64.b64encode(message.encode()).decode()
+    calls = []
+
+    async def update_jira(*args, **kwargs):
+        calls.append((args, kwargs))
+
+    mocker.patch('async_main.jira_notification_handler.'
+                 'update_jira_based_on_monitoring_notification_async', new=update_jira)
+    app = async_main.create_app(RoutedJiraConfig())
+
+    async def send():
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post('/', json={'message': {'data': data}})
+            return response.status
+
+    loop = asyncio.new_event_loop()
+    try:
+        status = loop.run_until_complete(send())
+    finally:
+        loop.close()
+
+    assert status == 200
+    (_, jira_project, _, _, _), _ = calls[0]
+    assert jira_project == 'STOR'
@@ -0,0 +1,37 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs the Jira scenario of scripts/benchmark.py, so changes that break it are caught."""
+
+import json
+import os
+import subprocess
+import sys
+
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_jira_benchmark_runs(tmp_path):
+    output_path = tmp_path / 'results.json'
+
+    subprocess.run([sys.executable, os.path.join(_REPO_ROOT, 'scripts', 'benchmark.py'), 'jira',
+                    '--iterations', '2', '--warmup', '0', '--concurrency', '2',
+                    '--output', str(output_path)],
+                   check=True, stdout=subprocess.DEVNULL)
+
+    with open(output_path) as output_file:
+        results = json.load(output_file)['results']
+    assert {'open_notification_handler', 'closed_notification_handler',
+            'flask_request'} <= {result['name'] for result in results}
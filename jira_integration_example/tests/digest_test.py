@@ -0,0 +1,130 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for Digest in digest.py."""
+
+import multiprocessing
+import os
+
+import pytest
+
+from utilities import digest
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _make_digest(spool_directory, clock=None):
+    return digest.Digest(policy_names=['low priority'], interval_seconds=60, max_entries=3,
+                         spool_directory=str(spool_directory), clock=clock or _FakeClock())
+
+
+def test_accepts_configured_policies():
+    incident_digest = digest.Digest(policy_names=['low priority'], interval_seconds=60,
+                                    max_entries=3, spool_directory='unused')
+
+    assert incident_digest.accepts('low priority')
+    assert not incident_digest.accepts('high priority')
+    assert not incident_digest.accepts(None)
+
+
+def test_entries_are_due_after_max_entries(tmp_path):
+    incident_digest = _make_digest(tmp_path)
+
+    incident_digest.add({'incident_id': '1'})
+    incident_digest.add({'incident_id': '2'})
+    assert incident_digest.take_due() is None
+
+    incident_digest.add({'incident_id': '3'})
+    assert incident_digest.take_due() == [{'incident_id': '1'}, {'incident_id': '2'},
+                                          {'incident_id': '3'}]
+
+
+def test_entries_are_due_after_interval(tmp_path):
+    clock = _FakeClock()
+    incident_digest = _make_digest(tmp_path, clock)
+    incident_digest.add({'incident_id': '1'})
+
+    clock.now = 59
+    assert incident_digest.take_due() is None
+    assert incident_digest.take_due(force=True) == [{'incident_id': '1'}]
+
+
+def test_entries_survive_a_restart_until_committed(tmp_path):
+    incident_digest = _make_digest(tmp_path)
+    incident_digest.add({'incident_id': '1'})
+    incident_digest.add({'incident_id': '2'})
+    assert incident_digest.take_due(force=True)
+    incident_digest.add({'incident_id': '3'})
+
+    # a process that restarts before the digest is reported finds all entries
+    restarted_digest = _make_digest(tmp_path)
+    _release_spool(incident_digest)
+    assert restarted_digest.take_due(force=True) == [{'incident_id': '1'},
+                                                     {'incident_id': '2'},
+                                                     {'incident_id': '3'}]
+
+    restarted_digest.commit()
+    _release_spool(restarted_digest)
+    assert _make_digest(tmp_path).size == 0
+
+
+def test_restore_keeps_entries_in_order(tmp_path):
+    incident_digest = _make_digest(tmp_path)
+    incident_digest.add({'incident_id': '1'})
+    incident_digest.take_due(force=True)
+    incident_digest.add({'incident_id': '2'})
+
+    incident_digest.restore()
+
+    assert incident_digest.take_due(force=True) == [{'incident_id': '1'},
+                                                    {'incident_id': '2'}]
+
+
+def test_add_fails_when_full(tmp_path):
+    incident_digest = _make_digest(tmp_path)
+    for incident_id in range(6):
+        incident_digest.add({'incident_id': str(incident_id)})
+
+    with pytest.raises(digest.DigestFullError):
+        incident_digest.add({'incident_id': '6'})
+
+
+def _spool_path_in_child(spool_directory, paths):
+    incident_digest = _make_digest(spool_directory)
+    incident_digest.add({'incident_id': 'child'})
+    paths.put(incident_digest._spool.path)  # pylint: disable=protected-access
+
+
+def test_processes_use_separate_spool_files(tmp_path):
+    incident_digest = _make_digest(tmp_path)
+    incident_digest.add({'incident_id': 'parent'})
+
+    paths = multiprocessing.Queue()
+    child = multiprocessing.Process(target=_spool_path_in_child, args=(str(tmp_path), paths))
+    child.start()
+    child_spool_path = paths.get(timeout=10)
+    child.join()
+
+    assert child_spool_path != incident_digest._spool.path  # pylint: disable=protected-access
+
+
+def _release_spool(incident_digest):
+    # simulates the exit of the process holding the spool
+    os.close(incident_digest._spool._lock_fd)  # pylint: disable=protected-access
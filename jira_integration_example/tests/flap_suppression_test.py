@@ -0,0 +1,75 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for FlapSuppressor in flap_suppression.py."""
+
+import collections
+
+from utilities import flap_suppression
+
+
+_Incident = collections.namedtuple(
+    '_Incident', ['incident_id', 'policy_name', 'condition_name', 'resource_name'])
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _make_suppressor(clock):
+    return flap_suppression.FlapSuppressor(
+        default_window_seconds=60, policy_window_seconds={'noisy': 600, 'quiet': 0},
+        max_incidents=10, reopen_status='To Do', clock=clock)
+
+
+def test_recent_issue_is_reused_within_window():
+    clock = _FakeClock()
+    suppressor = _make_suppressor(clock)
+    suppressor.record_close(_Incident('0.a', 'noisy', 'cpu', 'vm-1'), 'TEST-1')
+
+    clock.now = 500
+    assert suppressor.pop_recent_issue(_Incident('0.b', 'noisy', 'cpu', 'vm-1')) == 'TEST-1'
+    assert suppressor.pop_recent_issue(_Incident('0.c', 'noisy', 'cpu', 'vm-1')) is None
+
+
+def test_recent_issue_is_not_reused_after_window():
+    clock = _FakeClock()
+    suppressor = _make_suppressor(clock)
+    suppressor.record_close(_Incident('0.a', 'other', 'cpu', 'vm-1'), 'TEST-1')
+
+    clock.now = 60
+    assert suppressor.pop_recent_issue(_Incident('0.b', 'other', 'cpu', 'vm-1')) is None
+
+
+def test_recent_issue_is_only_reused_for_same_condition_and_resource():
+    clock = _FakeClock()
+    suppressor = _make_suppressor(clock)
+    suppressor.record_close(_Incident('0.a', 'noisy', 'cpu', 'vm-1'), 'TEST-1')
+
+    assert suppressor.pop_recent_issue(_Incident('0.b', 'noisy', 'cpu', 'vm-2')) is None
+    assert suppressor.pop_recent_issue(_Incident('0.b', 'noisy', 'memory', 'vm-1')) is None
+
+
+def test_suppression_is_disabled_for_policies_without_window():
+    clock = _FakeClock()
+    suppressor = _make_suppressor(clock)
+    suppressor.record_close(_Incident('0.a', 'quiet', 'cpu', 'vm-1'), 'TEST-1')
+    suppressor.record_close(_Incident('0.a', None, 'cpu', 'vm-1'), 'TEST-2')
+
+    assert suppressor.pop_recent_issue(_Incident('0.b', 'quiet', 'cpu', 'vm-1')) is None
+    assert suppressor.pop_recent_issue(_Incident('0.b', None, 'cpu', 'vm-1')) is None
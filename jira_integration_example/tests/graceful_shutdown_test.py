@@ -0,0 +1,103 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for GracefulShutdown in graceful_shutdown.py."""
+
+import threading
+import time
+
+import pytest
+
+from utilities import graceful_shutdown
+
+
+def test_delivery_is_counted_while_in_flight():
+    shutdown = graceful_shutdown.GracefulShutdown(grace_period_seconds=1)
+
+    with shutdown.delivery():
+        assert shutdown.in_flight == 1
+
+    assert shutdown.in_flight == 0
+
+
+def test_delivery_is_refused_after_shutdown_began():
+    shutdown = graceful_shutdown.GracefulShutdown(grace_period_seconds=1)
+    shutdown.begin()
+
+    with pytest.raises(graceful_shutdown.ShuttingDownError):
+        with shutdown.delivery():
+            pass
+
+    assert shutdown.shutting_down
+    assert shutdown.in_flight == 0
+
+
+def test_wait_and_flush_waits_for_in_flight_deliveries():
+    shutdown = graceful_shutdown.GracefulShutdown(grace_period_seconds=5)
+    delivery_started = threading.Event()
+    events = []
+
+    def deliver():
+        with shutdown.delivery():
+            delivery_started.set()
+            time.sleep(0.1)
+            events.append('delivered')
+
+    shutdown.add_flush_callback(lambda remaining_seconds: events.append('flushed'))
+    thread = threading.Thread(target=deliver)
+    thread.start()
+    delivery_started.wait()
+
+    abandoned = shutdown.wait_and_flush()
+    thread.join()
+
+    assert abandoned == 0
+    assert events == ['delivered', 'flushed']
+
+
+def test_wait_and_flush_gives_up_after_grace_period():
+    shutdown = graceful_shutdown.GracefulShutdown(grace_period_seconds=0.05)
+    release = threading.Event()
+    delivery_started = threading.Event()
+
+    def deliver():
+        with shutdown.delivery():
+            delivery_started.set()
+            release.wait()
+
+    thread = threading.Thread(target=deliver)
+    thread.start()
+    delivery_started.wait()
+
+    abandoned = shutdown.wait_and_flush()
+    release.set()
+    thread.join()
+
+    assert abandoned == 1
+
+
+def test_failing_flush_callback_does_not_stop_other_callbacks():
+    shutdown = graceful_shutdown.GracefulShutdown(grace_period_seconds=1)
+    flushed = []
+
+    def failing_callback(remaining_seconds):
+        raise RuntimeError('flush failed')
+
+    shutdown.add_flush_callback(failing_callback)
+    shutdown.add_flush_callback(flushed.append)
+
+    shutdown.wait_and_flush()
+
+    assert len(flushed) == 1
+    assert 0 <= flushed[0] <= 1
@@ -0,0 +1,96 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for IssueTemplates in issue_templates.py."""
+
+import pytest
+
+from utilities import issue_templates
+
+
+_INCIDENT = {'incident_id': '0.abcdef123456', 'policy_name': 'disk policy',
+             'condition_name': 'disk full', 'resource_name': 'vm-1',
+             'summary': 'The disk is full.', 'url': 'http://test.com', 'severity': 'Critical',
+             'documentation': {'content': 'Delete old logs.', 'mime_type': 'text/markdown'},
+             'policy_user_labels': {'team': 'storage', 'tags': ['disk', 'vm']}}
+
+
+def test_render_default_templates():
+    templates = issue_templates.IssueTemplates('{condition_name} - {resource_name}',
+                                               '{summary}\nSee: {url}')
+
+    assert templates.render('disk policy', _INCIDENT) == (
+        'disk full - vm-1', 'The disk is full.\nSee: http://test.com')
+
+
+def test_render_policy_templates():
+    templates = issue_templates.IssueTemplates(
+        '{condition_name}', '{summary}',
+        policy_templates={'disk policy': {
+            'summary': '[{severity}] {condition_name} ({policy_user_labels.team})',
+            'description': '{documentation.content}\nTags: {policy_user_labels.tags}'}})
+
+    assert templates.render('disk policy', _INCIDENT) == (
+        '[Critical] disk full (storage)', 'Delete old logs.\nTags: disk, vm')
+    assert templates.render('other policy', _INCIDENT) == ('disk full', 'The disk is full.')
+
+
+def test_render_policy_template_falls_back_to_default():
+    templates = issue_templates.IssueTemplates(
+        '{condition_name}', '{summary}',
+        policy_templates={'disk policy': {'summary': '{resource_name}'}})
+
+    assert templates.render('disk policy', _INCIDENT) == ('vm-1', 'The disk is full.')
+
+
+def test_render_missing_fields():
+    templates = issue_templates.IssueTemplates('{severity}|{documentation.content}|'
+                                               '{summary.content}|{{literal}}', '')
+
+    assert templates.render(None, {'summary': 'text'})[0] == '|||{literal}'
+
+
+@pytest.mark.parametrize('template', ['{', '{0}', '{}', '{summary!r}', '{summary:>10}'])
+def test_invalid_template(template):
+    with pytest.raises(issue_templates.TemplateError):
+        issue_templates.IssueTemplates(template, '')
+
+
+def test_unknown_policy_template():
+    with pytest.raises(issue_templates.TemplateError):
+        issue_templates.IssueTemplates('', '', policy_templates={'a': {'title': ''}})
+
+
+def test_render_truncates_at_word_boundary():
+    templates = issue_templates.IssueTemplates('{condition_name}', '{summary}\nSee: {url}',
+                                               max_summary_length=30,
+                                               max_description_length=40)
+
+    summary, description = templates.render('policy', {
+        'condition_name': 'disk usage over ninety percent', 'summary': 'word ' * 1000,
+        'url': 'https://console.cloud.google.com/monitoring'})
+
+    assert summary == 'disk usage over ninety percent'
+    assert description == 'word word word word word' + issue_templates.TRUNCATION_MARKER
+    assert len(description) <= 40
+
+
+@pytest.mark.parametrize('text, max_length, expected', [
+    ('short', 10, 'short'),
+    ('short', None, 'short'),
+    ('abcdefghijklmnopqrstuvwxyz', 20, 'abcde' + issue_templates.TRUNCATION_MARKER),
+    ('a b' * 10, 5, 'a ba '),
+])
+def test_truncate(text, max_length, expected):
+    assert issue_templates.truncate(text, max_length) == expected
@@ -0,0 +1,288 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the AsyncJiraClient in jira_async_client.py."""
+
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import aiohttp
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from utilities import jira_async_client, jira_auth
+
+
+@pytest.fixture(scope='module')
+def oauth_dict():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    key_cert = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption()).decode()
+    return {'access_token': 'test-access-token',
+            'access_token_secret': 'test-access-token-secret',
+            'consumer_key': 'test-consumer-key',
+            'key_cert': key_cert}
+
+
+@pytest.fixture
+def jira_server():
+    """Returns a fake Jira server app and the list of requests it received."""
+    received = []
+
+    async def create_issue(request):
+        received.append(('POST', request.path, await request.json(),
+                         request.headers.get('Authorization')))
+        return web.json_response({'id': '10000', 'key': 'TEST-1'}, status=201)
+
+    async def search(request):
+        received.append(('GET', request.path, dict(request.query), None))
+        issues = [{'key': 'TEST-1', 'fields': {'labels': ['a']}},
+                  {'key': 'TEST-2', 'fields': {'labels': ['b']}},
+                  {'key': 'TEST-3', 'fields': {'labels': ['c']}}]
+        start_at = int(request.query.get('startAt', 0))
+        max_results = min(int(request.query['maxResults']), 2)
+        return web.json_response({'startAt': start_at, 'total': len(issues),
+                                  'issues': issues[start_at:start_at + max_results]})
+
+    async def get_transitions(_request):
+        return web.json_response({'transitions': [{'id': '11', 'name': 'In Progress'},
+                                                  {'id': '31', 'name': 'Done'}]})
+
+    async def transition(request):
+        received.append(('POST', request.path, await request.json(), None))
+        return web.Response(status=204)
+
+    async def add_comment(request):
+        received.append(('POST', request.path, await request.json(), None))
+        return web.json_response({'id': '10100'}, status=201)
+
+    async def update_issue(request):
+        received.append(('PUT', request.path, await request.json(), None))
+        return web.Response(status=204)
+
+    async def create_issues(request):
+        issue_updates = (await request.json())['issueUpdates']
+        received.append(('POST', request.path, issue_updates, None))
+        return web.json_response(
+            {'issues': [{'id': '10001', 'key': 'TEST-2'}],
+             'errors': [{'status': 400, 'failedElementNumber': 0,
+                         'elementErrors': {'errors': {'summary': 'required'}}}]},
+            status=201)
+
+    async def createmeta(request):
+        received.append(('GET', request.path, dict(request.query), None))
+        return web.json_response({'projects': [{'id': '10000', 'key': 'TEST', 'issuetypes': [
+            {'id': '10004', 'name': 'Bug'}]}]})
+
+    async def forbidden(_request):
+        return web.Response(status=403, text='forbidden')
+
+    async def slow_search(_request):
+        await asyncio.sleep(5)
+        return web.json_response({'startAt': 0, 'total': 0, 'issues': []})
+
+    async def invalid_create_issues(_request):
+        return web.json_response({'errorMessages': ['invalid request'], 'errors': {}},
+                                 status=400)
+
+    server_app = web.Application()
+    server_app.router.add_post('/rest/api/2/issue', create_issue)
+    server_app.router.add_post('/rest/api/2/issue/bulk', create_issues)
+    server_app.router.add_get('/rest/api/2/search', search)
+    server_app.router.add_get('/rest/api/2/issue/createmeta', createmeta)
+    server_app.router.add_get('/rest/api/2/issue/{key}/transitions', get_transitions)
+    server_app.router.add_post('/rest/api/2/issue/{key}/transitions', transition)
+    server_app.router.add_post('/rest/api/2/issue/{key}/comment', add_comment)
+    server_app.router.add_put('/rest/api/2/issue/{key}', update_issue)
+    server_app.router.add_get('/forbidden/rest/api/2/search', forbidden)
+    server_app.router.add_post('/invalid/rest/api/2/issue/bulk', invalid_create_issues)
+    server_app.router.add_get('/slow/rest/api/2/search', slow_search)
+    return server_app, received
+
+
+@pytest.fixture
+def run_with_client(jira_server, oauth_dict):
+    server_app, _ = jira_server
+
+    def run(test_coroutine, path='', timeout_seconds=None):
+        async def run_test():
+            async with TestServer(server_app) as server:
+                async with aiohttp.ClientSession(
+                        timeout=aiohttp.ClientTimeout(total=timeout_seconds)) as session:
+                    client = jira_async_client.AsyncJiraClient(
+                        str(server.make_url(path)), session,
+                        jira_auth.OAuth1Auth(oauth_dict))
+                    return await test_coroutine(client)
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(run_test())
+        finally:
+            loop.close()
+
+    return run
+
+
+def test_create_issue(jira_server, run_with_client):
+    _, received = jira_server
+
+    async def create(client):
+        return await client.create_issue(project='TEST', summary='test summary',
+                                         issuetype={'name': 'Bug'})
+
+    assert run_with_client(create) == 'TEST-1'
+
+    method, path, body, authorization = received[0]
+    assert (method, path) == ('POST', '/rest/api/2/issue')
+    assert body == {'fields': {'project': {'key': 'TEST'}, 'summary': 'test summary',
+                               'issuetype': {'name': 'Bug'}}}
+    assert 'oauth_signature_method="RSA-SHA1"' in authorization
+
+
+def test_search_issues(jira_server, run_with_client):
+    _, received = jira_server
+
+    async def search(client):
+        return await client.search_issues('labels = test_label', max_results=2)
+
+    assert run_with_client(search) == ['TEST-1', 'TEST-2']
+    assert received[0][2]['jql'] == 'labels = test_label'
+
+
+def test_transition_issue(jira_server, run_with_client):
+    _, received = jira_server
+
+    async def transition(client):
+        await client.transition_issue('TEST-1', 'done')
+
+    run_with_client(transition)
+
+    assert received == [('POST', '/rest/api/2/issue/TEST-1/transitions',
+                         {'transition': {'id': '31'}}, None)]
+
+
+def test_transition_issue_with_unknown_transition(run_with_client):
+    async def transition(client):
+        await client.transition_issue('TEST-1', 'Closed')
+
+    with pytest.raises(jira_async_client.JiraRequestError) as e:
+        run_with_client(transition)
+
+    assert str(e.value) == 'Invalid transition name Closed for issue TEST-1'
+
+
+def test_request_with_error_status(run_with_client):
+    async def search(client):
+        await client.search_issues('labels = test_label')
+
+    with pytest.raises(jira_async_client.JiraRequestError) as e:
+        run_with_client(search, path='/forbidden')
+
+    assert 'failed with status 403: forbidden' in str(e.value)
+
+
+def test_request_with_timeout(run_with_client):
+    async def search(client):
+        await client.search_issues('labels = test_label')
+
+    with pytest.raises(jira_async_client.JiraRequestError) as e:
+        run_with_client(search, path='/slow', timeout_seconds=0.1)
+
+    assert 'failed' in str(e.value)
+
+
+def test_request_with_connection_error(oauth_dict):
+    async def search():
+        async with aiohttp.ClientSession() as session:
+            client = jira_async_client.AsyncJiraClient('http://127.0.0.1:1', session,
+                                                       jira_auth.OAuth1Auth(oauth_dict))
+            await client.search_issues('labels = test_label')
+
+    loop = asyncio.new_event_loop()
+    try:
+        with pytest.raises(jira_async_client.JiraRequestError):
+            loop.run_until_complete(search())
+    finally:
+        loop.close()
+
+
+def test_add_comment_and_label(jira_server, run_with_client):
+    _, received = jira_server
+
+    async def comment_and_label(client):
+        await client.add_comment('TEST-1', 'test comment')
+        await client.add_label('TEST-1', 'test_label')
+
+    run_with_client(comment_and_label)
+
+    assert received == [
+        ('POST', '/rest/api/2/issue/TEST-1/comment', {'body': 'test comment'}, None),
+        ('PUT', '/rest/api/2/issue/TEST-1', {'update': {'labels': [{'add': 'test_label'}]}},
+         None)]
+
+
+def test_create_issues(jira_server, run_with_client):
+    _, received = jira_server
+
+    async def create(client):
+        return await client.create_issues([{'project': 'TEST'},
+                                           {'project': 'TEST', 'summary': 'test summary'}])
+
+    results = run_with_client(create)
+
+    assert [(result['status'], result['issue']) for result in results] == [
+        ('Error', None), ('Success', 'TEST-2')]
+    assert results[0]['error'] == {'errors': {'summary': 'required'}}
+    assert received[0][2] == [{'fields': {'project': {'key': 'TEST'}}},
+                              {'fields': {'project': {'key': 'TEST'},
+                                          'summary': 'test summary'}}]
+
+
+def test_create_issues_with_generic_error(run_with_client):
+    async def create(client):
+        return await client.create_issues([{'project': 'TEST'}])
+
+    with pytest.raises(jira_async_client.JiraRequestError) as e:
+        run_with_client(create, path='/invalid')
+
+    assert 'invalid request' in str(e.value)
+
+
+def test_search_all_issues(jira_server, run_with_client):
+    _, received = jira_server
+
+    async def search(client):
+        return await client.search_issues('labels in (a, b, c)', max_results=False,
+                                          fields='labels', json_result=True)
+
+    issues = run_with_client(search)
+
+    assert [issue['key'] for issue in issues] == ['TEST-1', 'TEST-2', 'TEST-3']
+    assert [query['startAt'] for _, _, query, _ in received] == ['0', '2']
+    assert received[0][2]['fields'] == 'labels'
+
+
+def test_createmeta(jira_server, run_with_client):
+    _, received = jira_server
+
+    async def createmeta(client):
+        return await client.createmeta(projectKeys='TEST', issuetypeNames='Bug',
+                                       expand='projects.issuetypes.fields')
+
+    assert run_with_client(createmeta)['projects'][0]['id'] == '10000'
+    assert received[0][2] == {'projectKeys': 'TEST', 'issuetypeNames': 'Bug',
+                              'expand': 'projects.issuetypes.fields'}
@@ -0,0 +1,57 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for functions in jira_bulk_create.py."""
+
+import pytest
+
+from utilities import jira_bulk_create
+
+
+def test_bulk_create_results():
+    field_list = [{'summary': 'a'}, {'summary': 'b'}, {'summary': 'c'}]
+    response = {'issues': [{'id': '10001', 'key': 'TEST-1'}, {'id': '10002', 'key': 'TEST-2'}],
+                'errors': [{'status': 400, 'failedElementNumber': 1,
+                            'elementErrors': {'errors': {'summary': 'invalid'}}}]}
+
+    results = jira_bulk_create.bulk_create_results(field_list, response,
+                                                   make_issue=lambda key: f'<{key}>')
+
+    assert results == [
+        {'status': 'Success', 'issue': '<TEST-1>', 'error': None, 'input_fields': field_list[0]},
+        {'status': 'Error', 'issue': None, 'error': {'errors': {'summary': 'invalid'}},
+         'input_fields': field_list[1]},
+        {'status': 'Success', 'issue': '<TEST-2>', 'error': None, 'input_fields': field_list[2]}]
+
+
+def test_bulk_create_results_with_no_issue_created():
+    response = {'issues': [],
+                'errors': [{'status': 400, 'failedElementNumber': 0,
+                            'elementErrors': {'errors': {'summary': 'required'}}}]}
+
+    results = jira_bulk_create.bulk_create_results([{}], response)
+
+    assert [result['status'] for result in results] == ['Error']
+
+
+@pytest.mark.parametrize('response', [
+    {'errorMessages': ['invalid request'], 'errors': {}},
+    {'issues': [{'id': '10001', 'key': 'TEST-1'}]},
+    {'issues': [], 'errors': []},
+    {'issues': [], 'errors': [{'failedElementNumber': 3, 'elementErrors': {}}]},
+    None,
+])
+def test_bulk_create_results_with_invalid_response(response):
+    with pytest.raises(jira_bulk_create.InvalidResponseError):
+        jira_bulk_create.bulk_create_results([{}], response)
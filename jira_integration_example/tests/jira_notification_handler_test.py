@@ -14,10 +14,18 @@
 
 """Unit tests for functions in jira_notification_handler.py."""
 
+import concurrent.futures
+import functools
+import threading
+import time
+
 import pytest
 
 from jira import JIRA, Issue
-from utilities import jira_notification_handler
+from jira.client import ResultList
+import config
+from utilities import (jira_notification_handler, digest, flap_suppression, issue_templates,
+                       keyed_locks, micro_batch, ttl_cache)
 
 
 def test_update_jira_with_open_incident(mocker):
@@ -53,7 +61,7 @@ def test_update_jira_with_closed_incident_corresponding_to_jira_issues(mocker):
     jira_client = mocker.create_autospec(JIRA, instance=True)
     mock_searched_issues = [mocker.create_autospec(Issue, instance=True),
                             mocker.create_autospec(Issue, instance=True)]
-    jira_client.search_issues.return_value = mock_searched_issues
+    jira_client.search_issues.return_value = _search_results(mock_searched_issues)
 
     jira_project = 'test_project'
     incident_state = 'closed'
@@ -68,7 +76,8 @@ def test_update_jira_with_closed_incident_corresponding_to_jira_issues(mocker):
 
     incident_id_label = f'monitoring_incident_id_{incident_id}'
     expected_jira_query = f'labels = {incident_id_label} AND status != {jira_status}'
-    jira_client.search_issues.assert_called_once_with(expected_jira_query)
+    jira_client.search_issues.assert_called_once_with(expected_jira_query, startAt=0,
+                                                      maxResults=100, fields='labels')
 
     expected_transition_calls = [mocker.call(issue, jira_status) for issue in mock_searched_issues]
     jira_client.transition_issue.assert_has_calls(expected_transition_calls)
@@ -78,7 +87,7 @@ def test_update_jira_with_closed_incident_corresponding_to_jira_issues(mocker):
 def test_update_jira_with_closed_incident_corresponding_to_no_jira_issues(mocker):
     jira_client = mocker.create_autospec(JIRA, instance=True)
     mock_searched_issues = []
-    jira_client.search_issues.return_value = mock_searched_issues
+    jira_client.search_issues.return_value = _search_results(mock_searched_issues)
 
     jira_project = 'test_project'
     incident_state = 'closed'
@@ -93,7 +102,8 @@ def test_update_jira_with_closed_incident_corresponding_to_no_jira_issues(mocker
 
     incident_id_label = f'monitoring_incident_id_{incident_id}'
     expected_jira_query = f'labels = {incident_id_label} AND status != {jira_status}'
-    jira_client.search_issues.assert_called_once_with(expected_jira_query)
+    jira_client.search_issues.assert_called_once_with(expected_jira_query, startAt=0,
+                                                      maxResults=100, fields='labels')
 
     jira_client.transition_issue.assert_not_called()
 
@@ -235,3 +245,452 @@ def test_update_jira_with_missing_incident_id_data(mocker):
 
     expected_error_value = "Notification is missing required dict key: 'incident_id'"
     assert str(e.value) == expected_error_value
+
+
+def test_update_jira_with_concurrent_open_and_closed_incident(mocker):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    created_issues = []
+    create_started = threading.Event()
+
+    def create_issue(**fields):
+        create_started.set()
+        time.sleep(0.1)
+        created_issues.append(fields['labels'][0])
+        return 'TEST-1'
+
+    jira_client.create_issue.side_effect = create_issue
+    jira_client.search_issues.side_effect = lambda query, **kwargs: _search_results(
+        ['TEST-1'] if created_issues else [])
+
+    jira_project = 'test_project'
+    jira_status = "Done"
+    incident_locks = keyed_locks.KeyedLocks()
+    notifications = [{'incident': {'state': state, 'condition_name': 'test_condition',
+                                   'resource_name': 'test_resource', 'summary': 'test_summary',
+                                   'url': 'http://test.com', 'incident_id': '0.abcdef123456'}}
+                     for state in ('open', 'closed')]
+
+    open_thread = threading.Thread(
+        target=jira_notification_handler.update_jira_based_on_monitoring_notification,
+        args=(jira_client, jira_project, jira_status, notifications[0],
+              jira_notification_handler.HandlerOptions(incident_locks=incident_locks)))
+    open_thread.start()
+    create_started.wait()
+    jira_notification_handler.update_jira_based_on_monitoring_notification(
+        jira_client, jira_project, jira_status, notifications[1],
+        jira_notification_handler.HandlerOptions(incident_locks=incident_locks))
+    open_thread.join()
+
+    jira_client.transition_issue.assert_called_once_with('TEST-1', jira_status)
+    assert incident_locks.size == 0
+
+
+def test_update_jira_with_closed_incident_before_open_incident(mocker):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    jira_client.search_issues.return_value = _search_results([])
+    jira_client.create_issue.return_value = 'TEST-1'
+
+    jira_project = 'test_project'
+    jira_status = "Done"
+    pending_closes = ttl_cache.TtlCache(max_size=10, ttl_seconds=60)
+    closed_notification, open_notification = [
+        {'incident': {'state': state, 'condition_name': 'test_condition',
+                      'resource_name': 'test_resource', 'summary': 'test_summary',
+                      'url': 'http://test.com', 'incident_id': '0.abcdef123456'}}
+        for state in ('closed', 'open')]
+
+    jira_notification_handler.update_jira_based_on_monitoring_notification(
+        jira_client, jira_project, jira_status, closed_notification,
+        jira_notification_handler.HandlerOptions(pending_closes=pending_closes))
+
+    jira_client.transition_issue.assert_not_called()
+    assert pending_closes.get('0.abcdef123456')
+
+    jira_notification_handler.update_jira_based_on_monitoring_notification(
+        jira_client, jira_project, jira_status, open_notification,
+        jira_notification_handler.HandlerOptions(pending_closes=pending_closes))
+
+    jira_client.create_issue.assert_called_once()
+    jira_client.transition_issue.assert_called_once_with('TEST-1', jira_status)
+    assert len(pending_closes) == 0
+
+
+def test_update_jira_with_open_incident_not_closed_before(mocker):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    pending_closes = ttl_cache.TtlCache(max_size=10, ttl_seconds=60)
+    pending_closes.set('0.other', True)
+    notification = {'incident': {'state': 'open', 'condition_name': 'test_condition',
+                                 'resource_name': 'test_resource', 'summary': 'test_summary',
+                                 'url': 'http://test.com', 'incident_id': '0.abcdef123456'}}
+
+    jira_notification_handler.update_jira_based_on_monitoring_notification(
+        jira_client, 'test_project', 'Done', notification,
+        jira_notification_handler.HandlerOptions(pending_closes=pending_closes))
+
+    jira_client.create_issue.assert_called_once()
+    jira_client.transition_issue.assert_not_called()
+    assert pending_closes.get('0.other')
+
+
+def test_update_jira_with_incident_reopened_within_flap_window(mocker):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    jira_client.search_issues.return_value = _search_results(['TEST-1'])
+
+    jira_project = 'test_project'
+    jira_status = "Done"
+    flap_suppressor = flap_suppression.FlapSuppressor(
+        default_window_seconds=600, policy_window_seconds={}, max_incidents=10,
+        reopen_status='To Do')
+    closed_notification, open_notification = [
+        {'incident': {'state': state, 'policy_name': 'test_policy',
+                      'condition_name': 'test_condition', 'resource_name': 'test_resource',
+                      'summary': 'test_summary', 'url': 'http://test.com',
+                      'incident_id': incident_id}}
+        for state, incident_id in (('closed', '0.abcdef123456'), ('open', '0.fedcba654321'))]
+
+    jira_notification_handler.update_jira_based_on_monitoring_notification(
+        jira_client, jira_project, jira_status, closed_notification,
+        jira_notification_handler.HandlerOptions(flap_suppressor=flap_suppressor))
+    jira_notification_handler.update_jira_based_on_monitoring_notification(
+        jira_client, jira_project, jira_status, open_notification,
+        jira_notification_handler.HandlerOptions(flap_suppressor=flap_suppressor))
+
+    jira_client.create_issue.assert_not_called()
+    jira_client.issue.return_value.add_field_value.assert_called_once_with(
+        'labels', 'monitoring_incident_id_0.fedcba654321')
+    jira_client.transition_issue.assert_has_calls([mocker.call('TEST-1', jira_status),
+                                                   mocker.call('TEST-1', 'To Do')])
+    jira_client.add_comment.assert_called_once_with(
+        'TEST-1', 'Reopened by incident 0.fedcba654321: test_summary\nSee: http://test.com')
+
+
+def test_update_jira_with_incidents_of_digest_policy(mocker, tmp_path):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    jira_client.create_issue.return_value = 'TEST-1'
+
+    jira_project = 'test_project'
+    jira_status = "Done"
+    incident_digest = digest.Digest(policy_names=['low_priority_policy'], interval_seconds=3600,
+                                    max_entries=2, spool_directory=str(tmp_path))
+    notifications = [{'incident': {'state': 'open', 'policy_name': 'low_priority_policy',
+                                   'condition_name': 'test_condition',
+                                   'resource_name': 'test_resource', 'summary': 'test_summary',
+                                   'url': 'http://test.com', 'incident_id': incident_id}}
+                     for incident_id in ('0.abc', '0.def')]
+
+    jira_notification_handler.update_jira_based_on_monitoring_notification(
+        jira_client, jira_project, jira_status, notifications[0],
+        jira_notification_handler.HandlerOptions(digest=incident_digest))
+
+    jira_client.create_issue.assert_not_called()
+
+    jira_notification_handler.update_jira_based_on_monitoring_notification(
+        jira_client, jira_project, jira_status, notifications[1],
+        jira_notification_handler.HandlerOptions(digest=incident_digest))
+
+    jira_client.create_issue.assert_called_once_with(
+        project=jira_project,
+        summary='Monitoring digest - 2 incident notifications',
+        description=('Open incident 0.abc: test_condition - test_resource\n'
+                     'test_summary\nSee: http://test.com\n\n'
+                     'Open incident 0.def: test_condition - test_resource\n'
+                     'test_summary\nSee: http://test.com'),
+        issuetype={'name': 'Bug'},
+        labels=['monitoring_digest'])
+    assert incident_digest.size == 0
+
+
+def test_update_jira_reports_digest_to_digest_destination(mocker, tmp_path):
+    routed_jira_client = mocker.create_autospec(JIRA, instance=True)
+    default_jira_client = mocker.create_autospec(JIRA, instance=True)
+    incident_digest = digest.Digest(policy_names=['low_priority_policy'], interval_seconds=3600,
+                                    max_entries=1, spool_directory=str(tmp_path))
+    notification = {'incident': {'state': 'open', 'policy_name': 'low_priority_policy',
+                                 'condition_name': 'test_condition',
+                                 'resource_name': 'test_resource', 'summary': 'test_summary',
+                                 'url': 'http://test.com', 'incident_id': '0.abc'}}
+
+    jira_notification_handler.update_jira_based_on_monitoring_notification(
+        routed_jira_client, 'ROUTED', 'Done', notification,
+        jira_notification_handler.HandlerOptions(
+            digest=incident_digest,
+            digest_destination=jira_notification_handler.DigestDestination(
+                default_jira_client, 'DEFAULT', None)))
+
+    routed_jira_client.create_issue.assert_not_called()
+    _, kwargs = default_jira_client.create_issue.call_args
+    assert kwargs['project'] == 'DEFAULT'
+
+
+def test_update_jira_when_reporting_digest_fails(mocker, tmp_path):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+
+    def create_issue(**fields):
+        if fields['labels'] == ['monitoring_digest']:
+            raise RuntimeError('jira error')
+        return 'TEST-1'
+
+    jira_client.create_issue.side_effect = create_issue
+    incident_digest = digest.Digest(policy_names=['low_priority_policy'], interval_seconds=3600,
+                                    max_entries=1, spool_directory=str(tmp_path))
+    low_priority_notification, high_priority_notification = [
+        {'incident': {'state': 'open', 'policy_name': policy_name,
+                      'condition_name': 'test_condition', 'resource_name': 'test_resource',
+                      'summary': 'test_summary', 'url': 'http://test.com',
+                      'incident_id': incident_id}}
+        for policy_name, incident_id in (('low_priority_policy', '0.abc'),
+                                         ('high_priority_policy', '0.def'))]
+
+    jira_notification_handler.update_jira_based_on_monitoring_notification(
+        jira_client, 'test_project', 'Done', low_priority_notification,
+        jira_notification_handler.HandlerOptions(digest=incident_digest))
+    jira_notification_handler.update_jira_based_on_monitoring_notification(
+        jira_client, 'test_project', 'Done', high_priority_notification,
+        jira_notification_handler.HandlerOptions(digest=incident_digest))
+
+    assert incident_digest.size == 1
+    issue_labels = [kwargs['labels'] for _, kwargs in jira_client.create_issue.call_args_list]
+    assert issue_labels == [['monitoring_digest'], ['monitoring_incident_id_0.def'],
+                            ['monitoring_digest']]
+
+
+def test_flush_digest_keeps_entries_when_jira_fails(mocker, tmp_path):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    jira_client.create_issue.side_effect = RuntimeError('jira error')
+    incident_digest = digest.Digest(policy_names=['low_priority_policy'], interval_seconds=3600,
+                                    max_entries=2, spool_directory=str(tmp_path))
+    incident_digest.add({'incident_id': '0.abc', 'state': 'open', 'policy_name': 'test_policy',
+                         'condition_name': 'test_condition', 'resource_name': 'test_resource',
+                         'summary': 'test_summary', 'url': 'http://test.com'})
+
+    with pytest.raises(RuntimeError):
+        jira_notification_handler.flush_digest(
+            jira_notification_handler.DigestDestination(jira_client, 'test_project', None),
+            incident_digest, force=True)
+
+    assert incident_digest.size == 1
+
+
+def test_create_issues_in_bulk(mocker):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    created_issue = mocker.create_autospec(Issue, instance=True)
+    jira_client.create_issues.return_value = [
+        {'status': 'Success', 'issue': created_issue, 'error': None, 'input_fields': {}},
+        {'status': 'Error', 'issue': None, 'error': {'summary': 'required'},
+         'input_fields': {}}]
+    field_list = [{'project': 'test_project', 'summary': 'test_summary'},
+                  {'project': 'test_project'}]
+
+    results = jira_notification_handler.create_issues_in_bulk(jira_client, field_list)
+
+    jira_client.create_issues.assert_called_once_with(
+        [{'project': {'key': 'test_project'}, 'summary': 'test_summary'},
+         {'project': {'key': 'test_project'}}], prefetch=False)
+    assert results[0] is created_issue
+    assert isinstance(results[1], jira_notification_handler.BulkCreateError)
+
+
+def test_search_open_issues_in_bulk(mocker):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    issues = [mocker.create_autospec(Issue, instance=True) for _ in range(3)]
+    for issue, labels in zip(issues, [['monitoring_incident_id_0.a'],
+                                      ['monitoring_incident_id_0.a', 'other_label'],
+                                      ['monitoring_incident_id_0.c']]):
+        issue.fields = mocker.Mock(labels=labels)
+    jira_client.search_issues.return_value = _search_results(issues)
+    labels = ['monitoring_incident_id_0.a', 'monitoring_incident_id_0.b',
+              'monitoring_incident_id_0.c']
+
+    results = jira_notification_handler.search_open_issues_in_bulk(jira_client, 'Done', labels)
+
+    jira_client.search_issues.assert_called_once_with(
+        'labels in (monitoring_incident_id_0.a, monitoring_incident_id_0.b, '
+        'monitoring_incident_id_0.c) AND status != Done', startAt=0, maxResults=100,
+        fields='labels')
+    assert results == [issues[:2], [], issues[2:]]
+
+
+def test_update_jira_with_closed_incidents_searched_in_bulk(mocker):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    issue = mocker.create_autospec(Issue, instance=True)
+    issue.fields = mocker.Mock(labels=['monitoring_incident_id_0.a'])
+    jira_client.search_issues.return_value = _search_results([issue])
+    search_batcher = micro_batch.MicroBatcher(
+        functools.partial(jira_notification_handler.search_open_issues_in_bulk,
+                          jira_client, 'Done'),
+        max_batch_size=2, max_delay_seconds=5)
+    notifications = [{'incident': {'state': 'closed', 'condition_name': 'test_condition',
+                                   'resource_name': 'test_resource', 'summary': 'test_summary',
+                                   'url': 'http://test.com', 'incident_id': incident_id}}
+                     for incident_id in ('0.a', '0.b')]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        for future in [executor.submit(
+                jira_notification_handler.update_jira_based_on_monitoring_notification,
+                jira_client, 'test_project', 'Done', notification,
+                jira_notification_handler.HandlerOptions(search_batcher=search_batcher)) for notification in notifications]:
+            future.result()
+
+    jira_client.search_issues.assert_called_once()
+    jira_client.transition_issue.assert_called_once_with(issue, 'Done')
+
+
+def test_update_jira_with_closed_incident_with_many_jira_issues(mocker):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    mock_searched_issues = [mocker.create_autospec(Issue, instance=True) for _ in range(150)]
+    jira_client.search_issues.side_effect = [_search_results(mock_searched_issues[:100], 150),
+                                             _search_results(mock_searched_issues[100:], 150)]
+    notification = {'incident': {'state': 'closed', 'condition_name': 'test_condition',
+                                 'resource_name': 'test_resource', 'summary': 'test_summary',
+                                 'url': 'http://test.com', 'incident_id': '0.abcdef123456'}}
+
+    jira_notification_handler.update_jira_based_on_monitoring_notification(
+        jira_client, 'test_project', 'Done', notification)
+
+    expected_jira_query = 'labels = monitoring_incident_id_0.abcdef123456 AND status != Done'
+    assert jira_client.search_issues.call_args_list == [
+        mocker.call(expected_jira_query, startAt=0, maxResults=100, fields='labels'),
+        mocker.call(expected_jira_query, startAt=100, maxResults=100, fields='labels')]
+    assert jira_client.transition_issue.call_count == len(mock_searched_issues)
+
+
+def test_update_jira_with_closed_incident_with_capped_search_pages(mocker):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    mock_searched_issues = [mocker.create_autospec(Issue, instance=True) for _ in range(80)]
+    jira_client.search_issues.side_effect = [_search_results(mock_searched_issues[:50], 80),
+                                             _search_results(mock_searched_issues[50:], 80)]
+    notification = {'incident': {'state': 'closed', 'condition_name': 'test_condition',
+                                 'resource_name': 'test_resource', 'summary': 'test_summary',
+                                 'url': 'http://test.com', 'incident_id': '0.abcdef123456'}}
+
+    jira_notification_handler.update_jira_based_on_monitoring_notification(
+        jira_client, 'test_project', 'Done', notification)
+
+    expected_jira_query = 'labels = monitoring_incident_id_0.abcdef123456 AND status != Done'
+    assert jira_client.search_issues.call_args_list == [
+        mocker.call(expected_jira_query, startAt=0, maxResults=100, fields='labels'),
+        mocker.call(expected_jira_query, startAt=50, maxResults=100, fields='labels')]
+    assert jira_client.transition_issue.call_count == len(mock_searched_issues)
+
+
+def _search_results(issues, total=None):
+    return ResultList(issues, _total=len(issues) if total is None else total)
+
+
+def _createmeta(fields=None):
+    if fields is None:
+        fields = {name: {'required': name != 'labels'}
+                  for name in ('project', 'issuetype', 'summary', 'description', 'labels')}
+    return {'projects': [{'id': '10000', 'key': 'TEST',
+                          'issuetypes': [{'id': '10004', 'name': 'Bug', 'fields': fields}]}]}
+
+
+def test_update_jira_with_open_incident_and_issue_metadata_cache(mocker):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    jira_client.createmeta.return_value = _createmeta()
+    issue_metadata_cache = ttl_cache.TtlCache(max_size=1, ttl_seconds=60)
+    notification = {'incident': {'state': 'open', 'condition_name': 'test_condition',
+                                 'resource_name': 'test_resource', 'summary': 'test_summary',
+                                 'url': 'http://test.com', 'incident_id': '0.abcdef123456'}}
+
+    for _ in range(2):
+        jira_notification_handler.update_jira_based_on_monitoring_notification(
+            jira_client, 'TEST', 'Done', notification,
+            jira_notification_handler.HandlerOptions(issue_metadata_cache=issue_metadata_cache))
+
+    jira_client.createmeta.assert_called_once_with(
+        projectKeys='TEST', issuetypeNames='Bug', expand='projects.issuetypes.fields')
+    assert jira_client.create_issue.call_count == 2
+    _, kwargs = jira_client.create_issue.call_args
+    assert kwargs['project'] == {'id': '10000'}
+    assert kwargs['issuetype'] == {'id': '10004'}
+
+
+def test_load_issue_metadata_with_project_id(mocker):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    jira_client.createmeta.return_value = _createmeta()
+    issue_metadata_cache = ttl_cache.TtlCache(max_size=1, ttl_seconds=60)
+
+    issue_metadata = jira_notification_handler.load_issue_metadata(jira_client, '10000',
+                                                                   issue_metadata_cache)
+
+    assert (issue_metadata.project_id, issue_metadata.issue_type_id) == ('10000', '10004')
+    assert issue_metadata_cache.get('10000') == issue_metadata
+    jira_client.createmeta.assert_called_once_with(
+        projectIds=['10000'], issuetypeNames='Bug', expand='projects.issuetypes.fields')
+
+
+def test_load_issue_metadata_with_required_reporter(mocker):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    # Jira fills in the reporter itself, although createmeta reports it as required
+    jira_client.createmeta.return_value = _createmeta(fields={
+        'project': {'required': True}, 'issuetype': {'required': True},
+        'summary': {'required': True}, 'description': {}, 'labels': {},
+        'reporter': {'required': True, 'hasDefaultValue': False}})
+    issue_metadata_cache = ttl_cache.TtlCache(max_size=1, ttl_seconds=60)
+
+    issue_metadata = jira_notification_handler.load_issue_metadata(jira_client, 'TEST',
+                                                                   issue_metadata_cache)
+
+    assert (issue_metadata.project_id, issue_metadata.issue_type_id) == ('10000', '10004')
+
+
+@pytest.mark.parametrize('createmeta', [
+    {'projects': []},
+    {'projects': [{'id': '10000', 'key': 'TEST', 'issuetypes': []}]},
+    _createmeta(fields={'project': {'required': True}, 'issuetype': {'required': True},
+                        'summary': {'required': True}, 'description': {},
+                        'labels': {}, 'components': {'required': True}}),
+    _createmeta(fields={'project': {'required': True}, 'issuetype': {'required': True},
+                        'summary': {'required': True}, 'description': {}}),
+])
+def test_load_issue_metadata_with_misconfigured_project(mocker, createmeta):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    jira_client.createmeta.return_value = createmeta
+    issue_metadata_cache = ttl_cache.TtlCache(max_size=1, ttl_seconds=60)
+
+    with pytest.raises(jira_notification_handler.IssueMetadataError):
+        jira_notification_handler.load_issue_metadata(jira_client, 'TEST', issue_metadata_cache)
+
+    assert issue_metadata_cache.get('TEST') is None
+
+
+def test_update_jira_with_open_incident_of_version_1_2_and_default_templates(mocker):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    templates = issue_templates.IssueTemplates(
+        config.JiraConfig.ISSUE_SUMMARY_TEMPLATE, config.JiraConfig.ISSUE_DESCRIPTION_TEMPLATE)
+    # the condition and resource names are only in the 1.2 objects
+    notification = {'version': '1.2', 'incident': {
+        'state': 'open', 'incident_id': '0.abcdef123456', 'summary': 'CPU is high.',
+        'url': 'http://test.com', 'condition': {'displayName': 'CPU high'},
+        'resource': {'type': 'gce_instance'}, 'resource_display_name': 'vm-1'}}
+
+    jira_notification_handler.update_jira_based_on_monitoring_notification(
+        jira_client, 'test_project', 'Done', notification,
+        jira_notification_handler.HandlerOptions(issue_templates=templates))
+
+    _, kwargs = jira_client.create_issue.call_args
+    assert kwargs['summary'] == 'CPU high - vm-1'
+    assert kwargs['description'] == 'CPU is high.\nSee: http://test.com'
+
+
+def test_update_jira_with_open_incident_and_policy_template(mocker):
+    jira_client = mocker.create_autospec(JIRA, instance=True)
+    templates = issue_templates.IssueTemplates(
+        '{condition_name} - {resource_name}', '{summary}\nSee: {url}',
+        policy_templates={'disk policy': {
+            'summary': '[{severity}] {condition_name}',
+            'description': '{summary}\n\n{documentation.content}'}})
+    notification = {'incident': {'state': 'open', 'policy_name': 'disk policy',
+                                 'condition_name': 'disk full', 'resource_name': 'vm-1',
+                                 'summary': 'The disk is full.', 'url': 'http://test.com',
+                                 'incident_id': '0.abcdef123456', 'severity': 'Critical',
+                                 'documentation': {'content': 'Delete old logs.'}}}
+
+    jira_notification_handler.update_jira_based_on_monitoring_notification(
+        jira_client, 'test_project', 'Done', notification,
+        jira_notification_handler.HandlerOptions(issue_templates=templates))
+
+    _, kwargs = jira_client.create_issue.call_args
+    assert kwargs['summary'] == '[Critical] disk full'
+    assert kwargs['description'] == 'The disk is full.\n\nDelete old logs.'
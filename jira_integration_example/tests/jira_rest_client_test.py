@@ -0,0 +1,228 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the JiraRestClient in jira_rest_client.py."""
+
+import http.server
+import json
+import threading
+import urllib.parse
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from utilities import jira_auth, jira_rest_client, oauth_signing
+
+
+@pytest.fixture(scope='module')
+def oauth_dict():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    key_cert = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption()).decode()
+    return {'access_token': 'test-access-token',
+            'access_token_secret': 'test-access-token-secret',
+            'consumer_key': 'test-consumer-key',
+            'key_cert': key_cert}
+
+
+@pytest.fixture
+def jira_server():
+    """Runs a fake Jira server and returns its URL and the list of requests it received."""
+    received = []
+    responses = {
+        ('POST', '/rest/api/2/issue'): (201, {'id': '10000', 'key': 'TEST-1'}),
+        ('POST', '/rest/api/2/issue/bulk'): (
+            201, {'issues': [{'id': '10001', 'key': 'TEST-2'}],
+                  'errors': [{'status': 400, 'failedElementNumber': 0,
+                              'elementErrors': {'errors': {'summary': 'required'}}}]}),
+        ('POST', '/invalid/rest/api/2/issue/bulk'): (
+            400, {'errorMessages': ['invalid request'], 'errors': {}}),
+        ('GET', '/rest/api/2/search'): (
+            200, {'startAt': 0, 'total': 2,
+                  'issues': [{'key': 'TEST-1', 'fields': {'labels': ['a']}},
+                             {'key': 'TEST-2', 'fields': {'labels': ['b']}}]}),
+        ('GET', '/rest/api/2/issue/createmeta'): (
+            200, {'projects': [{'id': '10000', 'key': 'TEST',
+                                'issuetypes': [{'id': '10004', 'name': 'Bug'}]}]}),
+        ('GET', '/rest/api/2/issue/TEST-1'): (
+            200, {'key': 'TEST-1', 'fields': {'labels': ['a']}}),
+        ('PUT', '/rest/api/2/issue/TEST-1'): (204, None),
+        ('GET', '/rest/api/2/issue/TEST-1/transitions'): (
+            200, {'transitions': [{'id': '11', 'name': 'In Progress'},
+                                  {'id': '31', 'name': 'Done'}]}),
+        ('POST', '/rest/api/2/issue/TEST-1/transitions'): (204, None),
+        ('POST', '/rest/api/2/issue/TEST-1/comment'): (201, {'id': '10100'}),
+    }
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def handle_request(self):
+            url = urllib.parse.urlsplit(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length)) if length else None
+            received.append((self.command, url.path, dict(urllib.parse.parse_qsl(url.query)),
+                             body, self.headers.get('Authorization')))
+
+            status, response = responses.get((self.command, url.path), (403, 'forbidden'))
+            data = json.dumps(response).encode() if response is not None else b''
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = handle_request
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}', received
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def jira_client(jira_server, oauth_dict):
+    url, _ = jira_server
+    client = jira_rest_client.JiraRestClient(url, jira_auth.OAuth1Auth(oauth_dict),
+                                             timeout_seconds=5, max_retries=0)
+    yield client
+    client.close()
+
+
+def test_create_issue(jira_server, jira_client):
+    _, received = jira_server
+
+    issue = jira_client.create_issue(project='TEST', summary='test summary',
+                                     issuetype={'name': 'Bug'})
+
+    assert str(issue) == 'TEST-1'
+    method, path, _, body, authorization = received[0]
+    assert (method, path) == ('POST', '/rest/api/2/issue')
+    assert body == {'fields': {'project': {'key': 'TEST'}, 'summary': 'test summary',
+                               'issuetype': {'name': 'Bug'}}}
+    assert 'oauth_signature_method="RSA-SHA1"' in authorization
+
+
+def test_requests_are_signed_with_cached_signer(jira_client, mocker):
+    sign = mocker.spy(oauth_signing.RsaSha1Client, 'sign')
+
+    jira_client.create_issue(project='TEST', summary='test summary', issuetype={'name': 'Bug'})
+    jira_client.issue('TEST-1')
+
+    assert sign.call_count == 2
+
+
+def test_create_issues(jira_server, jira_client):
+    _, received = jira_server
+    field_list = [{'project': 'TEST', 'issuetype': {'name': 'Bug'}},
+                  {'project': 'TEST', 'summary': 'test summary', 'issuetype': {'name': 'Bug'}}]
+
+    results = jira_client.create_issues(field_list, prefetch=False)
+
+    assert [result['status'] for result in results] == ['Error', 'Success']
+    assert results[0]['error'] == {'errors': {'summary': 'required'}}
+    assert str(results[1]['issue']) == 'TEST-2'
+    assert received[0][3]['issueUpdates'][1]['fields']['project'] == {'key': 'TEST'}
+
+
+def test_create_issues_with_generic_error(jira_server, oauth_dict):
+    url, _ = jira_server
+    client = jira_rest_client.JiraRestClient(url + '/invalid', jira_auth.OAuth1Auth(oauth_dict),
+                                             timeout_seconds=5, max_retries=0)
+
+    with pytest.raises(jira_rest_client.JiraRequestError) as e:
+        client.create_issues([{'project': 'TEST', 'issuetype': {'name': 'Bug'}}])
+
+    assert 'invalid request' in str(e.value)
+
+
+def test_search_issues(jira_server, jira_client):
+    _, received = jira_server
+
+    issues = jira_client.search_issues('labels in (a, b)', startAt=0, maxResults=100,
+                                       fields='labels')
+
+    assert [(issue.key, issue.fields.labels) for issue in issues] == [('TEST-1', ['a']),
+                                                                      ('TEST-2', ['b'])]
+    assert issues.total == 2
+    assert received[0][2] == {'jql': 'labels in (a, b)', 'startAt': '0',
+                              'maxResults': '100', 'fields': 'labels'}
+
+
+def test_add_field_value(jira_server, jira_client):
+    _, received = jira_server
+
+    jira_client.issue('TEST-1', fields='labels').add_field_value('labels', 'c')
+
+    assert received[0][2] == {'fields': 'labels'}
+    assert received[1][:4] == ('PUT', '/rest/api/2/issue/TEST-1', {},
+                               {'update': {'labels': [{'add': 'c'}]}})
+
+
+def test_createmeta(jira_server, jira_client):
+    _, received = jira_server
+
+    createmeta = jira_client.createmeta(projectIds=[10000], issuetypeNames='Bug',
+                                        expand='projects.issuetypes.fields')
+
+    assert createmeta['projects'][0]['issuetypes'][0]['id'] == '10004'
+    assert received[0][2] == {'projectIds': '10000', 'issuetypeNames': 'Bug',
+                              'expand': 'projects.issuetypes.fields'}
+
+
+def test_transition_issue_and_add_comment(jira_server, jira_client):
+    _, received = jira_server
+
+    jira_client.transition_issue('TEST-1', 'done')
+    jira_client.add_comment('TEST-1', 'test comment')
+
+    assert received[1][:4] == ('POST', '/rest/api/2/issue/TEST-1/transitions', {},
+                               {'transition': {'id': '31'}})
+    assert received[2][:4] == ('POST', '/rest/api/2/issue/TEST-1/comment', {},
+                               {'body': 'test comment'})
+
+
+def test_transition_issue_with_unknown_transition(jira_client):
+    with pytest.raises(jira_rest_client.JiraRequestError):
+        jira_client.transition_issue('TEST-1', 'Unknown')
+
+
+def test_request_error(jira_client):
+    with pytest.raises(jira_rest_client.JiraRequestError) as e:
+        jira_client.transition_issue('TEST-2', 'Done')
+
+    assert 'status 403' in str(e.value)
+
+
+def test_connection_error(oauth_dict):
+    client = jira_rest_client.JiraRestClient('http://127.0.0.1:1',
+                                             jira_auth.OAuth1Auth(oauth_dict),
+                                             timeout_seconds=1, max_retries=0)
+
+    with pytest.raises(jira_rest_client.JiraRequestError):
+        client.add_comment('TEST-1', 'test comment')
+
+
+def test_request_with_bearer_auth(jira_server):
+    url, received = jira_server
+    client = jira_rest_client.JiraRestClient(url, jira_auth.BearerAuth('test-token'),
+                                             timeout_seconds=5, max_retries=0)
+
+    client.add_comment('TEST-1', 'test comment')
+
+    assert received[0][4] == 'Bearer test-token'
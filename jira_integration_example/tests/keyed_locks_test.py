@@ -0,0 +1,90 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for KeyedLocks in keyed_locks.py."""
+
+import asyncio
+import threading
+
+from utilities import keyed_locks
+
+
+def test_same_key_is_serialized():
+    locks = keyed_locks.KeyedLocks()
+    first_holds_lock = threading.Event()
+    events = []
+
+    def hold_first():
+        with locks.lock('incident_a'):
+            first_holds_lock.set()
+            events.append('first acquired')
+            threading.Event().wait(0.1)
+            events.append('first released')
+
+    thread = threading.Thread(target=hold_first)
+    thread.start()
+    first_holds_lock.wait()
+    with locks.lock('incident_a'):
+        events.append('second acquired')
+    thread.join()
+
+    assert events == ['first acquired', 'first released', 'second acquired']
+
+
+def test_different_keys_do_not_wait():
+    locks = keyed_locks.KeyedLocks()
+    other_key_acquired = threading.Event()
+
+    def hold_other_key():
+        with locks.lock('incident_b'):
+            other_key_acquired.set()
+
+    with locks.lock('incident_a'):
+        thread = threading.Thread(target=hold_other_key)
+        thread.start()
+        assert other_key_acquired.wait(timeout=1)
+        thread.join()
+
+
+def test_locks_are_removed_once_released():
+    locks = keyed_locks.KeyedLocks()
+
+    with locks.lock('incident_a'), locks.lock('incident_b'):
+        assert locks.size == 2
+
+    assert locks.size == 0
+
+
+def test_async_same_key_is_serialized():
+    locks = keyed_locks.KeyedLocks(lock_factory=asyncio.Lock)
+    events = []
+
+    async def hold(name):
+        async with locks.lock('incident_a'):
+            events.append(f'{name} acquired')
+            await asyncio.sleep(0.01)
+            events.append(f'{name} released')
+
+    async def run():
+        await asyncio.gather(hold('first'), hold('second'))
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+    assert events == ['first acquired', 'first released',
+                      'second acquired', 'second released']
+    assert locks.size == 0
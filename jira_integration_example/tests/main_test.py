@@ -17,9 +17,14 @@
 import base64
 import json
 
+import jira
 import pytest
 
+import config as integration_config
 import main
+from utilities import (admission_control, graceful_shutdown, jira_auth,
+                       jira_notification_handler, jira_rest_client, monitoring_notification,
+                       push_auth, ttl_cache)
 
 
 @pytest.fixture
@@ -31,7 +36,14 @@ def config():
 @pytest.fixture
 def flask_client():
     main.app.testing = True
-    return main.app.test_client()
+    # each test starts without a Jira client, as a freshly forked worker does
+    main.app.extensions.pop('jira_client', None)
+    yield main.app.test_client()
+    main.app.extensions['graceful_shutdown'] = graceful_shutdown.GracefulShutdown(
+        main.app.config['SHUTDOWN_GRACE_PERIOD_SECONDS'])
+    main.app.extensions['admission_control'] = admission_control.AdmissionController(
+        main.app.config['ADMISSION_MAX_IN_FLIGHT'],
+        main.app.config['ADMISSION_TARGET_LATENCY_SECONDS'])
 
 
 def test_empty_payload(flask_client):
@@ -69,6 +81,34 @@ def test_nonstring_notification_message(flask_client):
     assert b'data should be in a string format' in response.data
 
 
+def test_payload_without_push_token(flask_client, monkeypatch):
+    verifier = push_auth.PushTokenVerifier('https://notifications.example.com/',
+                                           'push@project.iam.gserviceaccount.com',
+                                           certs=push_auth.GoogleCerts(fetch_certs=dict))
+    monkeypatch.setitem(main.app.extensions, 'push_token_verifier', verifier)
+    response = flask_client.post('/', json={'message': {'data': ''}})
+
+    assert response.status_code == 401
+    assert b'Push request is missing a bearer token' in response.data
+
+
+def test_oversized_payload(flask_client, monkeypatch):
+    monkeypatch.setitem(main.app.config, 'MAX_REQUEST_BYTES', 100)
+    response = flask_client.post('/', json={'message': {'data': 'a' * 100}})
+
+    assert response.status_code == 413
+    assert b'Pub/Sub push request is over 100 bytes' in response.data
+
+
+def test_oversized_notification_message(flask_client, monkeypatch):
+    monkeypatch.setitem(main.app.config, 'MAX_NOTIFICATION_BYTES', 10)
+    data = base64.b64encode(b'{"incident": {}}').decode()
+    response = flask_client.post('/', json={'message': {'data': data}})
+
+    assert response.status_code == 413
+    assert b'Pub/Sub message data is over 10 bytes' in response.data
+
+
 def test_unicode_notification_message(flask_client):
     data = '{"incident": {"stăte": "open"}}'
 
@@ -92,7 +132,7 @@ def test_incident_alert_message_with_missing_data(flask_client, mocker):
     message = '{"incident": {}}'
     data = base64.b64encode(message.encode()).decode()
 
-    mocker.patch('main.JIRA', autospec=True)
+    mocker.patch('jira.JIRA', autospec=True)
     response = flask_client.post('/', json={'message': {'data': data}})
 
     assert response.status_code == 400
@@ -104,7 +144,7 @@ def test_incident_alert_message_with_invalid_state(flask_client, mocker):
                '"url": "http://test-cloud.com", "incident_id": "0.abcdef123456"}}')
     data = base64.b64encode(message.encode()).decode()
 
-    mocker.patch('main.JIRA', autospec=True)
+    mocker.patch('jira.JIRA', autospec=True)
     response = flask_client.post('/', json={'message': {'data': data}})
 
     assert response.status_code == 400
@@ -118,13 +158,272 @@ def test_incident_alert_message(flask_client, config, mocker):
 
     mocker.patch('main.jira_notification_handler.update_jira_based_on_monitoring_notification',
                  autospec=True)
-    mocker.patch('main.JIRA', autospec=True)
-    jira_client = main.JIRA.return_value # JIRA client to be used when handling pub/sub message
+    mocker.patch('jira.JIRA', autospec=True)
+    jira_client = jira.JIRA.return_value # JIRA client to be used when handling pub/sub message
 
     response = flask_client.post('/', json={'message': {'data': data}})
 
     main.jira_notification_handler.update_jira_based_on_monitoring_notification.assert_called_once_with(
         jira_client, config['JIRA_PROJECT'], config['CLOSED_JIRA_ISSUE_STATUS'],
-        json.loads(message))
+        monitoring_notification.parse(json.loads(message)),
+        main.app.extensions['handler_options']._replace(
+            issue_batcher=main.app.extensions['issue_batcher'],
+            search_batcher=main.app.extensions['search_batcher'],
+            issue_metadata_cache=main.app.extensions['issue_metadata_cache']))
 
     assert response.status_code == 200
+
+
+def test_jira_client_is_reused_across_requests(flask_client, mocker):
+    message = ('{"incident": {"state": "open", "condition_name": "test_condition",'
+               '"resource_name": "test_resource", "summary": "test_summary",'
+               '"url": "http://test-cloud.com", "incident_id": "0.abcdef123456"}}')
+    data = base64.b64encode(message.encode()).decode()
+
+    mocker.patch('jira.JIRA', autospec=True)
+
+    flask_client.post('/', json={'message': {'data': data}})
+    flask_client.post('/', json={'message': {'data': data}})
+
+    jira.JIRA.assert_called_once()
+
+
+def test_create_app_with_partial_push_auth_config():
+    class PushAuthJiraConfig(integration_config.TestJiraConfig):
+        PUSH_AUTH_AUDIENCE = 'https://notifications.example.com/'
+
+    with pytest.raises(push_auth.ConfigError, match='^PUSH_AUTH_SERVICE_ACCOUNT_EMAIL'):
+        main.create_app(PushAuthJiraConfig())
+
+
+def test_init_worker_clients(config, mocker):
+    inherited_jira_client = object()
+    flask_app = main.create_app(main.app_config)
+    flask_app.extensions['jira_client'] = inherited_jira_client
+    flask_app.config.from_object('config.TestJiraConfig')
+
+    mocker.patch('jira.JIRA', autospec=True)
+    main.init_worker_clients(flask_app)
+
+    expected_oauth_dict = {'access_token': config['JIRA_ACCESS_TOKEN'],
+                           'access_token_secret': config['JIRA_ACCESS_TOKEN_SECRET'],
+                           'consumer_key': config['JIRA_CONSUMER_KEY'],
+                           'key_cert': config['JIRA_KEY_CERT']}
+    jira.JIRA.assert_called_once_with(config['JIRA_URL'], oauth=expected_oauth_dict)
+    assert flask_app.extensions['jira_client'] is jira.JIRA.return_value
+
+
+def test_init_worker_clients_with_rest_client(config, mocker):
+    flask_app = main.create_app(main.app_config)
+    flask_app.config.from_object('config.TestJiraConfig')
+    flask_app.config['JIRA_CLIENT'] = 'rest'
+
+    mocker.patch('utilities.jira_rest_client.JiraRestClient', autospec=True)
+    main.init_worker_clients(flask_app)
+
+    jira_rest_client.JiraRestClient.assert_called_once_with(
+        config['JIRA_URL'], auth=mocker.ANY, timeout_seconds=config['HTTP_TIMEOUT_SECONDS'],
+        pool_size=config['JIRA_REST_POOL_SIZE'], max_retries=config['JIRA_REST_MAX_RETRIES'])
+    auth = jira_rest_client.JiraRestClient.call_args[1]['auth']
+    assert isinstance(auth, jira_auth.OAuth1Auth)
+    assert flask_app.extensions['jira_client'] is jira_rest_client.JiraRestClient.return_value
+
+
+def test_incident_alert_message_with_rest_client_error(flask_client, mocker):
+    message = ('{"incident": {"state": "closed", "condition_name": "test_condition",'
+               '"resource_name": "test_resource", "summary": "test_summary",'
+               '"url": "http://test.com", "incident_id": "0.abcdef123456"}}')
+    data = base64.b64encode(message.encode()).decode()
+    jira_client = mocker.create_autospec(jira_rest_client.JiraRestClient, instance=True)
+    jira_client.search_issues.side_effect = jira_rest_client.JiraRequestError('test error')
+    main.app.extensions['jira_client'] = jira_client
+
+    response = flask_client.post('/', json={'message': {'data': data}})
+
+    assert response.status_code == 400
+    assert response.get_data(as_text=True) == 'test error'
+
+
+def test_incident_alert_message_with_jira_error(flask_client, mocker):
+    message = ('{"incident": {"state": "closed", "condition_name": "test_condition",'
+               '"resource_name": "test_resource", "summary": "test_summary",'
+               '"url": "http://test.com", "incident_id": "0.abcdef123456"}}')
+    data = base64.b64encode(message.encode()).decode()
+    mocker.patch('jira.JIRA', autospec=True)
+    jira.JIRA.return_value.search_issues.side_effect = jira.JIRAError('test error')
+
+    response = flask_client.post('/', json={'message': {'data': data}})
+
+    assert response.status_code == 400
+    assert 'test error' in response.get_data(as_text=True)
+
+
+def test_init_worker_clients_with_api_token(config, mocker):
+    flask_app = main.create_app(main.app_config)
+    flask_app.config.from_object('config.TestJiraConfig')
+    flask_app.config['JIRA_AUTH_MODE'] = 'basic'
+
+    mocker.patch('jira.JIRA', autospec=True)
+    main.init_worker_clients(flask_app)
+
+    jira.JIRA.assert_called_once_with(
+        config['JIRA_URL'], basic_auth=(config['JIRA_USERNAME'], config['JIRA_API_TOKEN']))
+
+
+def test_init_worker_clients_loads_issue_metadata(config, mocker):
+    flask_app = main.create_app(main.app_config)
+    flask_app.config.from_object('config.TestJiraConfig')
+    flask_app.extensions['issue_metadata_cache'] = ttl_cache.TtlCache(1, 60)
+
+    mocker.patch('jira.JIRA', autospec=True)
+    jira.JIRA.return_value.createmeta.return_value = {'projects': [
+        {'id': '10000', 'issuetypes': [{'id': '10004', 'name': 'Bug'}]}]}
+    main.init_worker_clients(flask_app)
+
+    issue_metadata = flask_app.extensions['issue_metadata_cache'].get(config['JIRA_PROJECT'])
+    assert (issue_metadata.project_id, issue_metadata.issue_type_id) == ('10000', '10004')
+
+
+def test_init_worker_clients_fails_for_unknown_project(mocker):
+    flask_app = main.create_app(main.app_config)
+    flask_app.config.from_object('config.TestJiraConfig')
+    flask_app.extensions['issue_metadata_cache'] = ttl_cache.TtlCache(1, 60)
+
+    mocker.patch('jira.JIRA', autospec=True)
+    jira.JIRA.return_value.createmeta.return_value = {'projects': []}
+
+    with pytest.raises(jira_notification_handler.IssueMetadataError):
+        main.init_worker_clients(flask_app)
+
+
+class _RoutedJiraConfig(integration_config.TestJiraConfig):
+    JIRA_ROUTES = [{'policy_names': ['disk policy'], 'project': 'STOR'},
+                   {'user_labels': {'team': 'web'}, 'project': 'WEB',
+                    'jira_url': 'https://web.example.com'}]
+
+
+def _post_incident(flask_app, policy_name, user_labels):
+    message = json.dumps({'incident': {
+        'state': 'open', 'policy_name': policy_name, 'policy_user_labels': user_labels,
+        'condition_name': 'test_condition', 'resource_name': 'test_resource',
+        'summary': 'test_summary', 'url': 'http://test.com', 'incident_id': '0.abcdef123456'}})
+    data = base64.b64encode(message.encode()).decode()
+    return flask_app.test_client().post('/', json={'message': {'data': data}})
+
+
+def test_incident_alert_message_routed_to_project(mocker):
+    flask_app = main.create_app(_RoutedJiraConfig())
+    mocker.patch('main.jira_notification_handler.update_jira_based_on_monitoring_notification',
+                 autospec=True)
+    mocker.patch('jira.JIRA', autospec=True)
+
+    response = _post_incident(flask_app, 'disk policy', {})
+
+    assert response.status_code == 200
+    update_jira = main.jira_notification_handler.update_jira_based_on_monitoring_notification
+    args, _ = update_jira.call_args
+    assert args[:2] == (jira.JIRA.return_value, 'STOR')
+    assert args[4].issue_batcher is flask_app.extensions['issue_batcher']
+
+
+def test_incident_alert_message_routed_to_other_server(mocker):
+    flask_app = main.create_app(_RoutedJiraConfig())
+    mocker.patch('main.jira_notification_handler.update_jira_based_on_monitoring_notification',
+                 autospec=True)
+    mocker.patch('jira.JIRA', autospec=True)
+
+    for _ in range(2):
+        response = _post_incident(flask_app, 'other policy', {'team': 'web'})
+        assert response.status_code == 200
+
+    # the client of the other server is created once and then reused
+    jira.JIRA.assert_called_once_with('https://web.example.com', oauth=mocker.ANY)
+    update_jira = main.jira_notification_handler.update_jira_based_on_monitoring_notification
+    args, _ = update_jira.call_args
+    assert args[1] == 'WEB'
+    assert args[4].issue_batcher is not flask_app.extensions['issue_batcher']
+    assert len(flask_app.extensions['jira_servers']) == 1
+
+
+def test_digest_of_routed_incident_is_reported_to_default_project(mocker, tmp_path):
+    class DigestRoutedJiraConfig(_RoutedJiraConfig):
+        DIGEST_POLICIES = ['disk policy']
+        DIGEST_SPOOL_DIRECTORY = str(tmp_path)
+
+    flask_app = main.create_app(DigestRoutedJiraConfig())
+    mocker.patch('main.jira_notification_handler.update_jira_based_on_monitoring_notification',
+                 autospec=True)
+    mocker.patch('jira.JIRA', autospec=True)
+
+    response = _post_incident(flask_app, 'disk policy', {})
+
+    assert response.status_code == 200
+    update_jira = main.jira_notification_handler.update_jira_based_on_monitoring_notification
+    args, _ = update_jira.call_args
+    assert args[1] == 'STOR'
+    assert args[4].digest_destination == jira_notification_handler.DigestDestination(
+        jira.JIRA.return_value, flask_app.config['JIRA_PROJECT'],
+        flask_app.extensions['issue_metadata_cache'])
+
+
+def test_incident_alert_message_while_shutting_down(flask_client, mocker):
+    message = ('{"incident": {"state": "open", "condition_name": "test_condition",'
+               '"resource_name": "test_resource", "summary": "test_summary",'
+               '"url": "http://test-cloud.com", "incident_id": "0.abcdef123456"}}')
+    data = base64.b64encode(message.encode()).decode()
+
+    mocker.patch('main.jira_notification_handler.update_jira_based_on_monitoring_notification',
+                 autospec=True)
+    mocker.patch('jira.JIRA', autospec=True)
+    main.app.extensions['graceful_shutdown'].begin()
+
+    response = flask_client.post('/', json={'message': {'data': data}})
+
+    assert response.status_code == 503
+    main.jira_notification_handler.update_jira_based_on_monitoring_notification.assert_not_called()
+
+
+def test_incident_alert_message_while_overloaded(flask_client, mocker):
+    message = ('{"incident": {"state": "open", "condition_name": "test_condition",'
+               '"resource_name": "test_resource", "summary": "test_summary",'
+               '"url": "http://test-cloud.com", "incident_id": "0.abcdef123456"}}')
+    data = base64.b64encode(message.encode()).decode()
+
+    mocker.patch('main.jira_notification_handler.update_jira_based_on_monitoring_notification',
+                 autospec=True)
+    mocker.patch('jira.JIRA', autospec=True)
+    main.app.extensions['admission_control'] = admission_control.AdmissionController(
+        max_in_flight=1, target_latency_seconds=5)
+
+    with main.app.extensions['admission_control'].admit():
+        response = flask_client.post('/', json={'message': {'data': data}})
+
+    assert response.status_code == 429
+    assert b'Service is overloaded' in response.data
+    main.jira_notification_handler.update_jira_based_on_monitoring_notification.assert_not_called()
+
+
+def test_digest_is_flushed_at_shutdown(mocker, tmp_path):
+    class DigestTestConfig(integration_config.TestJiraConfig):
+        DIGEST_POLICIES = ['low_priority_policy']
+        DIGEST_SPOOL_DIRECTORY = str(tmp_path)
+
+    message = ('{"incident": {"state": "open", "policy_name": "low_priority_policy",'
+               '"condition_name": "test_condition", "resource_name": "test_resource",'
+               '"summary": "test_summary", "url": "http://test-cloud.com",'
+               '"incident_id": "0.abcdef123456"}}')
+    data = base64.b64encode(message.encode()).decode()
+
+    mocker.patch('jira.JIRA', autospec=True)
+    jira_client = jira.JIRA.return_value
+    flask_app = main.create_app(DigestTestConfig())
+
+    response = flask_app.test_client().post('/', json={'message': {'data': data}})
+
+    assert response.status_code == 200
+    jira_client.create_issue.assert_not_called()
+
+    flask_app.extensions['graceful_shutdown'].wait_and_flush()
+
+    jira_client.create_issue.assert_called_once()
+    assert jira_client.create_issue.call_args[1]['labels'] == ['monitoring_digest']
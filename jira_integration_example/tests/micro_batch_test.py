@@ -0,0 +1,127 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for MicroBatcher and AsyncMicroBatcher in micro_batch.py."""
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from utilities import micro_batch
+
+
+def test_concurrent_items_are_processed_in_one_batch():
+    batches = []
+
+    def process_batch(items):
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    batcher = micro_batch.MicroBatcher(process_batch, max_batch_size=4, max_delay_seconds=5)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(batcher.submit, [1, 2, 3, 4]))
+
+    # the batch is processed as soon as it is full, long before the delay
+    assert results == [10, 20, 30, 40]
+    assert len(batches) == 1
+    assert sorted(batches[0]) == [1, 2, 3, 4]
+
+
+def test_batch_is_processed_after_delay():
+    batcher = micro_batch.MicroBatcher(lambda items: [item + 1 for item in items],
+                                       max_batch_size=10, max_delay_seconds=0.01)
+
+    assert batcher.submit(1) == 2
+    assert batcher.submit(2) == 3
+
+
+def test_items_submitted_while_processing_are_processed_in_next_batch():
+    batches = []
+    first_batch_started = threading.Event()
+    release_first_batch = threading.Event()
+
+    def process_batch(items):
+        batches.append(list(items))
+        if len(batches) == 1:
+            first_batch_started.set()
+            release_first_batch.wait()
+        return items
+
+    batcher = micro_batch.MicroBatcher(process_batch, max_batch_size=10)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        first = executor.submit(batcher.submit, 0)
+        first_batch_started.wait()
+        others = [executor.submit(batcher.submit, item) for item in [1, 2, 3]]
+        while len(batcher._batch.items if batcher._batch else []) < 3:  # pylint: disable=protected-access
+            time.sleep(0.001)
+        release_first_batch.set()
+
+        assert first.result() == 0
+        assert [future.result() for future in others] == [1, 2, 3]
+
+    assert batches[0] == [0]
+    assert sorted(batches[1]) == [1, 2, 3]
+
+
+def test_failed_items_raise_only_for_their_submitter():
+    def process_batch(items):
+        return [ValueError(item) if item < 0 else item for item in items]
+
+    batcher = micro_batch.MicroBatcher(process_batch, max_batch_size=2, max_delay_seconds=5)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        failing = executor.submit(batcher.submit, -1)
+        succeeding = executor.submit(batcher.submit, 1)
+
+    assert succeeding.result() == 1
+    with pytest.raises(ValueError):
+        failing.result()
+
+
+def test_failed_batch_raises_for_all_submitters():
+    def process_batch(items):
+        raise RuntimeError('bulk request failed')
+
+    batcher = micro_batch.MicroBatcher(process_batch, max_batch_size=10)
+
+    with pytest.raises(RuntimeError):
+        batcher.submit(1)
+
+
+def test_async_concurrent_items_are_processed_in_one_batch():
+    batches = []
+
+    async def process_batch(items):
+        batches.append(list(items))
+        return [ValueError(item) if item < 0 else item * 10 for item in items]
+
+    async def run():
+        batcher = micro_batch.AsyncMicroBatcher(process_batch, max_batch_size=10)
+        return await asyncio.gather(*(batcher.submit(item) for item in [1, 2, -3]),
+                                    return_exceptions=True)
+
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+    assert results[:2] == [10, 20]
+    assert isinstance(results[2], ValueError)
+    assert batches == [[1, 2, -3]]
@@ -0,0 +1,125 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for parse in monitoring_notification.py."""
+
+import pytest
+
+from utilities import monitoring_notification
+
+
+def test_parse():
+    incident_data = {'incident_id': '0.abcdef123456', 'state': 'open',
+                     'policy_name': 'test_policy', 'condition_name': 'test_condition',
+                     'resource_name': 'test_resource', 'summary': 'test_summary',
+                     'url': 'http://test.com', 'resource': {'type': 'gce_instance'},
+                     'policy_user_labels': {'team': 'web'}}
+
+    notification = monitoring_notification.parse({'incident': incident_data,
+                                                  'version': '1.2'})
+
+    incident = notification.incident
+    assert incident.state is monitoring_notification.IncidentState.OPEN
+    assert incident.state == 'open'
+    assert (incident.incident_id, incident.policy_name, incident.condition_name,
+            incident.resource_name, incident.summary, incident.url) == (
+                '0.abcdef123456', 'test_policy', 'test_condition', 'test_resource',
+                'test_summary', 'http://test.com')
+    assert incident.resource_type == 'gce_instance'
+    assert incident.policy_user_labels == {'team': 'web'}
+    assert incident.data is incident_data
+    assert notification.version == '1.2'
+
+
+def test_parse_without_optional_fields():
+    incident = monitoring_notification.parse({'incident': {'state': 'closed'}}).incident
+
+    assert incident.state is monitoring_notification.IncidentState.CLOSED
+    assert incident.policy_name is None
+    assert incident.resource_type is None
+    assert incident.policy_user_labels == {}
+
+
+def test_incident_has_no_instance_dict():
+    incident = monitoring_notification.parse({'incident': {'state': 'closed'}}).incident
+
+    with pytest.raises(AttributeError):
+        incident.unknown_field = 'value'
+
+
+@pytest.mark.parametrize('notification, missing_key', [
+    ({}, 'incident'),
+    ({'incident': None}, 'incident'),
+    ({'incident': {'incident_id': '0.abcdef123456'}}, 'state'),
+    ({'incident': {'state': 'open', 'incident_id': '0.abcdef123456'}}, 'url'),
+])
+def test_parse_missing_required_field(notification, missing_key):
+    with pytest.raises(monitoring_notification.NotificationParseError) as e:
+        monitoring_notification.parse(notification, required_fields=('incident_id', 'url'))
+
+    assert str(e.value) == f"Notification is missing required dict key: '{missing_key}'"
+
+
+def test_parse_unknown_state():
+    with pytest.raises(monitoring_notification.UnknownIncidentStateError) as e:
+        monitoring_notification.parse({'incident': {'state': 'acknowledged'}})
+
+    assert str(e.value) == 'Incident state must be "open" or "closed"'
+
+
+@pytest.mark.parametrize('version', ['1.2', None, '1.9'])
+def test_parse_condition_and_metric_objects(version):
+    incident_data = {'incident_id': '0.abcdef123456', 'state': 'open', 'severity': 'critical',
+                     'condition': {'name': 'projects/p/alertPolicies/1/conditions/2',
+                                   'displayName': 'test_condition'},
+                     'metric': {'type': 'compute.googleapis.com/instance/cpu/utilization'},
+                     'resource': {'type': 'gce_instance', 'labels': {'instance_id': '1'}},
+                     'resource_display_name': 'test_resource'}
+
+    incident = monitoring_notification.parse(
+        {'incident': incident_data, 'version': version},
+        required_fields=('condition_name', 'resource_name')).incident
+
+    assert incident.condition_name == 'test_condition'
+    assert incident.resource_name == 'test_resource'
+    assert incident.resource_type == 'gce_instance'
+    assert incident.severity == 'critical'
+
+
+def test_parse_flat_fields_take_precedence():
+    incident = monitoring_notification.parse({'version': '1.2', 'incident': {
+        'state': 'open', 'condition_name': 'flat_condition',
+        'condition': {'displayName': 'nested_condition'}}}).incident
+
+    assert incident.condition_name == 'flat_condition'
+
+
+def test_parse_version_1_1():
+    incident_data = {'state': 'open', 'severity': 'critical',
+                     'condition': {'displayName': 'test_condition'}}
+
+    with pytest.raises(monitoring_notification.NotificationParseError):
+        monitoring_notification.parse({'incident': incident_data, 'version': '1.1'},
+                                      required_fields=('condition_name',))
+    incident = monitoring_notification.parse({'incident': incident_data,
+                                              'version': '1.1'}).incident
+    assert incident.severity is None
+
+
+@pytest.mark.parametrize('version', ['2.0', '', 1.2, ['1.2']])
+def test_parse_unsupported_version(version):
+    with pytest.raises(monitoring_notification.UnsupportedVersionError) as e:
+        monitoring_notification.parse({'incident': {'state': 'open'}, 'version': version})
+
+    assert str(e.value) == f'Notification schema version {version!r} is not supported'
@@ -0,0 +1,72 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for oauth_signing.py."""
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from oauthlib import oauth1
+
+from utilities import oauth_signing
+
+
+def _make_key_cert():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption()).decode()
+
+
+@pytest.fixture(scope='module')
+def oauth_dict():
+    return {'access_token': 'test-access-token',
+            'access_token_secret': 'test-access-token-secret',
+            'consumer_key': 'test-consumer-key',
+            'key_cert': _make_key_cert()}
+
+
+def test_signature_matches_oauthlib(oauth_dict):
+    oauthlib_client = oauth1.Client(oauth_dict['consumer_key'],
+                                    resource_owner_key=oauth_dict['access_token'],
+                                    resource_owner_secret=oauth_dict['access_token_secret'],
+                                    signature_method=oauth1.SIGNATURE_RSA,
+                                    rsa_key=oauth_dict['key_cert'],
+                                    nonce='test-nonce', timestamp='1596139200')
+    client = oauth_signing.RsaSha1Client(oauth_dict['consumer_key'],
+                                         resource_owner_key=oauth_dict['access_token'],
+                                         resource_owner_secret=oauth_dict['access_token_secret'],
+                                         signature_method=oauth1.SIGNATURE_RSA,
+                                         rsa_key=oauth_dict['key_cert'],
+                                         nonce='test-nonce', timestamp='1596139200')
+    url = 'https://jira.example.com/rest/api/2/search?jql=labels+%3D+a'
+
+    assert client.sign(url, http_method='GET') == oauthlib_client.sign(url, http_method='GET')
+
+
+def test_key_is_parsed_once(oauth_dict):
+    signer = oauth_signing.get_signer(oauth_dict)
+    signer.sign('https://jira.example.com/rest/api/2/issue', http_method='POST')
+    misses = oauth_signing.load_private_key.cache_info().misses
+
+    signer.sign('https://jira.example.com/rest/api/2/issue', http_method='POST')
+
+    assert oauth_signing.load_private_key.cache_info().misses == misses
+
+
+def test_signer_is_cached_per_credential_version(oauth_dict):
+    signer = oauth_signing.get_signer(oauth_dict)
+
+    assert oauth_signing.get_signer(dict(oauth_dict)) is signer
+    assert oauth_signing.get_signer(dict(oauth_dict, key_cert=_make_key_cert())) is not signer
@@ -0,0 +1,123 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for functions in pubsub.py."""
+
+import asyncio
+import base64
+import io
+import json
+
+import pytest
+
+from utilities import pubsub
+
+
+def _body(data):
+    return json.dumps({'message': {'data': data, 'message_id': '1'}}).encode()
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def json_backend(request, monkeypatch):
+    if request.param == 'json':
+        monkeypatch.setattr(pubsub, 'orjson', None)
+    elif pubsub.orjson is None:
+        pytest.skip('orjson is not installed')
+    return request.param
+
+
+@pytest.mark.usefixtures('json_backend')
+def test_decode_notification():
+    notification = {'incident': {'incident_id': '0.abcdef123456', 'summary': 'café'}}
+    data = base64.b64encode(b' ' + json.dumps(notification).encode() + b'\n').decode()
+
+    assert pubsub.decode_notification(_body(data)) == notification
+
+
+@pytest.mark.usefixtures('json_backend')
+def test_decode_notification_matches_parse_data_from_message():
+    body = _body(base64.b64encode(b'{"incident": {"state": "open"}}').decode())
+
+    expected = json.loads(pubsub.parse_data_from_message(json.loads(body)))
+    assert pubsub.decode_notification(body) == expected
+
+
+@pytest.mark.parametrize('body, error, message', [
+    (None, pubsub.DataParseError, 'invalid Pub/Sub message format'),
+    (b'{', pubsub.MessageDecodeError, 'Failed to decode JSON object'),
+    (b'""', pubsub.DataParseError, 'invalid Pub/Sub message format'),
+    (b'{"message": {}}', pubsub.DataParseError, 'invalid Pub/Sub message format'),
+    (_body(1), pubsub.DataParseError, 'data should be in a string format'),
+    (_body('abc'), pubsub.DataParseError, 'data should be base64-encoded'),
+    (_body('bm90IGpzb24='), pubsub.NotificationDecodeError,
+     'Notification could not be decoded'),
+    (_body('/w=='), pubsub.NotificationDecodeError, 'Notification could not be decoded'),
+])
+@pytest.mark.usefixtures('json_backend')
+def test_decode_invalid_notification(body, error, message):
+    with pytest.raises(error) as e:
+        pubsub.decode_notification(body)
+
+    assert str(e.value).startswith(message)
+
+
+@pytest.mark.parametrize('content_length', [None, 10])
+def test_read_body(content_length):
+    assert pubsub.read_body(io.BytesIO(b'{"a": "b"}'), 10, content_length) == b'{"a": "b"}'
+
+
+def test_read_body_over_content_length_limit():
+    stream = io.BytesIO(b'{}')
+
+    with pytest.raises(pubsub.PayloadTooLargeError):
+        pubsub.read_body(stream, 10, content_length=11)
+    assert stream.tell() == 0
+
+
+def test_read_body_over_limit_while_streaming(monkeypatch):
+    monkeypatch.setattr(pubsub, '_CHUNK_SIZE', 4)
+    stream = io.BytesIO(b'x' * 100)
+
+    with pytest.raises(pubsub.PayloadTooLargeError) as e:
+        pubsub.read_body(stream, 10)
+    assert str(e.value) == 'Pub/Sub push request is over 10 bytes'
+    assert stream.tell() == 11
+
+
+def test_read_body_async_over_limit_while_streaming():
+    class StreamReader:
+        def __init__(self, data):
+            self._stream = io.BytesIO(data)
+
+        async def read(self, size):
+            return self._stream.read(size)
+
+    assert asyncio.run(pubsub.read_body_async(StreamReader(b'x' * 10), 10)) == b'x' * 10
+    with pytest.raises(pubsub.PayloadTooLargeError):
+        asyncio.run(pubsub.read_body_async(StreamReader(b'x' * 100), 10))
+
+
+@pytest.mark.parametrize('data', [b'{"a": "bcd"}', b'{"a": "bcdefghijk"}'])
+def test_decode_notification_over_max_data_size(data):
+    with pytest.raises(pubsub.PayloadTooLargeError) as e:
+        pubsub.decode_notification(_body(base64.b64encode(data).decode()), max_data_size=11)
+
+    assert str(e.value) == 'Pub/Sub message data is over 11 bytes'
+
+
+def test_decode_notification_at_max_data_size():
+    data = b'{"a": "bc"}'
+
+    assert pubsub.decode_notification(_body(base64.b64encode(data).decode()),
+                                      max_data_size=len(data)) == {'a': 'bc'}
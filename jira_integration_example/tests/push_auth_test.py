@@ -0,0 +1,221 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for push_auth.py."""
+
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.auth import crypt
+from google.auth import jwt as google_jwt
+import pytest
+
+from utilities import push_auth
+
+
+AUDIENCE = 'https://notifications.example.com/'
+SERVICE_ACCOUNT_EMAIL = 'push@project.iam.gserviceaccount.com'
+
+
+def _key_pair():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(serialization.Encoding.PEM,
+                                            serialization.PrivateFormat.PKCS8,
+                                            serialization.NoEncryption())
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return private_pem, public_pem.decode()
+
+
+PRIVATE_PEM, PUBLIC_PEM = _key_pair()
+
+
+def _token(key_id='key1', **claims):
+    now = int(time.time())
+    payload = dict({'iss': 'https://accounts.google.com', 'aud': AUDIENCE,
+                    'email': SERVICE_ACCOUNT_EMAIL, 'email_verified': True,
+                    'iat': now, 'exp': now + 3600}, **claims)
+    signer = crypt.RSASigner.from_string(PRIVATE_PEM, key_id)
+    return 'Bearer ' + google_jwt.encode(signer, payload).decode()
+
+
+class FakeCertsFetcher:
+    def __init__(self, certs):
+        self.certs = certs
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.certs
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def fetch_certs():
+    return FakeCertsFetcher({'key1': PUBLIC_PEM})
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def certs(fetch_certs, clock):
+    return push_auth.GoogleCerts(refresh_seconds=3600, fetch_certs=fetch_certs, clock=clock)
+
+
+@pytest.fixture
+def verifier(certs, clock):
+    return push_auth.PushTokenVerifier(AUDIENCE, SERVICE_ACCOUNT_EMAIL, certs=certs,
+                                       clock=clock)
+
+
+def _wait_for_refresh(verifier):
+    certs = verifier._certs  # pylint: disable=protected-access
+    if certs._refresh_thread is not None:  # pylint: disable=protected-access
+        certs._refresh_thread.join()  # pylint: disable=protected-access
+
+
+def test_verify(verifier, fetch_certs):
+    claims = verifier.verify(_token())
+
+    assert claims['email'] == SERVICE_ACCOUNT_EMAIL
+    assert fetch_certs.calls == 1
+
+
+def test_verify_caches_verified_tokens(verifier, clock, mocker):
+    decode = mocker.spy(google_jwt, 'decode')
+    token = _token()
+
+    verifier.verify(token)
+    verifier.verify(token)
+    assert decode.call_count == 1
+
+    # a cached token is verified again once it expired (by the clock of the
+    # verifier, the signature check uses the real time)
+    clock.now += 2 * 3600
+    verifier.verify(token)
+    assert decode.call_count == 2
+
+
+@pytest.mark.parametrize('authorization', [None, '', 'Basic dXNlcjpwYXNz', 'Bearer ',
+                                           'Bearer not.a.token', 'Bearer @@@.a.b'])
+def test_verify_without_valid_token(verifier, authorization):
+    with pytest.raises(push_auth.AuthenticationError):
+        verifier.verify(authorization)
+
+
+@pytest.mark.parametrize('claims', [
+    {'aud': 'https://other.example.com/'},
+    {'email': 'other@project.iam.gserviceaccount.com'},
+    {'email_verified': False},
+    {'iss': 'https://issuer.example.com'},
+    {'exp': int(time.time()) - 3600, 'iat': int(time.time()) - 7200},
+])
+def test_verify_rejects_claims(verifier, claims):
+    with pytest.raises(push_auth.AuthenticationError):
+        verifier.verify(_token(**claims))
+
+
+def test_verify_rejects_bad_signature(verifier):
+    other_private_pem, _ = _key_pair()
+    signer = crypt.RSASigner.from_string(other_private_pem, 'key1')
+    token = google_jwt.encode(signer, {'aud': AUDIENCE}).decode()
+
+    with pytest.raises(push_auth.AuthenticationError):
+        verifier.verify('Bearer ' + token)
+
+
+def test_unknown_key_refreshes_certs_in_background(verifier, fetch_certs, clock):
+    verifier.refresh_certs()
+    fetch_certs.certs = {'key1': PUBLIC_PEM, 'key2': PUBLIC_PEM}
+
+    # refreshed at most once a minute
+    clock.now += 30
+    with pytest.raises(push_auth.AuthenticationError):
+        verifier.verify(_token(key_id='key2'))
+    _wait_for_refresh(verifier)
+    assert fetch_certs.calls == 1
+
+    clock.now += 60
+    with pytest.raises(push_auth.AuthenticationError):
+        verifier.verify(_token(key_id='key2'))
+    _wait_for_refresh(verifier)
+    assert fetch_certs.calls == 2
+    assert verifier.verify(_token(key_id='key2'))['email'] == SERVICE_ACCOUNT_EMAIL
+
+
+def test_old_certs_are_refreshed_in_background(verifier, fetch_certs, clock):
+    verifier.refresh_certs()
+
+    clock.now += 3600
+    verifier.verify(_token())
+    _wait_for_refresh(verifier)
+
+    assert fetch_certs.calls == 2
+
+
+def test_failed_background_refresh_keeps_certs(verifier, certs, clock):
+    verifier.refresh_certs()
+
+    def fail():
+        raise push_auth.CertsFetchError('unavailable')
+
+    certs._fetch_certs = fail  # pylint: disable=protected-access
+    clock.now += 3600
+    verifier.verify(_token())
+    _wait_for_refresh(verifier)
+
+    assert verifier.verify(_token(sub='other'))['sub'] == 'other'
+
+
+def test_verifier_needs_audience_and_service_account():
+    with pytest.raises(push_auth.Error):
+        push_auth.PushTokenVerifier(AUDIENCE, None)
+
+
+def test_from_config():
+    verifier = push_auth.from_config({'PUSH_AUTH_AUDIENCE': AUDIENCE,
+                                      'PUSH_AUTH_SERVICE_ACCOUNT_EMAIL': SERVICE_ACCOUNT_EMAIL,
+                                      'PUSH_AUTH_MAX_CACHED_TOKENS': 10,
+                                      'PUSH_AUTH_CERTS_REFRESH_SECONDS': 60})
+
+    assert isinstance(verifier, push_auth.PushTokenVerifier)
+
+
+def test_from_config_without_push_auth():
+    assert push_auth.from_config({'PUSH_AUTH_AUDIENCE': None,
+                                  'PUSH_AUTH_SERVICE_ACCOUNT_EMAIL': None}) is None
+
+
+@pytest.mark.parametrize('missing_setting',
+                         ['PUSH_AUTH_AUDIENCE', 'PUSH_AUTH_SERVICE_ACCOUNT_EMAIL'])
+def test_from_config_with_missing_setting(missing_setting):
+    config = {'PUSH_AUTH_AUDIENCE': AUDIENCE,
+              'PUSH_AUTH_SERVICE_ACCOUNT_EMAIL': SERVICE_ACCOUNT_EMAIL,
+              'PUSH_AUTH_MAX_CACHED_TOKENS': 10,
+              'PUSH_AUTH_CERTS_REFRESH_SECONDS': 60}
+    config[missing_setting] = None
+
+    with pytest.raises(push_auth.ConfigError, match=f'^{missing_setting} must be set'):
+        push_auth.from_config(config)
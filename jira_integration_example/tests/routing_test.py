@@ -0,0 +1,135 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for Router and DestinationPool in routing.py."""
+
+import threading
+
+import pytest
+
+from utilities import monitoring_notification, routing
+
+
+_ROUTES = [
+    {'policy_names': ['disk policy'], 'resource_types': ['gce_instance'], 'project': 'STOR'},
+    {'user_labels': {'team': 'web'}, 'project': 'WEB',
+     'jira_url': 'https://web.example.com'},
+    {'policy_names': ['disk policy', 'db policy'], 'project': 'DATA'},
+]
+
+
+def _incident(policy_name, resource_type='gce_instance', user_labels=None):
+    return monitoring_notification.Incident(
+        '0.abcdef123456', monitoring_notification.IncidentState.OPEN,
+        policy_name=policy_name, resource_type=resource_type, policy_user_labels=user_labels)
+
+
+def test_match():
+    router = routing.Router(_ROUTES)
+
+    assert router.match(_incident('disk policy')) == routing.Destination(None, 'STOR')
+    assert router.match(_incident('disk policy', 'cloudsql_database')) == (
+        routing.Destination(None, 'DATA'))
+    assert router.match(_incident('db policy', user_labels={'team': 'web'})) == (
+        routing.Destination('https://web.example.com', 'WEB'))
+    assert router.match(_incident('other policy', user_labels={'team': 'web'})) == (
+        routing.Destination('https://web.example.com', 'WEB'))
+    assert router.match(_incident('other policy', user_labels={'team': 'db'})) is None
+
+
+def test_match_without_optional_fields():
+    router = routing.Router(_ROUTES)
+    incident = monitoring_notification.parse({'incident': {'state': 'open'}}).incident
+
+    assert router.match(incident) is None
+
+
+def test_projects():
+    router = routing.Router(_ROUTES)
+
+    assert router.projects() == {'STOR', 'DATA'}
+    assert router.projects('https://web.example.com') == {'WEB'}
+
+
+@pytest.mark.parametrize('route', [
+    {'policy_names': ['disk policy']},
+    {'project': 'STOR', 'policy_name': 'disk policy'},
+    {'project': 'STOR', 'policy_names': 'disk policy'},
+    {'project': 'STOR', 'user_labels': ['team']},
+    'STOR',
+])
+def test_invalid_route(route):
+    with pytest.raises(routing.RouteError):
+        routing.Router([route])
+
+
+def test_destination_pool():
+    created = []
+
+    def create_clients(jira_url):
+        created.append(jira_url)
+        return object()
+
+    pool = routing.DestinationPool(create_clients, max_size=2)
+
+    clients_a = pool.get('a')
+    pool.get('b')
+    assert pool.get('a') is clients_a
+    pool.get('c')  # drops b, the least recently used
+
+    assert len(pool) == 2
+    assert pool.get('a') is clients_a
+    pool.get('b')
+    assert created == ['a', 'b', 'c', 'b']
+
+
+def test_destination_pool_creates_clients_outside_its_lock():
+    slow_server_creating = threading.Event()
+    slow_server_released = threading.Event()
+
+    def create_clients(jira_url):
+        if jira_url == 'slow':
+            slow_server_creating.set()
+            slow_server_released.wait(5)
+        return jira_url
+
+    pool = routing.DestinationPool(create_clients, max_size=2)
+    slow_get = threading.Thread(target=pool.get, args=('slow',))
+    slow_get.start()
+    slow_server_creating.wait(5)
+
+    # another server is not held up by the slow one
+    assert pool.get('fast') == 'fast'
+    slow_server_released.set()
+    slow_get.join()
+    assert pool.get('slow') == 'slow'
+
+
+def test_destination_pool_keeps_first_clients_created_concurrently():
+    pool = None
+    created = []
+
+    def create_clients(jira_url):
+        clients = object()
+        created.append(clients)
+        if len(created) == 1:
+            # another thread creates and pools the clients meanwhile
+            pool.get(jira_url)
+        return clients
+
+    pool = routing.DestinationPool(create_clients, max_size=2)
+
+    assert pool.get('a') is created[1]
+    assert pool.get('a') is created[1]
+    assert len(created) == 2
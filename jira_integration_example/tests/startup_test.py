@@ -0,0 +1,93 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Regression tests for the cold start of main.py.
+
+Each test imports main in a fresh interpreter, since the modules imported
+by the other tests are already loaded in the pytest process.
+"""
+
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import main
+from utilities import jira_notification_handler
+
+
+# heavy packages that must not be imported before they are first used
+DEFERRED_MODULES = ['jira', 'google.cloud.secretmanager', 'google.auth',
+                    'requests', 'oauthlib', 'cryptography']
+
+
+def _load_gunicorn_conf():
+    app_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    spec = importlib.util.spec_from_file_location(
+        'gunicorn_conf', os.path.join(app_directory, 'gunicorn.conf.py'))
+    gunicorn_conf = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(gunicorn_conf)
+    return gunicorn_conf
+
+
+def _modules_loaded_after(statements):
+    script = (f'import json, sys\n{statements}\n'
+              f'print(json.dumps([name for name in {DEFERRED_MODULES!r} if name in sys.modules]))')
+    app_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output([sys.executable, '-c', script], cwd=app_directory,
+                                     env=dict(os.environ, FLASK_APP_ENV='test'),
+                                     universal_newlines=True)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_import_main_defers_heavy_modules():
+    assert _modules_loaded_after('import main') == []
+
+
+def test_jira_is_imported_when_the_first_jira_library_client_is_created():
+    # the client fails to reach the invalid URL once the jira package is imported
+    statements = ('import main\n'
+                  'from utilities import jira_auth\n'
+                  'try:\n'
+                  "    main._create_jira_library_client({'JIRA_URL': 'invalid-url'},\n"
+                  "                                     jira_auth.BearerAuth('test-token'))\n"
+                  'except Exception:\n'
+                  '    pass')
+    # the jira package imports requests itself
+    assert _modules_loaded_after(statements) == ['jira', 'requests']
+
+
+def test_jira_client_errors_do_not_import_jira():
+    # the slim client imports requests itself
+    assert _modules_loaded_after('import main; main._jira_client_errors()') == ['requests']
+
+
+def test_worker_fails_to_boot_if_issues_cannot_be_created(mocker):
+    mocker.patch.object(main, 'init_worker_clients', side_effect=(
+        jira_notification_handler.IssueMetadataError('Jira project PROJ does not exist')))
+
+    with pytest.raises(SystemExit) as e:
+        _load_gunicorn_conf().post_fork(mocker.Mock(), mocker.Mock())
+    assert e.value.code == 3
+
+
+def test_worker_boots_if_clients_cannot_connect(mocker):
+    mocker.patch.object(main, 'init_worker_clients', side_effect=ConnectionError('refused'))
+    server = mocker.Mock()
+
+    _load_gunicorn_conf().post_fork(server, mocker.Mock())
+    server.log.warning.assert_called_once()
@@ -0,0 +1,75 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for TtlCache in ttl_cache.py."""
+
+from utilities import ttl_cache
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_set_and_pop():
+    cache = ttl_cache.TtlCache(max_size=10, ttl_seconds=60)
+    cache.set('a', 1)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.pop('a') == 1
+    assert cache.pop('a', 'missing') == 'missing'
+    assert len(cache) == 0
+
+
+def test_entries_expire():
+    clock = _FakeClock()
+    cache = ttl_cache.TtlCache(max_size=10, ttl_seconds=60, clock=clock)
+    cache.set('a', 1)
+    clock.now = 30
+    cache.set('b', 2)
+
+    clock.now = 60
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+
+    clock.now = 90
+    assert cache.pop('b') is None
+    assert len(cache) == 0
+
+
+def test_setting_a_key_again_renews_it():
+    clock = _FakeClock()
+    cache = ttl_cache.TtlCache(max_size=10, ttl_seconds=60, clock=clock)
+    cache.set('a', 1)
+    clock.now = 50
+    cache.set('a', 2)
+
+    clock.now = 100
+    assert cache.get('a') == 2
+
+
+def test_oldest_entries_are_evicted_when_full():
+    cache = ttl_cache.TtlCache(max_size=2, ttl_seconds=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.set('c', 3)
+
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    assert cache.get('c') == 3
+    assert len(cache) == 2
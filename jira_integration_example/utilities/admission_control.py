@@ -0,0 +1,162 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Admission control for deliveries to a third party service.
+
+When the third party service slows down, letting every Pub/Sub push wait
+for a free worker only piles up requests until Pub/Sub's deadline expires,
+after which Pub/Sub retries them and adds even more load. Instead, the
+AdmissionController keeps a limit on the number of deliveries in flight and
+refuses deliveries over that limit right away, so the service can answer
+with a retryable status (429) and Pub/Sub's push flow control slows down.
+
+The limit adapts to the latency of the deliveries (additive increase,
+multiplicative decrease): it shrinks while deliveries are slower than the
+target latency and grows back, up to the configured maximum, while they
+are faster.
+
+Typical usage example:
+
+  admission = AdmissionController(max_in_flight=8, target_latency_seconds=5)
+
+  try:
+      with admission.admit():
+          deliver(notification)
+  except OverloadedError:
+      return ('Service is overloaded', 429)
+"""
+
+import collections
+import threading
+import time
+
+
+class Error(Exception):
+    """Base class for all errors raised in this module."""
+
+
+class OverloadedError(Error):
+    """Raised when a delivery is refused because the limit is reached."""
+
+
+# factor the limit is multiplied by after a delivery slower than the target
+_DECREASE_FACTOR = 0.9
+# weight of the latest latency in the moving average of latencies
+_LATENCY_SMOOTHING = 0.2
+
+_Bounds = collections.namedtuple('_Bounds', ['min_in_flight', 'max_in_flight',
+                                             'target_latency_seconds'])
+
+
+class _Admission:
+    """Context manager that counts an admitted delivery until it completes."""
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._start = None
+
+
+    def __enter__(self):
+        self._start = self._controller._admit()  # pylint: disable=protected-access
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._controller._complete(self._start)  # pylint: disable=protected-access
+        return False
+
+
+class AdmissionController:
+    """Limits deliveries in flight based on their latency.
+
+    Attributes:
+        max_in_flight: The upper bound of the limit.
+        target_latency_seconds: The delivery latency above which the limit
+            is decreased.
+        min_in_flight: The lower bound of the limit.
+        limit: The current number of deliveries allowed in flight.
+        in_flight: The number of deliveries currently in flight.
+        average_latency_seconds: The moving average of delivery latencies.
+    """
+
+    def __init__(self, max_in_flight, target_latency_seconds, min_in_flight=1,
+                 clock=time.monotonic):
+        self._bounds = _Bounds(min_in_flight, max_in_flight, target_latency_seconds)
+        self._clock = clock
+        self._limit = float(max_in_flight)
+        self._in_flight = 0
+        self._average_latency_seconds = 0.0
+        self._lock = threading.Lock()
+
+
+    @property
+    def max_in_flight(self):
+        return self._bounds.max_in_flight
+
+
+    @property
+    def target_latency_seconds(self):
+        return self._bounds.target_latency_seconds
+
+
+    @property
+    def min_in_flight(self):
+        return self._bounds.min_in_flight
+
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+
+    @property
+    def average_latency_seconds(self):
+        return self._average_latency_seconds
+
+
+    def admit(self):
+        """Returns a context manager that admits a delivery while it runs.
+
+        Raises:
+            OverloadedError: When entered while the limit is reached.
+        """
+        return _Admission(self)
+
+
+    def _admit(self):
+        with self._lock:
+            if self._in_flight >= int(self._limit):
+                raise OverloadedError(
+                    f'Service is overloaded ({self._in_flight} deliveries in flight, '
+                    f'average latency {self._average_latency_seconds:.2f}s)')
+            self._in_flight += 1
+        return self._clock()
+
+
+    def _complete(self, start):
+        latency = self._clock() - start
+        with self._lock:
+            self._in_flight -= 1
+            self._average_latency_seconds += _LATENCY_SMOOTHING * (
+                latency - self._average_latency_seconds)
+
+            if latency > self._bounds.target_latency_seconds:
+                self._limit = max(self._bounds.min_in_flight, self._limit * _DECREASE_FACTOR)
+            else:
+                self._limit = min(self._bounds.max_in_flight, self._limit + 1 / self._limit)
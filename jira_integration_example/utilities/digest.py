@@ -0,0 +1,244 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Collects the notifications of low priority policies into digests.
+
+Instead of one Jira issue per notification, the notifications of the
+policies configured for the digest are collected and reported together,
+once enough of them were collected or the digest interval passed.
+
+Collected notifications are appended to a spool file until they are
+reported, so they survive a restart of the process. Each process claims
+its own spool file in the spool directory with an exclusive file lock, and
+a process that starts after another one died takes over the spool file
+(and the notifications) it left behind.
+
+Typical usage example:
+
+  digest = Digest(policy_names=['low priority policy'], interval_seconds=3600,
+                  max_entries=500, spool_directory='/tmp/monitoring_digest')
+
+  if digest.accepts(policy_name):
+      digest.add(entry)
+
+  entries = digest.take_due()
+  if entries:
+      try:
+          report(entries)
+      except Exception:
+          digest.restore()
+          raise
+      digest.commit()
+"""
+
+import collections
+import fcntl
+import json
+import os
+import threading
+import time
+
+
+class Error(Exception):
+    """Base class for all errors raised in this module."""
+
+
+class DigestFullError(Error):
+    """Raised when an entry is added to a digest that is full."""
+
+
+_Settings = collections.namedtuple('_Settings', ['policy_names', 'interval_seconds',
+                                                 'max_entries', 'spool_directory'])
+
+
+class _Spool:
+    """An append-only file of entries, exclusively owned by this process."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        slot = 0
+        while True:
+            lock_fd = os.open(os.path.join(directory, f'digest-{slot}.lock'),
+                              os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o666)
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                os.close(lock_fd)
+                slot += 1
+        # the lock is held until the process exits
+        self._lock_fd = lock_fd
+        self._path = os.path.join(directory, f'digest-{slot}.jsonl')
+
+
+    @property
+    def path(self):
+        return self._path
+
+
+    def load(self):
+        """Returns the entries left in the spool file by a previous process."""
+        try:
+            with open(self._path) as spool_file:
+                lines = spool_file.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # the last line is incomplete if the process died while writing it
+                pass
+        return entries
+
+
+    def append(self, entry):
+        with open(self._path, 'a') as spool_file:
+            spool_file.write(json.dumps(entry) + '\n')
+
+
+    def rewrite(self, entries):
+        temporary_path = self._path + '.tmp'
+        with open(temporary_path, 'w') as spool_file:
+            spool_file.writelines(json.dumps(entry) + '\n' for entry in entries)
+        os.replace(temporary_path, self._path)
+
+
+class Digest:
+    """Collects entries until they are due to be reported.
+
+    Attributes:
+        policy_names: The names of the alerting policies whose notifications
+            are collected.
+        interval_seconds: The time in seconds after which collected entries
+            are due, counted from the first entry collected.
+        max_entries: The number of collected entries at which they are due.
+            At most twice as many entries are kept when reporting fails.
+        size: The number of entries collected and not yet reported.
+    """
+
+    def __init__(self, policy_names, interval_seconds, max_entries, spool_directory, *,
+                 clock=time.monotonic):
+        self._settings = _Settings(frozenset(policy_names), interval_seconds, max_entries,
+                                   spool_directory)
+        self._clock = clock
+        self._spool = None
+        self._pending = []
+        self._taken = None
+        self._first_pending_time = None
+        self._lock = threading.Lock()
+
+
+    @property
+    def policy_names(self):
+        return self._settings.policy_names
+
+
+    @property
+    def interval_seconds(self):
+        return self._settings.interval_seconds
+
+
+    @property
+    def max_entries(self):
+        return self._settings.max_entries
+
+
+    @property
+    def size(self):
+        with self._lock:
+            self._open_spool()
+            return len(self._pending) + len(self._taken or [])
+
+
+    def accepts(self, policy_name):
+        """Returns whether notifications of a policy are collected."""
+        return policy_name in self._settings.policy_names
+
+
+    def add(self, entry):
+        """Collects a JSON serializable entry.
+
+        Raises:
+            DigestFullError: If the entries could not be reported for so long
+                that the digest is full.
+        """
+        with self._lock:
+            self._open_spool()
+            unreported = len(self._pending) + len(self._taken or [])
+            if unreported >= 2 * self._settings.max_entries:
+                raise DigestFullError(f'Digest is full with {unreported} unreported entries')
+            self._spool.append(entry)
+            self._pending.append(entry)
+            if self._first_pending_time is None:
+                self._first_pending_time = self._clock()
+
+
+    def take_due(self, force=False):
+        """Takes the collected entries to report, if they are due.
+
+        Entries are due once max_entries were collected or interval_seconds
+        passed since the first of them was collected. The taken entries must
+        be committed once reported, or restored if reporting fails.
+
+        Args:
+            force: Whether to take the collected entries even if they are
+                not due yet (e.g. at shutdown).
+
+        Returns:
+            The list of taken entries, or None if no entries are due or
+            other taken entries are still being reported.
+        """
+        with self._lock:
+            self._open_spool()
+            if self._taken is not None or not self._pending:
+                return None
+
+            if not (force or len(self._pending) >= self._settings.max_entries
+                    or self._clock() - self._first_pending_time
+                    >= self._settings.interval_seconds):
+                return None
+
+            self._taken = self._pending
+            self._pending = []
+            self._first_pending_time = None
+            return list(self._taken)
+
+
+    def commit(self):
+        """Forgets the taken entries, once they are reported."""
+        with self._lock:
+            self._taken = None
+            self._spool.rewrite(self._pending)
+
+
+    def restore(self):
+        """Returns the taken entries to the collected ones, if reporting failed."""
+        with self._lock:
+            self._pending = self._taken + self._pending
+            self._taken = None
+            if self._first_pending_time is None:
+                self._first_pending_time = self._clock()
+
+
+    def _open_spool(self):
+        # the spool is opened by the first process that uses the digest, so
+        # that a preloading gunicorn master does not hold the lock of a spool
+        if self._spool is None:
+            self._spool = _Spool(self._settings.spool_directory)
+            self._pending = self._spool.load()
+            if self._pending:
+                self._first_pending_time = self._clock()
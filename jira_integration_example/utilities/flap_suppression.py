@@ -0,0 +1,117 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Folds the incidents of a flapping alerting policy into one Jira issue.
+
+A noisy policy can open and close incidents for the same condition and
+resource many times an hour, and each open would create a new Jira issue.
+The FlapSuppressor keeps an index of the issues closed recently, keyed by
+policy, condition and resource. When an incident opens within the debounce
+window of its policy after such an issue was closed, the handler reopens
+and comments on that issue instead of creating another one.
+
+Typical usage example:
+
+  flap_suppressor = FlapSuppressor(default_window_seconds=900,
+                                   policy_window_seconds={'noisy policy': 3600},
+                                   max_incidents=10000, reopen_status='To Do')
+
+  # when the issue of an incident is closed
+  flap_suppressor.record_close(incident, issue_key)
+
+  # when an incident opens
+  issue_key = flap_suppressor.pop_recent_issue(incident)
+"""
+
+import time
+
+from utilities import ttl_cache
+
+
+class FlapSuppressor:
+    """Remembers recently closed issues for the debounce window of their policy.
+
+    Attributes:
+        default_window_seconds: The debounce window of policies that are not
+            in policy_window_seconds. 0 disables the suppression for them.
+        policy_window_seconds: A dictionary mapping policy names to their
+            debounce windows in seconds.
+        reopen_status: The status to transition a reused issue to.
+    """
+
+    def __init__(self, default_window_seconds, policy_window_seconds, max_incidents,
+                 reopen_status, *, clock=time.monotonic):
+        self._default_window_seconds = default_window_seconds
+        self._policy_window_seconds = dict(policy_window_seconds)
+        self._reopen_status = reopen_status
+        self._clock = clock
+        longest_window_seconds = max([default_window_seconds,
+                                      *self._policy_window_seconds.values()])
+        # flap key -> (issue key, time the issue was closed)
+        self._closed_issues = ttl_cache.TtlCache(max_incidents, longest_window_seconds,
+                                                 clock=clock)
+
+
+    @property
+    def default_window_seconds(self):
+        return self._default_window_seconds
+
+
+    @property
+    def policy_window_seconds(self):
+        return dict(self._policy_window_seconds)
+
+
+    @property
+    def reopen_status(self):
+        return self._reopen_status
+
+
+    def window_seconds(self, policy_name):
+        """Returns the debounce window of a policy in seconds."""
+        return self._policy_window_seconds.get(policy_name, self._default_window_seconds)
+
+
+    def record_close(self, incident, issue):
+        """Remembers that the issue of an incident was closed just now."""
+        key = _flap_key(incident)
+        if key is not None and self.window_seconds(incident.policy_name) > 0:
+            self._closed_issues.set(key, (str(issue), self._clock()))
+
+
+    def pop_recent_issue(self, incident):
+        """Returns (and forgets) the issue to reuse for an opening incident.
+
+        Returns:
+            The key of the issue closed for the same policy, condition and
+            resource within the policy's debounce window, or None.
+        """
+        key = _flap_key(incident)
+        if key is None:
+            return None
+
+        entry = self._closed_issues.pop(key)
+        if entry is None:
+            return None
+
+        issue, closed_at = entry
+        if self._clock() - closed_at >= self.window_seconds(incident.policy_name):
+            return None
+        return issue
+
+
+def _flap_key(incident):
+    if incident.policy_name is None:
+        return None
+    return (incident.policy_name, incident.condition_name, incident.resource_name)
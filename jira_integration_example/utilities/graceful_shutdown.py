@@ -0,0 +1,177 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tracks in-flight deliveries so that a process can shut down gracefully.
+
+Cloud Run sends SIGTERM before it stops an instance and SIGKILL a few
+seconds later. Once a shutdown begins, new deliveries are refused before
+they make any third party call (Pub/Sub then redelivers them to another
+instance), deliveries already in flight are given until the end of the
+grace period to finish, and registered flush callbacks (e.g. for spooled
+work or metrics) run before the logs are flushed.
+
+Typical usage example:
+
+  shutdown = GracefulShutdown(grace_period_seconds=8)
+
+  try:
+      with shutdown.delivery():
+          deliver(notification)
+  except ShuttingDownError:
+      return ('Service is shutting down', 503)
+
+  # when SIGTERM is received
+  shutdown.begin()
+  shutdown.wait_and_flush()
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Error(Exception):
+    """Base class for all errors raised in this module."""
+
+
+class ShuttingDownError(Error):
+    """Raised when a delivery is started after the shutdown began."""
+
+
+class _Delivery:
+    """Context manager that counts a delivery as in flight while it runs."""
+
+    def __init__(self, shutdown):
+        self._shutdown = shutdown
+
+
+    def __enter__(self):
+        self._shutdown._begin_delivery()  # pylint: disable=protected-access
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._shutdown._end_delivery()  # pylint: disable=protected-access
+        return False
+
+
+class GracefulShutdown:
+    """Counts in-flight deliveries and drains them on shutdown.
+
+    Attributes:
+        grace_period_seconds: The time in seconds, from the start of the
+            shutdown, that in-flight deliveries are given to finish.
+        in_flight: The number of deliveries currently in flight.
+        shutting_down: Whether the shutdown has begun.
+    """
+
+    def __init__(self, grace_period_seconds):
+        self._grace_period_seconds = grace_period_seconds
+        self._in_flight = 0
+        self._deadline = None
+        self._flush_callbacks = []
+        self._condition = threading.Condition()
+
+
+    @property
+    def grace_period_seconds(self):
+        return self._grace_period_seconds
+
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+
+    @property
+    def shutting_down(self):
+        return self._deadline is not None
+
+
+    def delivery(self):
+        """Returns a context manager that tracks a delivery while it runs.
+
+        Raises:
+            ShuttingDownError: When entered after the shutdown began.
+        """
+        return _Delivery(self)
+
+
+    def add_flush_callback(self, callback):
+        """Registers a callable to run once in-flight deliveries are drained.
+
+        Callbacks run in registration order, each receiving the number of
+        seconds left in the grace period.
+        """
+        self._flush_callbacks.append(callback)
+
+
+    def begin(self):
+        """Begins the shutdown: from now on new deliveries are refused."""
+        with self._condition:
+            if self._deadline is None:
+                self._deadline = time.monotonic() + self._grace_period_seconds
+                logger.info('Shutting down with %d deliveries in flight', self._in_flight)
+
+
+    def wait_and_flush(self):
+        """Waits for in-flight deliveries and runs the flush callbacks.
+
+        Begins the shutdown if it has not begun yet. Waits at most until the
+        end of the grace period, then runs the flush callbacks and flushes
+        the handlers of the root logger.
+
+        Returns:
+            The number of deliveries still in flight at the end of the wait.
+            Those deliveries are not acknowledged, so Pub/Sub redelivers them.
+        """
+        self.begin()
+        with self._condition:
+            self._condition.wait_for(lambda: self._in_flight == 0,
+                                     timeout=max(0, self._remaining_seconds()))
+            abandoned = self._in_flight
+
+        if abandoned:
+            logger.warning('Grace period ended with %d deliveries in flight', abandoned)
+
+        for callback in self._flush_callbacks:
+            try:
+                callback(max(0, self._remaining_seconds()))
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Flush callback %r failed during shutdown', callback)
+
+        for handler in logging.getLogger().handlers:
+            handler.flush()
+
+        return abandoned
+
+
+    def _remaining_seconds(self):
+        return self._deadline - time.monotonic()
+
+
+    def _begin_delivery(self):
+        with self._condition:
+            if self._deadline is not None:
+                raise ShuttingDownError('Service is shutting down')
+            self._in_flight += 1
+
+
+    def _end_delivery(self):
+        with self._condition:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._condition.notify_all()
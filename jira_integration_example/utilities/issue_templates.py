@@ -0,0 +1,188 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Templates for the summary and description of the Jira issues created.
+
+Templates use the str.format syntax, with the fields of the incident of a
+monitoring notification as replacement fields. Nested fields are joined
+with dots, e.g. '{documentation.content}' or '{policy_user_labels.team}'.
+Fields missing from an incident render as an empty string, lists render
+as their items separated by commas.
+
+Templates are parsed once, when the IssueTemplates are created (i.e. when
+the app is created), into a tuple of literal texts and field paths, so
+rendering one only looks up its fields and joins the pieces. A rendered
+text over its maximum length stops taking pieces once it is too long (so
+a huge field is not copied in full) and is truncated at a word boundary.
+
+Typical usage example:
+
+  issue_templates = IssueTemplates(
+      summary_template='{condition_name} - {resource_name}',
+      description_template='{summary}\\nSee: {url}',
+      policy_templates={'disk policy': {'summary': '[{severity}] {condition_name}'}},
+      max_summary_length=255, max_description_length=32767)
+
+  summary, description = issue_templates.render(policy_name, incident_data)
+"""
+
+import string
+
+
+# ends the texts cut by truncate
+TRUNCATION_MARKER = '... [truncated]'
+
+
+class Error(Exception):
+    """Base class for all errors raised in this module."""
+
+
+class TemplateError(Error):
+    """Exception raised when a template cannot be parsed."""
+
+
+class _Template:
+    """A parsed template."""
+
+    __slots__ = ('_parts',)
+
+    def __init__(self, template):
+        parts = []
+        try:
+            for literal, field_name, format_spec, conversion in string.Formatter().parse(
+                    template):
+                if field_name is None:
+                    parts.append((literal, ()))
+                    continue
+                if not field_name or field_name[0].isdigit():
+                    raise TemplateError(f'Template "{template}" must name its fields')
+                if format_spec or conversion:
+                    raise TemplateError(f'Template field {{{field_name}}} of "{template}" '
+                                        'cannot have a conversion or format spec')
+                parts.append((literal, tuple(field_name.split('.'))))
+        except ValueError as e:
+            raise TemplateError(f'Template "{template}" cannot be parsed: {e}') from e
+        self._parts = tuple(parts)
+
+
+    def render(self, incident_data, max_length=None):
+        """Returns the template filled in with the fields of an incident.
+
+        The text is truncated to max_length characters, unless it is None.
+        """
+        pieces = []
+        length = 0
+        for literal, path in self._parts:
+            if literal:
+                pieces.append(literal)
+                length += len(literal)
+            if path:
+                pieces.append(_field_text(incident_data, path))
+                length += len(pieces[-1])
+            if max_length is not None and length > max_length:
+                break
+        return truncate(''.join(pieces), max_length)
+
+
+def truncate(text, max_length):
+    """Returns a text cut to at most max_length characters.
+
+    A text that is too long is cut at the last whitespace of its kept part
+    (unless that would drop more than a fifth of it) and ends with the
+    TRUNCATION_MARKER.
+
+    Args:
+        text: The text to truncate.
+        max_length: The maximum length of the text, or None for no limit.
+
+    Returns:
+        The text, or its truncated start.
+    """
+    if max_length is None or len(text) <= max_length:
+        return text
+    end = max_length - len(TRUNCATION_MARKER)
+    if end <= 0:
+        return text[:max_length]
+    boundary = max(text.rfind(' ', 0, end + 1), text.rfind('\n', 0, end + 1))
+    if boundary >= end - end // 5:
+        end = boundary
+    return text[:end].rstrip() + TRUNCATION_MARKER
+
+
+def _field_text(incident_data, path):
+    value = incident_data
+    for key in path:
+        if not isinstance(value, dict):
+            return ''
+        value = value.get(key)
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return ', '.join(str(item) for item in value)
+    return str(value)
+
+
+class IssueTemplates:
+    """The summary and description templates of each alerting policy.
+
+    Attributes:
+        summary_template: The summary template of policies without their own.
+        description_template: The description template of policies without
+            their own.
+        policy_templates: A dictionary mapping policy names to a dictionary
+            with their own 'summary' and/or 'description' templates.
+        max_summary_length: The length summaries are truncated to, or None.
+        max_description_length: The length descriptions are truncated to,
+            or None.
+    """
+
+    def __init__(self, summary_template, description_template, policy_templates=None, *,
+                 max_summary_length=None, max_description_length=None):
+        """Parses the templates.
+
+        Raises:
+            TemplateError: If a template cannot be parsed, or a policy
+                template is not 'summary' or 'description'.
+        """
+        self._max_lengths = (max_summary_length, max_description_length)
+        self._default = (_Template(summary_template), _Template(description_template))
+        self._by_policy = {}
+        for policy_name, templates in (policy_templates or {}).items():
+            unknown_templates = set(templates) - {'summary', 'description'}
+            if unknown_templates:
+                raise TemplateError(f'Unknown templates {sorted(unknown_templates)} for '
+                                    f'policy {policy_name}')
+            self._by_policy[policy_name] = (
+                _Template(templates['summary']) if 'summary' in templates else self._default[0],
+                _Template(templates['description']) if 'description' in templates
+                else self._default[1])
+
+
+    def render(self, policy_name, incident_data):
+        """Renders the summary and description of the issue of an incident.
+
+        Args:
+            policy_name: The name of the alerting policy of the incident.
+            incident_data: The 'incident' dictionary of the notification.
+
+        Returns:
+            A tuple of the summary and the description.
+        """
+        summary_template, description_template = self._by_policy.get(policy_name,
+                                                                     self._default)
+        max_summary_length, max_description_length = self._max_lengths
+        return (summary_template.render(incident_data, max_summary_length),
+                description_template.render(incident_data, max_description_length))
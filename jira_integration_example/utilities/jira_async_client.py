@@ -0,0 +1,258 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Jira REST API Documentation: https://docs.atlassian.com/software/jira/docs/api/REST/8.5.0/
+
+"""Asynchronous client for the subset of the Jira REST API used by this app.
+
+The client mirrors the JIRA methods used by jira_notification_handler
+(create_issue, search_issues and transition_issue) as coroutines, and
+sends its requests through an aiohttp ClientSession that is meant to be
+shared, so that all concurrent deliveries reuse one connection pool.
+Requests are authenticated by an auth strategy of jira_auth.py.
+"""
+
+import asyncio
+import json
+import urllib.parse
+
+import aiohttp
+
+from utilities import jira_bulk_create
+
+
+class Error(Exception):
+    """Base class for all errors raised in this module."""
+
+
+class JiraRequestError(Error):
+    """Exception raised when a Jira REST API request fails or is rejected."""
+
+
+class AsyncJiraClient:
+    """Client for interacting with a Jira server from asyncio code.
+
+    Attributes:
+        server_url: The base URL of the Jira server.
+        session: The aiohttp ClientSession used to send requests.
+        auth: The jira_auth strategy (e.g. a jira_auth.OAuth1Auth) that
+            authenticates requests.
+    """
+
+    def __init__(self, server_url, session, auth):
+        self._server_url = server_url.rstrip('/')
+        self._session = session
+        self._auth = auth
+
+
+    async def create_issue(self, fields=None, **fieldargs):
+        """Creates an issue and returns its key.
+
+        Args:
+            fields: A dictionary of issue fields. If omitted, the keyword
+                arguments are used as the fields instead. A 'project' given
+                as a string is treated as the project key.
+
+        Returns:
+            The key of the created issue.
+        """
+        fields = dict(fields or fieldargs)
+        if isinstance(fields.get('project'), str):
+            fields['project'] = {'key': fields['project']}
+
+        response = await self._request('POST', '/rest/api/2/issue', body={'fields': fields})
+        return response['key']
+
+
+    async def create_issues(self, field_list):
+        """Creates issues with one request to the bulk create endpoint.
+
+        Args:
+            field_list: A list of dictionaries of issue fields, as given to
+                create_issue.
+
+        Returns:
+            A list with a dictionary for each fields dictionary, in the same
+            order. Like the result of JIRA.create_issues, each has a 'status'
+            of 'Success' or 'Error', the 'issue' key (None on error) and the
+            'error' (None on success).
+
+        Raises:
+            JiraRequestError: If the request fails, other than with the
+                results of the bulk create.
+        """
+        issue_updates = []
+        for fields in field_list:
+            fields = dict(fields)
+            if isinstance(fields.get('project'), str):
+                fields['project'] = {'key': fields['project']}
+            issue_updates.append({'fields': fields})
+
+        # Jira answers with a 400 status (and the same body) if no issue was created
+        response = await self._request('POST', '/rest/api/2/issue/bulk',
+                                       body={'issueUpdates': issue_updates},
+                                       accepted_error_status=400)
+        try:
+            return jira_bulk_create.bulk_create_results(field_list, response)
+        except jira_bulk_create.Error as e:
+            raise JiraRequestError(str(e)) from e
+
+
+    async def search_issues(self, jql_str, max_results=50, fields='status',
+                            json_result=False):
+        """Searches for issues with a JQL query and returns their keys.
+
+        Args:
+            jql_str: The JQL query.
+            max_results: The maximum number of issues to return, or False to
+                return all of them (fetching as many pages as needed).
+            fields: A comma separated string of the issue fields to return.
+            json_result: Whether to return the issues as returned by Jira
+                (dictionaries with a 'key' and the requested 'fields').
+
+        Returns:
+            A list of the keys of the matching issues, or a list of issue
+            dictionaries if json_result is set.
+        """
+        page_size = 100 if max_results is False else max_results
+        issues = []
+        async for issue in self.iter_issues(jql_str, fields=fields, page_size=page_size):
+            issues.append(issue)
+            if max_results is not False and len(issues) >= max_results:
+                break
+
+        if json_result:
+            return issues
+        return [issue['key'] for issue in issues]
+
+
+    async def iter_issues(self, jql_str, fields='status', page_size=100):
+        """Yields all the issues matching a JQL query, fetching them page by page.
+
+        Args:
+            jql_str: The JQL query.
+            fields: A comma separated string of the issue fields to return.
+            page_size: The number of issues fetched with each request.
+
+        Yields:
+            The issue dictionaries returned by Jira, with a 'key' and the
+            requested 'fields'.
+        """
+        start_at = 0
+        while True:
+            response = await self._request('GET', '/rest/api/2/search',
+                                           params={'jql': jql_str, 'startAt': start_at,
+                                                   'maxResults': page_size,
+                                                   'fields': fields})
+            for issue in response['issues']:
+                yield issue
+            start_at += len(response['issues'])
+            if not response['issues'] or start_at >= response['total']:
+                return
+
+
+    # the arguments are named like those of JIRA.createmeta
+    async def createmeta(self, projectKeys=None, projectIds=None,  # pylint: disable=invalid-name
+                         issuetypeNames=None, expand=None):
+        """Gets the metadata for creating issues in projects.
+
+        Args:
+            projectKeys: A key or list of keys of the projects to return.
+            projectIds: A list of ids of the projects to return.
+            issuetypeNames: A name or list of names of the issue types to return.
+            expand: The parts of the metadata to expand (e.g.
+                'projects.issuetypes.fields').
+
+        Returns:
+            The createmeta dictionary returned by Jira, with a list of
+            'projects' and their 'issuetypes'.
+        """
+        params = {}
+        for name, value in (('projectKeys', projectKeys), ('projectIds', projectIds),
+                            ('issuetypeNames', issuetypeNames), ('expand', expand)):
+            if value:
+                params[name] = value if isinstance(value, str) else ','.join(map(str, value))
+        return await self._request('GET', '/rest/api/2/issue/createmeta', params=params)
+
+
+    async def transition_issue(self, issue, transition):
+        """Transitions an issue using the name of a transition.
+
+        Args:
+            issue: The key of the issue to transition.
+            transition: The name of the transition (or of its target status).
+
+        Raises:
+            JiraRequestError: If the issue has no such transition or a
+                request fails.
+        """
+        path = f'/rest/api/2/issue/{issue}/transitions'
+        response = await self._request('GET', path)
+
+        transition_id = None
+        for available_transition in response['transitions']:
+            if available_transition['name'].lower() == transition.lower():
+                transition_id = available_transition['id']
+                break
+        if transition_id is None:
+            raise JiraRequestError(f'Invalid transition name {transition} for issue {issue}')
+
+        await self._request('POST', path, body={'transition': {'id': transition_id}})
+
+
+    async def add_comment(self, issue, body):
+        """Adds a comment to an issue.
+
+        Args:
+            issue: The key of the issue to comment on.
+            body: The text of the comment.
+        """
+        await self._request('POST', f'/rest/api/2/issue/{issue}/comment', body={'body': body})
+
+
+    async def add_label(self, issue, label):
+        """Adds a label to an issue, keeping its other labels.
+
+        Args:
+            issue: The key of the issue to label.
+            label: The label to add.
+        """
+        await self._request('PUT', f'/rest/api/2/issue/{issue}',
+                            body={'update': {'labels': [{'add': label}]}})
+
+
+    async def _request(self, method, path, params=None, body=None, *,
+                       accepted_error_status=None):
+        url = self._server_url + path
+        if params:
+            url = f'{url}?{urllib.parse.urlencode(params)}'
+        url, headers = self._auth.authenticate(method, url)
+
+        data = None
+        if body is not None:
+            data = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+
+        try:
+            async with self._session.request(method, url, data=data,
+                                             headers=headers) as response:
+                text = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise JiraRequestError(f'Jira request {method} {path} failed: {e!r}') from e
+
+        if response.status >= 400 and response.status != accepted_error_status:
+            raise JiraRequestError(
+                f'Jira request {method} {path} failed with status {response.status}: {text}')
+
+        return json.loads(text) if text else None
@@ -0,0 +1,144 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Strategies for authenticating the requests made to Jira.
+
+Each strategy authenticates the requests of the clients in this app
+(through authenticate) and of the jira library (through jira_arguments):
+
+  OAuth1Auth: signs every request with OAuth1 RSA-SHA1 (the default).
+  BasicAuth: sends a username and API token, as Jira Cloud expects.
+  BearerAuth: sends a personal access token, as Jira Server and Data
+      Center 8.14+ accept.
+
+With BasicAuth and BearerAuth, authenticating a request only adds a
+precomputed header, instead of computing an RSA signature.
+
+Typical usage example:
+
+  auth = from_config(app.config)
+  url, headers = auth.authenticate('GET', url)
+"""
+
+import base64
+
+
+# the headers the jira library sends by default, which are replaced (rather
+# than extended) by the headers given in its options
+_JIRA_DEFAULT_HEADERS = {'Cache-Control': 'no-cache',
+                         'Content-Type': 'application/json',
+                         'X-Atlassian-Token': 'no-check'}
+
+
+class Error(Exception):
+    """Base class for all errors raised in this module."""
+
+
+class UnknownAuthModeError(Error):
+    """Exception raised when the configured auth mode is not supported."""
+
+
+class OAuth1Auth:
+    """Signs requests with OAuth1 RSA-SHA1.
+
+    Attributes:
+        oauth: A dictionary with the 'access_token', 'access_token_secret',
+            'consumer_key' and 'key_cert' used to sign requests.
+    """
+
+    def __init__(self, oauth):
+        # imported here, so the other strategies do not import oauthlib and
+        # cryptography
+        from utilities import oauth_signing  # pylint: disable=import-outside-toplevel
+
+        self._oauth = dict(oauth)
+        self._signer = oauth_signing.get_signer(oauth)
+
+
+    def authenticate(self, method, url):
+        """Returns the signed URL and the headers that authenticate a request."""
+        url, headers, _ = self._signer.sign(url, http_method=method)
+        return url, headers
+
+
+    def jira_arguments(self):
+        """Returns the keyword arguments that authenticate a JIRA client."""
+        return {'oauth': dict(self._oauth)}
+
+
+class BasicAuth:
+    """Authenticates requests with a username (or email) and an API token."""
+
+    def __init__(self, username, api_token):
+        self._username = username
+        self._api_token = api_token
+        credentials = base64.b64encode(f'{username}:{api_token}'.encode('utf-8'))
+        self._authorization = 'Basic ' + credentials.decode('ascii')
+
+
+    def authenticate(self, method, url):  # pylint: disable=unused-argument
+        """Returns the URL and the headers that authenticate a request."""
+        return url, {'Authorization': self._authorization}
+
+
+    def jira_arguments(self):
+        """Returns the keyword arguments that authenticate a JIRA client."""
+        return {'basic_auth': (self._username, self._api_token)}
+
+
+class BearerAuth:
+    """Authenticates requests with a personal access token."""
+
+    def __init__(self, token):
+        self._authorization = 'Bearer ' + token
+
+
+    def authenticate(self, method, url):  # pylint: disable=unused-argument
+        """Returns the URL and the headers that authenticate a request."""
+        return url, {'Authorization': self._authorization}
+
+
+    def jira_arguments(self):
+        """Returns the keyword arguments that authenticate a JIRA client."""
+        return {'options': {'headers': dict(_JIRA_DEFAULT_HEADERS,
+                                            Authorization=self._authorization)}}
+
+
+def from_config(config):
+    """Creates the auth strategy selected by JIRA_AUTH_MODE.
+
+    Args:
+        config: A mapping with the uppercase settings of the app (e.g. the
+            Flask config).
+
+    Returns:
+        An OAuth1Auth, BasicAuth or BearerAuth object.
+
+    Raises:
+        UnknownAuthModeError: If JIRA_AUTH_MODE is not 'oauth1', 'basic' or
+            'bearer'.
+    """
+    auth_mode = config['JIRA_AUTH_MODE']
+    if auth_mode == 'oauth1':
+        return OAuth1Auth({'access_token': config['JIRA_ACCESS_TOKEN'],
+                           'access_token_secret': config['JIRA_ACCESS_TOKEN_SECRET'],
+                           'consumer_key': config['JIRA_CONSUMER_KEY'],
+                           'key_cert': config['JIRA_KEY_CERT']})
+    if auth_mode == 'basic':
+        return BasicAuth(config['JIRA_USERNAME'], config['JIRA_API_TOKEN'])
+    if auth_mode == 'bearer':
+        return BearerAuth(config['JIRA_PERSONAL_ACCESS_TOKEN'])
+
+    raise UnknownAuthModeError(
+        f'JIRA_AUTH_MODE must be "oauth1", "basic" or "bearer", not "{auth_mode}"')
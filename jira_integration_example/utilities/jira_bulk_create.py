@@ -0,0 +1,73 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reads the responses of the Jira bulk create endpoint (/rest/api/2/issue/bulk).
+
+Jira answers a bulk create with the created 'issues' and an 'errors' entry
+for each issue that failed, and uses a 400 status for the same body when
+no issue was created. A 400 can also be a generic error (e.g. a malformed
+request), whose body has no such lists, so the body is checked before the
+results are matched to the issues requested. This module is shared by
+jira_rest_client and jira_async_client, and imports neither.
+"""
+
+
+class Error(Exception):
+    """Base class for all errors raised in this module."""
+
+
+class InvalidResponseError(Error):
+    """Exception raised when a response is not a bulk create result."""
+
+
+def bulk_create_results(field_list, response, make_issue=lambda key: key):
+    """Matches the response of the bulk create endpoint to the issues requested.
+
+    Args:
+        field_list: The list of dictionaries of issue fields that were sent.
+        response: The decoded body of the response.
+        make_issue: A callable turning the key of a created issue into the
+            'issue' of its result.
+
+    Returns:
+        A list with a dictionary for each fields dictionary, in the same
+        order. Like the result of JIRA.create_issues, each has a 'status'
+        of 'Success' or 'Error', the 'issue' (None on error), the 'error'
+        (None on success) and the 'input_fields'.
+
+    Raises:
+        InvalidResponseError: If the response does not have the bulk create
+            'issues' and 'errors' lists, or they do not account for every
+            issue requested.
+    """
+    if not (isinstance(response, dict) and isinstance(response.get('issues'), list)
+            and isinstance(response.get('errors'), list)):
+        raise InvalidResponseError(f'Jira bulk create failed: {response}')
+    errors = {error.get('failedElementNumber'): error.get('elementErrors')
+              for error in response['errors']}
+    if (len(response['issues']) + len(errors) != len(field_list)
+            or not errors.keys() <= set(range(len(field_list)))):
+        raise InvalidResponseError(
+            f'Jira bulk create returned results for other issues than requested: {response}')
+
+    created_issues = iter(response['issues'])
+    results = []
+    for index, fields in enumerate(field_list):
+        if index in errors:
+            results.append({'status': 'Error', 'issue': None, 'error': errors[index],
+                            'input_fields': fields})
+        else:
+            results.append({'status': 'Success', 'issue': make_issue(next(created_issues)['key']),
+                            'error': None, 'input_fields': fields})
+    return results
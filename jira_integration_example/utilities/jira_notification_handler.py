@@ -14,29 +14,94 @@
 
 """Module to handle interactions with a Jira server.
 
-This module defines a function to interact with Jira server when a
-monitoring notification occurs. In addition, it defines error
-classes to be used by the function.
+This module defines functions to interact with Jira server when a
+monitoring notification occurs, both with a synchronous JIRA client
+and with an AsyncJiraClient. In addition, it defines error classes
+to be used by the functions.
 """
 
+import collections
 import logging
+
+from utilities import issue_templates, monitoring_notification
+from utilities.monitoring_notification import (IncidentState, NotificationParseError,
+                                               UnknownIncidentStateError)
+
+__all__ = ['Error', 'BulkCreateError', 'IssueMetadataError', 'NotificationParseError',
+           'UnknownIncidentStateError', 'REQUIRED_INCIDENT_FIELDS', 'DigestDestination',
+           'HandlerOptions', 'update_jira_based_on_monitoring_notification',
+           'update_jira_based_on_monitoring_notification_async', 'create_issues_in_bulk',
+           'create_issues_in_bulk_async', 'search_open_issues_in_bulk',
+           'search_open_issues_in_bulk_async', 'flush_digest', 'flush_digest_async',
+           'load_issue_metadata', 'load_issue_metadata_async']
+
 logger = logging.getLogger(__name__)
 
 
 class Error(Exception):
-    """Base class for all errors raised in this module."""
+    """Base class for all errors raised in this module.
+
+    Errors in the format of a notification are raised as the
+    NotificationParseError, UnknownIncidentStateError and
+    UnsupportedVersionError of monitoring_notification (the first two are
+    also available from this module).
+    """
+
+
+class BulkCreateError(Error):
+    """Exception raised when Jira rejects an issue of a bulk create."""
+
+
+class IssueMetadataError(Error):
+    """Exception raised when issues cannot be created in the Jira project as configured."""
+
+
+# the incident fields, besides the state, that notifications must have
+REQUIRED_INCIDENT_FIELDS = ('incident_id', 'condition_name', 'resource_name', 'summary', 'url')
 
+# the fields of an incident collected in a digest
+_DIGEST_ENTRY_FIELDS = ('incident_id', 'state', 'policy_name', 'condition_name',
+                        'resource_name', 'summary', 'url')
 
-class NotificationParseError(Error):
-    """Exception raised for errors in a monitoring notification format."""
+# the issue fields fetched by searches: the keys of the issues are always
+# returned, and the labels map the issues of a batched search to incidents
+_SEARCH_FIELDS = 'labels'
+_SEARCH_PAGE_SIZE = 100
 
+# the type of the issues created, and the fields set when creating them
+_ISSUE_TYPE_NAME = 'Bug'
+_CREATED_FIELDS = ('project', 'issuetype', 'summary', 'description', 'labels')
 
-class UnknownIncidentStateError(Error):
-    """Exception raised for errors in an invalid incident state value."""
+# the fields createmeta may report as required without a default value,
+# which Jira still fills in itself when an issue is created without them
+_JIRA_SET_FIELDS = ('reporter',)
+
+# the longest summary and description (and comment) Jira accepts, which the
+# texts not rendered by IssueTemplates are truncated to
+_MAX_SUMMARY_LENGTH = 255
+_MAX_DESCRIPTION_LENGTH = 32767
+
+# where the digest is reported: a Jira client, the project to create the
+# digest issues in, and the optional TtlCache of its issue metadata
+DigestDestination = collections.namedtuple(
+    'DigestDestination', ['jira_client', 'jira_project', 'issue_metadata_cache'])
+
+# the optional features of the handler, see
+# update_jira_based_on_monitoring_notification
+HandlerOptions = collections.namedtuple(
+    'HandlerOptions', ['incident_locks', 'pending_closes', 'flap_suppressor', 'digest',
+                       'issue_batcher', 'search_batcher', 'issue_metadata_cache',
+                       'issue_templates', 'digest_destination'],
+    defaults=(None,) * 9)
+
+_NO_OPTIONS = HandlerOptions()
+
+# the ids the project key and issue type name resolve to
+_IssueMetadata = collections.namedtuple('_IssueMetadata', ['project_id', 'issue_type_id'])
 
 
 def update_jira_based_on_monitoring_notification(jira_client, jira_project,
-                                                 jira_status, notification):
+                                                 jira_status, notification, options=None):
     """Updates a Jira server based off the data in a monitoring notification.
 
     If the monitoring notification is about an open incident, a new issue (of
@@ -53,50 +118,663 @@ def update_jira_based_on_monitoring_notification(jira_client, jira_project,
             search for Jira issues.
         jira_status: The status to transition issues corresponding to
                     closed incidents to.
-        notification: The dictionary containing the notification data.
+        notification: The monitoring_notification.Notification, or the
+            dictionary containing the notification data.
+        options: An optional HandlerOptions object with the optional
+            features of the handler, which are off when not given:
+
+            incident_locks: An optional KeyedLocks object. If given, notifications
+                of the same incident are handled one at a time, so that a close
+                does not search for the issue while its open is still creating it.
+            pending_closes: An optional TtlCache object. If given, closed incidents
+                without any issue are remembered in it, and the issue of a later
+                open notification of such an incident is transitioned to the
+                specified jira status right after it is created (Pub/Sub does not
+                guarantee the order of the notifications).
+            flap_suppressor: An optional FlapSuppressor object. If given, an
+                incident that opens shortly after an issue was closed for the
+                same policy, condition and resource reopens and comments on that
+                issue instead of creating a new one.
+            digest: An optional Digest object. If given, the notifications of the
+                policies it accepts are collected in it instead, and reported in
+                one issue once they are due (see flush_digest). The digest is
+                reported after the notification is handled, and failing to
+                report it is logged without failing the notification.
+            issue_batcher: An optional MicroBatcher object whose process_batch
+                calls create_issues_in_bulk. If given, issues are created through
+                it, so that issues created at the same time are created with one
+                bulk request.
+            search_batcher: An optional MicroBatcher object whose process_batch
+                calls search_open_issues_in_bulk. If given, the issues of closed
+                incidents are searched for through it, so that the issues of
+                incidents closed at the same time are searched for with one query.
+            issue_metadata_cache: An optional TtlCache object. If given, the ids
+                of the project and issue type are cached in it (see
+                load_issue_metadata), and issues are created with the ids
+                instead of the names, which Jira would resolve for every issue.
+            issue_templates: An optional IssueTemplates object. If given, the
+                summary and description of created issues are rendered with the
+                templates of the incident's policy.
+            digest_destination: An optional DigestDestination to report the
+                digest to. By default it is reported with jira_client in
+                jira_project, which should be given when notifications are
+                routed to several destinations but share one digest.
 
     Raises:
         UnknownIncidentStateError: If the incident state is not open or closed.
         NotificationParseError: If notification is missing required dict key.
         JIRAError: If error occurs when using the jira client
+        BulkCreateError: If Jira rejects the issue created in bulk.
+        IssueMetadataError: If the refreshed metadata of the project shows
+            that issues cannot be created in it.
+        digest.DigestFullError: If the notification is for the digest, but the
+            digest could not be reported for so long that it is full.
     """
 
+    options = options or _NO_OPTIONS
+    incident = _parse_incident(notification)
     try:
-        incident_data = notification['incident']
-        incident_id = incident_data['incident_id']
-        incident_state = incident_data['state']
-        incident_condition_name = incident_data['condition_name']
-        incident_resource_name = incident_data['resource_name']
-        incident_summary = incident_data['summary']
-        incident_url = incident_data['url']
-    except KeyError as e:
-        raise NotificationParseError(f"Notification is missing required dict key: {str(e)}")
-
-    incident_id_label = f'monitoring_incident_id_{incident_id}'
-
-    if incident_state == 'open':
-        summary = '%s - %s' % (incident_condition_name, incident_resource_name)
-        description = '%s\nSee: %s' % (incident_summary, incident_url)
-        issue = jira_client.create_issue(
-            project=jira_project,
-            summary=summary,
-            description=description,
-            issuetype={'name': 'Bug'},
-            labels=[incident_id_label])
-        logger.info('Created jira issue %s', issue)
-
-    elif incident_state == 'closed':
-        incident_issues = jira_client.search_issues(
-            f'labels = {incident_id_label} AND status != {jira_status}')
+        if options.digest is not None and options.digest.accepts(incident.policy_name):
+            options.digest.add(_digest_entry(incident))
+            logger.info('Added incident id %s to the digest', incident.incident_id)
+        elif options.incident_locks is None:
+            _update_jira_based_on_incident(jira_client, jira_project, jira_status, incident,
+                                           options)
+        else:
+            with options.incident_locks.lock(incident.incident_id):
+                _update_jira_based_on_incident(jira_client, jira_project, jira_status,
+                                               incident, options)
+    finally:
+        if options.digest is not None:
+            _flush_due_digest(_digest_destination(jira_client, jira_project, options),
+                              options.digest)
+
+
+def _update_jira_based_on_incident(jira_client, jira_project, jira_status, incident, options):
+    """Creates or transitions the Jira issues of a parsed incident."""
+    incident_id_label = f'monitoring_incident_id_{incident.incident_id}'
+
+    if incident.state is IncidentState.OPEN:
+        issue = _pop_recent_issue(options.flap_suppressor, incident)
+        if issue is None:
+            issue_metadata = _get_issue_metadata(jira_client, jira_project,
+                                                 options.issue_metadata_cache)
+            issue = _create_issue(jira_client, options.issue_batcher,
+                                  _new_issue_fields(jira_project, incident, incident_id_label,
+                                                    issue_metadata, options.issue_templates))
+            logger.info('Created jira issue %s', issue)
+        else:
+            jira_client.issue(issue, fields='labels').add_field_value('labels',
+                                                                      incident_id_label)
+            jira_client.transition_issue(issue, options.flap_suppressor.reopen_status)
+            jira_client.add_comment(issue, _reopen_comment(incident))
+            logger.info('Jira issue %s transitioned to %s status since incident id %s '
+                        'reopened it', issue, options.flap_suppressor.reopen_status,
+                        incident.incident_id)
+
+        if (options.pending_closes is not None
+                and options.pending_closes.pop(incident.incident_id)):
+            jira_client.transition_issue(issue, jira_status)
+            logger.info('Jira issue %s transitioned to %s status since incident id %s '
+                        'was closed before it was opened', issue, jira_status,
+                        incident.incident_id)
+
+    else:
+        incident_issues = _search_open_issues(jira_client, options.search_batcher,
+                                              incident_id_label, jira_status)
 
         if incident_issues:
             for issue in incident_issues:
                 jira_client.transition_issue(issue, jira_status)
                 logger.info('Jira issue %s transitioned to %s status', issue, jira_status)
+            if options.flap_suppressor is not None:
+                options.flap_suppressor.record_close(incident, incident_issues[-1])
         else:
             logger.warning('No Jira issues corresponding to incident id %s found to '
-                           'transition to %s status', incident_id, jira_status)
+                           'transition to %s status', incident.incident_id, jira_status)
+            _remember_pending_close(options.pending_closes, incident)
+
+
+async def update_jira_based_on_monitoring_notification_async(
+        jira_client, jira_project, jira_status, notification, options=None):
+    """Asynchronous version of update_jira_based_on_monitoring_notification.
+
+    Args:
+        jira_client: An AsyncJiraClient object connected to the Jira server
+            where issues will be created / searched for.
+        jira_project: The key or id of the Jira project under which to create /
+            search for Jira issues.
+        jira_status: The status to transition issues corresponding to
+                    closed incidents to.
+        notification: The monitoring_notification.Notification, or the
+            dictionary containing the notification data.
+        options: An optional HandlerOptions object with the optional
+            features of the handler, which are off when not given:
+
+            incident_locks: An optional KeyedLocks object whose locks are created
+                by asyncio.Lock. If given, notifications of the same incident are
+                handled one at a time.
+            pending_closes: An optional TtlCache object. If given, closed incidents
+                without any issue are remembered in it, and the issues of their
+                later open notifications are created already transitioned.
+            flap_suppressor: An optional FlapSuppressor object. If given, issues
+                closed recently for the same policy, condition and resource are
+                reopened instead of creating new ones.
+            digest: An optional Digest object. If given, the notifications of the
+                policies it accepts are collected in it instead, and reported
+                once they are due, after the notification is handled.
+            issue_batcher: An optional AsyncMicroBatcher object whose
+                process_batch calls create_issues_in_bulk_async.
+            search_batcher: An optional AsyncMicroBatcher object whose
+                process_batch calls search_open_issues_in_bulk_async.
+            issue_metadata_cache: An optional TtlCache object. If given, issues
+                are created with the cached ids of the project and issue type.
+            issue_templates: An optional IssueTemplates object to render the
+                summary and description of created issues with.
+            digest_destination: An optional DigestDestination, with an
+                AsyncJiraClient, to report the digest to instead of jira_client
+                and jira_project.
+
+    Raises:
+        UnknownIncidentStateError: If the incident state is not open or closed.
+        NotificationParseError: If notification is missing required dict key.
+        jira_async_client.Error: If error occurs when using the jira client
+        BulkCreateError: If Jira rejects the issue created in bulk.
+        IssueMetadataError: If issues cannot be created in the project.
+        digest.DigestFullError: If the notification is for the digest, but the
+            digest is full.
+    """
+    options = options or _NO_OPTIONS
+    incident = _parse_incident(notification)
+    try:
+        if options.digest is not None and options.digest.accepts(incident.policy_name):
+            options.digest.add(_digest_entry(incident))
+            logger.info('Added incident id %s to the digest', incident.incident_id)
+        elif options.incident_locks is None:
+            await _update_jira_based_on_incident_async(jira_client, jira_project, jira_status,
+                                                       incident, options)
+        else:
+            async with options.incident_locks.lock(incident.incident_id):
+                await _update_jira_based_on_incident_async(jira_client, jira_project,
+                                                           jira_status, incident, options)
+    finally:
+        if options.digest is not None:
+            await _flush_due_digest_async(
+                _digest_destination(jira_client, jira_project, options), options.digest)
+
+
+async def _update_jira_based_on_incident_async(jira_client, jira_project, jira_status,
+                                               incident, options):
+    """Asynchronous version of _update_jira_based_on_incident."""
+    incident_id_label = f'monitoring_incident_id_{incident.incident_id}'
+
+    if incident.state is IncidentState.OPEN:
+        issue = _pop_recent_issue(options.flap_suppressor, incident)
+        if issue is None:
+            issue_metadata = await _get_issue_metadata_async(jira_client, jira_project,
+                                                             options.issue_metadata_cache)
+            issue = await _create_issue_async(
+                jira_client, options.issue_batcher,
+                _new_issue_fields(jira_project, incident, incident_id_label, issue_metadata,
+                                  options.issue_templates))
+            logger.info('Created jira issue %s', issue)
+        else:
+            await jira_client.add_label(issue, incident_id_label)
+            await jira_client.transition_issue(issue, options.flap_suppressor.reopen_status)
+            await jira_client.add_comment(issue, _reopen_comment(incident))
+            logger.info('Jira issue %s transitioned to %s status since incident id %s '
+                        'reopened it', issue, options.flap_suppressor.reopen_status,
+                        incident.incident_id)
+
+        if (options.pending_closes is not None
+                and options.pending_closes.pop(incident.incident_id)):
+            await jira_client.transition_issue(issue, jira_status)
+            logger.info('Jira issue %s transitioned to %s status since incident id %s '
+                        'was closed before it was opened', issue, jira_status,
+                        incident.incident_id)
 
     else:
-        raise UnknownIncidentStateError(
-            'Incident state must be "open" or "closed"')
+        incident_issues = await _search_open_issues_async(jira_client, options.search_batcher,
+                                                          incident_id_label, jira_status)
+
+        if incident_issues:
+            for issue in incident_issues:
+                await jira_client.transition_issue(issue, jira_status)
+                logger.info('Jira issue %s transitioned to %s status', issue, jira_status)
+            if options.flap_suppressor is not None:
+                options.flap_suppressor.record_close(incident, incident_issues[-1])
+        else:
+            logger.warning('No Jira issues corresponding to incident id %s found to '
+                           'transition to %s status', incident.incident_id, jira_status)
+            _remember_pending_close(options.pending_closes, incident)
+
+
+def _remember_pending_close(pending_closes, incident):
+    """Remembers a closed incident without issues, in case its open arrives later."""
+    if pending_closes is not None:
+        pending_closes.set(incident.incident_id, True)
+        logger.info('Remembering incident id %s as closed for %d seconds',
+                    incident.incident_id, pending_closes.ttl_seconds)
+
+
+def create_issues_in_bulk(jira_client, field_list):
+    """Creates issues with one request to Jira's bulk create endpoint.
+
+    Meant to be the process_batch of the MicroBatcher given to
+    update_jira_based_on_monitoring_notification as issue_batcher.
+
+    Args:
+        jira_client: A JIRA object connected to the Jira server where the
+            issues will be created.
+        field_list: A list of dictionaries of issue fields.
+
+    Returns:
+        A list with, for each fields dictionary, the created issue or a
+        BulkCreateError if Jira rejected it.
+
+    Raises:
+        JIRAError: If the bulk create request fails as a whole.
+    """
+    if len(field_list) == 1:
+        return [jira_client.create_issue(**field_list[0])]
+
+    # with the project key in a dictionary, the client does not look up the
+    # project id for each issue
+    results = jira_client.create_issues([_with_project_key(fields) for fields in field_list],
+                                        prefetch=False)
+    return [_bulk_create_result(result) for result in results]
+
+
+async def create_issues_in_bulk_async(jira_client, field_list):
+    """Asynchronous version of create_issues_in_bulk, using an AsyncJiraClient."""
+    if len(field_list) == 1:
+        return [await jira_client.create_issue(**field_list[0])]
+
+    results = await jira_client.create_issues(field_list)
+    return [_bulk_create_result(result) for result in results]
+
+
+def search_open_issues_in_bulk(jira_client, jira_status, incident_id_labels):
+    """Searches for the issues of many incidents with one JQL query.
+
+    Meant to be the process_batch of the MicroBatcher given to
+    update_jira_based_on_monitoring_notification as search_batcher.
+
+    Args:
+        jira_client: A JIRA object connected to the Jira server where the
+            issues will be searched for.
+        jira_status: The status of the issues not to return.
+        incident_id_labels: A list of the incident id labels of the issues.
+
+    Returns:
+        A list with, for each label, the list of its issues not in jira_status.
+
+    Raises:
+        JIRAError: If the search fails.
+    """
+    if len(incident_id_labels) == 1:
+        return [list(_iter_issues(jira_client, _open_issues_query(incident_id_labels[0],
+                                                                  jira_status)))]
+
+    issues = _iter_issues(jira_client,
+                          _open_issues_query_for_labels(incident_id_labels, jira_status))
+    return _issues_by_label(incident_id_labels, issues,
+                            lambda issue: issue, lambda issue: issue.fields.labels)
+
+
+async def search_open_issues_in_bulk_async(jira_client, jira_status, incident_id_labels):
+    """Asynchronous version of search_open_issues_in_bulk, using an AsyncJiraClient."""
+    if len(incident_id_labels) == 1:
+        return [await jira_client.search_issues(
+            _open_issues_query(incident_id_labels[0], jira_status),
+            max_results=False, fields=_SEARCH_FIELDS)]
+
+    issues = await jira_client.search_issues(
+        _open_issues_query_for_labels(incident_id_labels, jira_status),
+        max_results=False, fields=_SEARCH_FIELDS, json_result=True)
+    return _issues_by_label(incident_id_labels, issues,
+                            lambda issue: issue['key'], lambda issue: issue['fields']['labels'])
+
+
+def flush_digest(digest_destination, digest, force=False):
+    """Reports the notifications collected in a digest, if they are due.
+
+    The notifications are reported in one Jira issue. If creating it fails,
+    they are kept in the digest to be reported later.
+
+    Args:
+        digest_destination: The DigestDestination to create the issue in,
+            with a JIRA object as its client. If it has an issue metadata
+            cache, the issue is created with the cached ids of the project
+            and issue type.
+        digest: The Digest object holding the collected notifications.
+        force: Whether to report the collected notifications even if they
+            are not due yet (e.g. at shutdown).
+
+    Returns:
+        The created Jira issue, or None if no notifications were reported.
+
+    Raises:
+        JIRAError: If error occurs when using the jira client
+    """
+    entries = digest.take_due(force)
+    if not entries:
+        return None
+
+    jira_client, jira_project, issue_metadata_cache = digest_destination
+    try:
+        issue_metadata = _get_issue_metadata(jira_client, jira_project, issue_metadata_cache)
+        issue = jira_client.create_issue(**_digest_issue_fields(jira_project, entries,
+                                                                issue_metadata))
+    except BaseException:
+        digest.restore()
+        raise
+    digest.commit()
+    logger.info('Created jira digest issue %s for %d notifications', issue, len(entries))
+    return issue
+
+
+async def flush_digest_async(digest_destination, digest, force=False):
+    """Asynchronous version of flush_digest, with an AsyncJiraClient as the client."""
+    entries = digest.take_due(force)
+    if not entries:
+        return None
+
+    jira_client, jira_project, issue_metadata_cache = digest_destination
+    try:
+        issue_metadata = await _get_issue_metadata_async(jira_client, jira_project,
+                                                         issue_metadata_cache)
+        issue = await jira_client.create_issue(**_digest_issue_fields(jira_project, entries,
+                                                                      issue_metadata))
+    except BaseException:
+        digest.restore()
+        raise
+    digest.commit()
+    logger.info('Created jira digest issue %s for %d notifications', issue, len(entries))
+    return issue
+
+
+def _digest_destination(jira_client, jira_project, options):
+    """Returns where the digest of the options is reported, by default with the handler's client."""
+    return options.digest_destination or DigestDestination(jira_client, jira_project,
+                                                           options.issue_metadata_cache)
+
+
+def _flush_due_digest(digest_destination, digest):
+    """Reports the digest if it is due, logging instead of raising if that fails.
+
+    The digest is flushed by whichever notification comes after its entries
+    are due, so a failed report must not fail that notification: its entries
+    stay in the digest and are reported by a later one.
+    """
+    try:
+        flush_digest(digest_destination, digest)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('Failed to report the digest, its notifications stay spooled')
+
+
+async def _flush_due_digest_async(digest_destination, digest):
+    """Asynchronous version of _flush_due_digest."""
+    try:
+        await flush_digest_async(digest_destination, digest)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('Failed to report the digest, its notifications stay spooled')
+
+
+def load_issue_metadata(jira_client, jira_project, issue_metadata_cache):
+    """Loads the ids of the project and issue type of created issues into a cache.
+
+    Meant to be called when a worker starts, so that a misconfigured project
+    fails the start instead of every notification. Afterwards the metadata
+    is loaded again once it expires from the cache.
+
+    Args:
+        jira_client: A JIRA object connected to the Jira server.
+        jira_project: The key or id of the Jira project issues are created in.
+        issue_metadata_cache: The TtlCache object to store the metadata in.
+
+    Returns:
+        The loaded metadata.
+
+    Raises:
+        IssueMetadataError: If the project does not exist, has no issue type
+            named like the created issues, or requires fields that are not
+            set when creating them (or cannot set fields that are).
+        JIRAError: If error occurs when using the jira client
+    """
+    createmeta = jira_client.createmeta(**_createmeta_arguments(jira_project))
+    issue_metadata = _resolve_issue_metadata(createmeta, jira_project)
+    issue_metadata_cache.set(jira_project, issue_metadata)
+    return issue_metadata
+
+
+async def load_issue_metadata_async(jira_client, jira_project, issue_metadata_cache):
+    """Asynchronous version of load_issue_metadata, using an AsyncJiraClient."""
+    createmeta = await jira_client.createmeta(**_createmeta_arguments(jira_project))
+    issue_metadata = _resolve_issue_metadata(createmeta, jira_project)
+    issue_metadata_cache.set(jira_project, issue_metadata)
+    return issue_metadata
+
+
+def _get_issue_metadata(jira_client, jira_project, issue_metadata_cache):
+    """Returns the cached metadata of the project, loading it if it expired."""
+    if issue_metadata_cache is None:
+        return None
+    issue_metadata = issue_metadata_cache.get(jira_project)
+    if issue_metadata is None:
+        issue_metadata = load_issue_metadata(jira_client, jira_project, issue_metadata_cache)
+    return issue_metadata
+
+
+async def _get_issue_metadata_async(jira_client, jira_project, issue_metadata_cache):
+    """Asynchronous version of _get_issue_metadata."""
+    if issue_metadata_cache is None:
+        return None
+    issue_metadata = issue_metadata_cache.get(jira_project)
+    if issue_metadata is None:
+        issue_metadata = await load_issue_metadata_async(jira_client, jira_project,
+                                                         issue_metadata_cache)
+    return issue_metadata
+
+
+def _createmeta_arguments(jira_project):
+    """Returns the arguments of createmeta for the issue type of the project."""
+    project = {'projectIds': [jira_project]} if jira_project.isdigit() else {
+        'projectKeys': jira_project}
+    return dict(project, issuetypeNames=_ISSUE_TYPE_NAME, expand='projects.issuetypes.fields')
+
+
+def _resolve_issue_metadata(createmeta, jira_project):
+    """Returns the ids of the project and issue type found in a createmeta response."""
+    projects = createmeta.get('projects', [])
+    if not projects:
+        raise IssueMetadataError(f'Jira project {jira_project} does not exist or issues '
+                                 'cannot be created in it')
+
+    project = projects[0]
+    issue_types = [issue_type for issue_type in project.get('issuetypes', [])
+                   if issue_type['name'] == _ISSUE_TYPE_NAME]
+    if not issue_types:
+        raise IssueMetadataError(f'Jira project {jira_project} has no issue type '
+                                 f'{_ISSUE_TYPE_NAME}')
+
+    fields = issue_types[0].get('fields', {})
+    missing_fields = sorted(name for name, field in fields.items()
+                            if field.get('required') and not field.get('hasDefaultValue')
+                            and name not in _CREATED_FIELDS + _JIRA_SET_FIELDS)
+    if missing_fields:
+        raise IssueMetadataError(
+            f'Jira issue type {_ISSUE_TYPE_NAME} of project {jira_project} requires fields '
+            f'that are not set when creating issues: {", ".join(missing_fields)}')
+    unavailable_fields = [name for name in _CREATED_FIELDS if name not in fields]
+    if fields and unavailable_fields:
+        raise IssueMetadataError(
+            f'Jira issue type {_ISSUE_TYPE_NAME} of project {jira_project} cannot set '
+            f'fields when creating issues: {", ".join(unavailable_fields)}')
+
+    return _IssueMetadata(project_id=project['id'], issue_type_id=issue_types[0]['id'])
+
+
+def _digest_issue_fields(jira_project, entries, issue_metadata):
+    """Returns the fields of the Jira issue reporting the entries of a digest."""
+    description = '\n\n'.join(
+        '%s incident %s: %s - %s\n%s\nSee: %s' % (
+            entry['state'].capitalize(), entry['incident_id'], entry['condition_name'],
+            entry['resource_name'], entry['summary'], entry['url'])
+        for entry in entries)
+    return dict(_project_and_issue_type(jira_project, issue_metadata),
+                summary='Monitoring digest - %d incident notifications' % len(entries),
+                description=issue_templates.truncate(description, _MAX_DESCRIPTION_LENGTH),
+                labels=['monitoring_digest'])
+
+
+def _create_issue(jira_client, issue_batcher, fields):
+    """Creates an issue, in bulk with concurrent ones if there is an issue batcher."""
+    if issue_batcher is None:
+        return jira_client.create_issue(**fields)
+    return issue_batcher.submit(fields)
+
+
+async def _create_issue_async(jira_client, issue_batcher, fields):
+    """Asynchronous version of _create_issue."""
+    if issue_batcher is None:
+        return await jira_client.create_issue(**fields)
+    return await issue_batcher.submit(fields)
+
+
+def _search_open_issues(jira_client, search_batcher, incident_id_label, jira_status):
+    """Searches for the issues of an incident, in bulk if there is a search batcher."""
+    if search_batcher is None:
+        query = _open_issues_query(incident_id_label, jira_status)
+        return list(_iter_issues(jira_client, query))
+    return search_batcher.submit(incident_id_label)
+
+
+async def _search_open_issues_async(jira_client, search_batcher, incident_id_label,
+                                    jira_status):
+    """Asynchronous version of _search_open_issues."""
+    if search_batcher is None:
+        return await jira_client.search_issues(_open_issues_query(incident_id_label,
+                                                                  jira_status),
+                                               max_results=False, fields=_SEARCH_FIELDS)
+    return await search_batcher.submit(incident_id_label)
+
+
+def _iter_issues(jira_client, jql_str):
+    """Yields all the issues matching a JQL query, fetching them page by page.
+
+    Only the fields used by the handler are fetched. The pages are fetched
+    as the issues are consumed, so the issues should be collected before
+    being transitioned out of the results of the query, or the following
+    pages would skip some of them. Jira may cap the size of the pages below
+    _SEARCH_PAGE_SIZE, so the pages are fetched until the total of the
+    results is reached.
+    """
+    start_at = 0
+    while True:
+        page = jira_client.search_issues(jql_str, startAt=start_at,
+                                         maxResults=_SEARCH_PAGE_SIZE, fields=_SEARCH_FIELDS)
+        yield from page
+        start_at += len(page)
+        if not page or start_at >= page.total:
+            return
+
+
+def _issues_by_label(incident_id_labels, issues, get_issue, get_labels):
+    """Fans the issues found by one query out to the labels that were searched for."""
+    issues_by_label = {label: [] for label in incident_id_labels}
+    for issue in issues:
+        for label in get_labels(issue):
+            if label in issues_by_label:
+                issues_by_label[label].append(get_issue(issue))
+    return [issues_by_label[label] for label in incident_id_labels]
+
+
+def _with_project_key(fields):
+    if isinstance(fields.get('project'), str):
+        return dict(fields, project={'key': fields['project']})
+    return fields
+
+
+def _bulk_create_result(result):
+    """Returns the issue created in bulk, or the BulkCreateError why it was not."""
+    if result['status'] == 'Success':
+        return result['issue']
+    return BulkCreateError(f"Jira issue could not be created: {result['error']}")
+
+
+def _pop_recent_issue(flap_suppressor, incident):
+    """Returns the recently closed issue to reopen for an incident, or None."""
+    if flap_suppressor is None:
+        return None
+    return flap_suppressor.pop_recent_issue(incident)
+
+
+def _reopen_comment(incident):
+    """Returns the comment added to an issue reopened by an incident."""
+    return issue_templates.truncate('Reopened by incident %s: %s\nSee: %s' % (
+        incident.incident_id, incident.summary, incident.url), _MAX_DESCRIPTION_LENGTH)
+
+
+def _parse_incident(notification):
+    """Returns the incident of a Notification, or of a notification dictionary."""
+    if isinstance(notification, monitoring_notification.Notification):
+        return notification.incident
+    return monitoring_notification.parse(notification, REQUIRED_INCIDENT_FIELDS).incident
+
+
+def _new_issue_fields(jira_project, incident, incident_id_label, issue_metadata,
+                      templates):
+    """Returns the fields of the Jira issue to create for an open incident."""
+    if templates is None:
+        summary = issue_templates.truncate(
+            '%s - %s' % (incident.condition_name, incident.resource_name), _MAX_SUMMARY_LENGTH)
+        description = issue_templates.truncate(
+            '%s\nSee: %s' % (incident.summary, incident.url), _MAX_DESCRIPTION_LENGTH)
+    else:
+        summary, description = templates.render(incident.policy_name,
+                                                _template_fields(incident))
+    return dict(_project_and_issue_type(jira_project, issue_metadata),
+                summary=summary,
+                description=description,
+                labels=[incident_id_label])
+
+
+def _template_fields(incident):
+    """Returns the fields issue templates are rendered with for an incident.
+
+    These are the fields of the incident's data, plus the fields that its
+    schema version decoded from other keys (e.g. the condition_name of a
+    1.2 notification that only has a condition.displayName).
+    """
+    decoded_fields = {name: getattr(incident, name)
+                      for name in monitoring_notification.Incident.FIELDS
+                      if name not in incident.data and getattr(incident, name) is not None}
+    if not decoded_fields:
+        return incident.data
+    return dict(incident.data, **decoded_fields)
+
+
+def _digest_entry(incident):
+    """Returns the entry of an incident collected in a digest."""
+    entry = {field: getattr(incident, field) for field in _DIGEST_ENTRY_FIELDS}
+    entry['state'] = incident.state.value
+    return entry
+
+
+def _project_and_issue_type(jira_project, issue_metadata):
+    """Returns the project and issue type fields, with their ids if they are known."""
+    if issue_metadata is None:
+        return {'project': jira_project, 'issuetype': {'name': _ISSUE_TYPE_NAME}}
+    return {'project': {'id': issue_metadata.project_id},
+            'issuetype': {'id': issue_metadata.issue_type_id}}
+
+
+def _open_issues_query(incident_id_label, jira_status):
+    """Returns the JQL query for the issues of an incident not yet in jira_status."""
+    return f'labels = {incident_id_label} AND status != {jira_status}'
+
+
+def _open_issues_query_for_labels(incident_id_labels, jira_status):
+    """Returns the JQL query for the issues of many incidents not yet in jira_status."""
+    return f'labels in ({", ".join(incident_id_labels)}) AND status != {jira_status}'
@@ -0,0 +1,307 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Jira REST API Documentation: https://docs.atlassian.com/software/jira/docs/api/REST/8.5.0/
+
+"""Slim client for the subset of the Jira REST API used by this app.
+
+The client mirrors the JIRA methods used by jira_notification_handler
+(create_issue, create_issues, search_issues, issue, transition_issue and
+add_comment), so it can be used in place of a JIRA object. Unlike JIRA,
+it makes no request when it is created, sends its requests through a
+pooled requests Session with explicit timeouts, and retries idempotent
+requests that fail to connect or get a 502, 503 or 504 status. Requests
+are authenticated by an auth strategy of jira_auth.py.
+
+Typical usage example:
+
+  jira_client = JiraRestClient(jira_url, auth=jira_auth.from_config(config),
+                               timeout_seconds=30)
+  issue = jira_client.create_issue(project='PROJ', summary='...',
+                                   issuetype={'name': 'Bug'})
+"""
+
+import json
+import types
+import urllib.parse
+
+import requests
+from requests import adapters
+from urllib3.util import retry
+
+from utilities import jira_bulk_create
+
+
+
+class Error(Exception):
+    """Base class for all errors raised in this module."""
+
+
+class JiraRequestError(Error):
+    """Exception raised when a Jira REST API request fails."""
+
+
+class ResultList(list):
+    """A page of issues returned by search_issues, like the ResultList of JIRA.
+
+    Attributes:
+        total: The number of issues matching the query, across all pages.
+    """
+
+    def __init__(self, issues, total):
+        super().__init__(issues)
+        self.total = total
+
+
+class Issue:
+    """A Jira issue returned by the client, with the fields that were requested.
+
+    Attributes:
+        key: The key of the issue (e.g. 'PROJ-1'), which is also its string
+            representation.
+        fields: An object with an attribute for each requested field.
+    """
+
+    __slots__ = ('key', 'fields', '_client')
+
+    def __init__(self, client, key, fields=None):
+        self.key = key
+        self.fields = types.SimpleNamespace(**(fields or {}))
+        self._client = client
+
+
+    def __str__(self):
+        return self.key
+
+
+    def __repr__(self):
+        return f'<Issue {self.key}>'
+
+
+    def add_field_value(self, field, value):
+        """Adds a value to a list field of the issue, e.g. a label.
+
+        Args:
+            field: The name of the list field.
+            value: The value to add.
+        """
+        self._client._request(  # pylint: disable=protected-access
+            'PUT', f'/rest/api/2/issue/{self.key}', body={'update': {field: [{'add': value}]}})
+
+
+class JiraRestClient:
+    """Client for interacting with a Jira server.
+
+    Attributes:
+        server_url: The base URL of the Jira server.
+        auth: The jira_auth strategy (e.g. a jira_auth.OAuth1Auth) that
+            authenticates requests.
+        timeout_seconds: The time after which connecting to the server, or
+            waiting for a response, fails.
+        pool_size: The maximum number of connections kept open to the server.
+        max_retries: The number of times an idempotent request is retried.
+    """
+
+    def __init__(self, server_url, auth, *, timeout_seconds=30, pool_size=10, max_retries=2):
+        self._server_url = server_url.rstrip('/')
+        self._timeout_seconds = timeout_seconds
+        self._auth = auth
+
+        # requests that were sent are only retried for idempotent methods, so
+        # an issue is never created twice
+        adapter = adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size,
+            max_retries=retry.Retry(total=max_retries, backoff_factor=0.5,
+                                    status_forcelist=(502, 503, 504),
+                                    raise_on_status=False))
+        self._session = requests.Session()
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+
+    def close(self):
+        """Closes the connections of the client."""
+        self._session.close()
+
+
+    def create_issue(self, fields=None, **fieldargs):
+        """Creates an issue.
+
+        Args:
+            fields: A dictionary of issue fields. If omitted, the keyword
+                arguments are used as the fields instead. A 'project' given
+                as a string is treated as the project key.
+
+        Returns:
+            The created Issue, without fields.
+        """
+        response = self._request('POST', '/rest/api/2/issue',
+                                 body={'fields': _with_project_key(fields or fieldargs)})
+        return Issue(self, response['key'])
+
+
+    def create_issues(self, field_list, prefetch=True):  # pylint: disable=unused-argument
+        """Creates issues with one request to the bulk create endpoint.
+
+        Args:
+            field_list: A list of dictionaries of issue fields, as given to
+                create_issue.
+            prefetch: Ignored, accepted for compatibility with JIRA.
+
+        Returns:
+            A list with a dictionary for each fields dictionary, in the same
+            order. Like the result of JIRA.create_issues, each has a 'status'
+            of 'Success' or 'Error', the 'issue' (None on error) and the
+            'error' (None on success).
+
+        Raises:
+            JiraRequestError: If the request fails, other than with the
+                results of the bulk create.
+        """
+        issue_updates = [{'fields': _with_project_key(fields)} for fields in field_list]
+        # Jira answers with a 400 status (and the same body) if no issue was created
+        response = self._request('POST', '/rest/api/2/issue/bulk',
+                                 body={'issueUpdates': issue_updates},
+                                 accepted_error_status=400)
+        try:
+            return jira_bulk_create.bulk_create_results(
+                field_list, response, make_issue=lambda key: Issue(self, key))
+        except jira_bulk_create.Error as e:
+            raise JiraRequestError(str(e)) from e
+
+
+    # the arguments are named like those of JIRA.search_issues
+    def search_issues(self, jql_str, startAt=0, maxResults=50,  # pylint: disable=invalid-name
+                      fields='status'):
+        """Searches for issues with a JQL query.
+
+        Args:
+            jql_str: The JQL query.
+            startAt: The index of the first issue to return.
+            maxResults: The maximum number of issues to return.
+            fields: A comma separated string of the issue fields to return.
+
+        Returns:
+            A ResultList of the matching Issues, with the requested fields.
+            Jira may return fewer issues than maxResults (it caps the page
+            size), so its total is the number of matching issues.
+        """
+        response = self._request('GET', '/rest/api/2/search',
+                                 params={'jql': jql_str, 'startAt': startAt,
+                                         'maxResults': maxResults, 'fields': fields})
+        return ResultList([Issue(self, issue['key'], issue.get('fields'))
+                           for issue in response['issues']], response['total'])
+
+
+    def issue(self, issue, fields='status'):
+        """Gets an issue.
+
+        Args:
+            issue: The key of the issue.
+            fields: A comma separated string of the issue fields to return.
+
+        Returns:
+            The Issue, with the requested fields.
+        """
+        response = self._request('GET', f'/rest/api/2/issue/{issue}', params={'fields': fields})
+        return Issue(self, response['key'], response.get('fields'))
+
+
+    # the arguments are named like those of JIRA.createmeta
+    def createmeta(self, projectKeys=None, projectIds=None,  # pylint: disable=invalid-name
+                   issuetypeNames=None, expand=None):
+        """Gets the metadata for creating issues in projects.
+
+        Args:
+            projectKeys: A key or list of keys of the projects to return.
+            projectIds: A list of ids of the projects to return.
+            issuetypeNames: A name or list of names of the issue types to return.
+            expand: The parts of the metadata to expand (e.g.
+                'projects.issuetypes.fields').
+
+        Returns:
+            The createmeta dictionary returned by Jira, with a list of
+            'projects' and their 'issuetypes'.
+        """
+        params = {}
+        for name, value in (('projectKeys', projectKeys), ('projectIds', projectIds),
+                            ('issuetypeNames', issuetypeNames), ('expand', expand)):
+            if value:
+                params[name] = value if isinstance(value, str) else ','.join(map(str, value))
+        return self._request('GET', '/rest/api/2/issue/createmeta', params=params)
+
+
+    def transition_issue(self, issue, transition):
+        """Transitions an issue using the name of a transition.
+
+        Args:
+            issue: The Issue or key of the issue to transition.
+            transition: The name of the transition (or of its target status).
+
+        Raises:
+            JiraRequestError: If the issue has no such transition or a
+                request fails.
+        """
+        path = f'/rest/api/2/issue/{issue}/transitions'
+        response = self._request('GET', path)
+
+        transition_id = None
+        for available_transition in response['transitions']:
+            if available_transition['name'].lower() == transition.lower():
+                transition_id = available_transition['id']
+                break
+        if transition_id is None:
+            raise JiraRequestError(f'Invalid transition name {transition} for issue {issue}')
+
+        self._request('POST', path, body={'transition': {'id': transition_id}})
+
+
+    def add_comment(self, issue, body):
+        """Adds a comment to an issue.
+
+        Args:
+            issue: The Issue or key of the issue to comment on.
+            body: The text of the comment.
+        """
+        self._request('POST', f'/rest/api/2/issue/{issue}/comment', body={'body': body})
+
+
+    def _request(self, method, path, params=None, body=None, *, accepted_error_status=None):
+        url = self._server_url + path
+        if params:
+            url = f'{url}?{urllib.parse.urlencode(params)}'
+        url, headers = self._auth.authenticate(method, url)
+
+        data = None
+        if body is not None:
+            data = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+
+        try:
+            response = self._session.request(method, url, data=data, headers=headers,
+                                             timeout=self._timeout_seconds)
+        except requests.RequestException as e:
+            raise JiraRequestError(f'Jira request {method} {path} failed: {e}') from e
+
+        if response.status_code >= 400 and response.status_code != accepted_error_status:
+            raise JiraRequestError(f'Jira request {method} {path} failed with status '
+                                   f'{response.status_code}: {response.text}')
+
+        return response.json() if response.content else None
+
+
+def _with_project_key(fields):
+    if isinstance(fields.get('project'), str):
+        return dict(fields, project={'key': fields['project']})
+    return fields
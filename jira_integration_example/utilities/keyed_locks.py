@@ -0,0 +1,120 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Serializes work that shares a key, e.g. the notifications of an incident.
+
+KeyedLocks hands out one lock per key, so work on the same key runs one at
+a time while work on different keys never waits on each other. A key's
+lock only exists while it is held or waited for, so the memory used by
+the table is bounded by the amount of work in flight.
+
+Typical usage example:
+
+  incident_locks = KeyedLocks()
+
+  with incident_locks.lock(incident_id):
+      update_jira(incident)
+
+  # in a coroutine, with locks created by asyncio.Lock
+  incident_locks = KeyedLocks(lock_factory=asyncio.Lock)
+
+  async with incident_locks.lock(incident_id):
+      await update_jira(incident)
+"""
+
+import threading
+
+
+class _KeyLock:
+    """Context manager that holds the lock of a key, in threads or coroutines."""
+
+    def __init__(self, keyed_locks, key):
+        self._keyed_locks = keyed_locks
+        self._key = key
+        self._lock = None
+
+
+    def __enter__(self):
+        self._lock = self._keyed_locks._checkout(self._key)  # pylint: disable=protected-access
+        try:
+            self._lock.acquire()
+        except BaseException:
+            self._keyed_locks._checkin(self._key)  # pylint: disable=protected-access
+            raise
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._lock.release()
+        self._keyed_locks._checkin(self._key)  # pylint: disable=protected-access
+        return False
+
+
+    async def __aenter__(self):
+        self._lock = self._keyed_locks._checkout(self._key)  # pylint: disable=protected-access
+        try:
+            await self._lock.acquire()
+        except BaseException:
+            self._keyed_locks._checkin(self._key)  # pylint: disable=protected-access
+            raise
+        return self
+
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return self.__exit__(exc_type, exc_value, traceback)
+
+
+class KeyedLocks:
+    """A table of locks, one per key in use.
+
+    Attributes:
+        size: The number of keys whose lock is currently held or waited for.
+    """
+
+    def __init__(self, lock_factory=threading.Lock):
+        self._lock_factory = lock_factory
+        # key -> [lock, number of holders and waiters]
+        self._entries = {}
+        self._table_lock = threading.Lock()
+
+
+    @property
+    def size(self):
+        return len(self._entries)
+
+
+    def lock(self, key):
+        """Returns a context manager that holds the lock of the given key.
+
+        It is entered with "with" for locks created by threading.Lock and
+        with "async with" for locks created by asyncio.Lock.
+        """
+        return _KeyLock(self, key)
+
+
+    def _checkout(self, key):
+        with self._table_lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [self._lock_factory(), 0]
+            entry[1] += 1
+            return entry[0]
+
+
+    def _checkin(self, key):
+        with self._table_lock:
+            entry = self._entries[key]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._entries[key]
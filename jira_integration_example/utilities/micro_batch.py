@@ -0,0 +1,230 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Combines concurrent requests for the same operation into batches.
+
+During a burst, many handlers make the same kind of call to the third
+party service at once (e.g. creating an issue). A MicroBatcher processes
+the items submitted by concurrent callers with one call: while a batch is
+being processed, newly submitted items wait and are then processed
+together in the next batch (of at most max_batch_size items). An item
+submitted while nothing is being processed is processed right away, after
+max_delay_seconds if that is not 0. Every submitter gets the result for
+its own item, or the exception for its own item if that item failed.
+
+No background thread is used: the first submitter of a batch processes
+it, so the batcher works in forked gunicorn workers and on Cloud Run,
+where CPU is only allocated while requests are handled. AsyncMicroBatcher
+does the same for coroutines, processing each batch in a task of the
+event loop.
+
+Typical usage example:
+
+  def create_issues(field_list):
+      # returns one issue key (or exception) per fields dictionary
+      ...
+
+  batcher = MicroBatcher(create_issues, max_batch_size=50, max_delay_seconds=0)
+  issue_key = batcher.submit(fields)
+"""
+
+import asyncio
+import threading
+
+
+class _Batch:
+    """The items of a batch and, once processed, their results."""
+
+    def __init__(self):
+        self.items = []
+        self.results = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """Processes items submitted by concurrent threads in batches.
+
+    Attributes:
+        max_batch_size: The maximum number of items processed at once.
+        max_delay_seconds: The time the first item of a batch waits for more
+            items, unless the batch fills up first.
+    """
+
+    def __init__(self, process_batch, max_batch_size, max_delay_seconds=0):
+        """Initializes the batcher.
+
+        Args:
+            process_batch: A callable that receives a list of items and
+                returns a list with a result for each of them. A result that
+                is an exception is raised to the submitter of its item, and an
+                exception raised by process_batch is raised to all of them.
+            max_batch_size: The maximum number of items processed at once.
+            max_delay_seconds: The time the first item of a batch waits for
+                more items, unless the batch fills up first.
+        """
+        self._process_batch = process_batch
+        self._max_batch_size = max_batch_size
+        self._max_delay_seconds = max_delay_seconds
+        self._batch = None
+        self._processing = 0
+        self._condition = threading.Condition()
+
+
+    @property
+    def max_batch_size(self):
+        return self._max_batch_size
+
+
+    @property
+    def max_delay_seconds(self):
+        return self._max_delay_seconds
+
+
+    def submit(self, item):
+        """Adds an item to the next batch and returns its result once processed.
+
+        Raises:
+            Exception: The exception returned or raised for the item by
+                process_batch.
+        """
+        with self._condition:
+            is_leader = self._batch is None
+            if is_leader:
+                self._batch = _Batch()
+            batch = self._batch
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self._max_batch_size:
+                self._batch = None
+                batch.full.set()
+                self._condition.notify_all()
+
+        if not is_leader:
+            batch.done.wait()
+            return _result(batch.results[index])
+
+        if self._max_delay_seconds:
+            batch.full.wait(self._max_delay_seconds)
+        with self._condition:
+            # more items join the batch while another batch is processed
+            self._condition.wait_for(lambda: not self._processing or batch.full.is_set())
+            if self._batch is batch:
+                self._batch = None
+            self._processing += 1
+
+        try:
+            batch.results = _process(self._process_batch, batch.items)
+        finally:
+            with self._condition:
+                self._processing -= 1
+                self._condition.notify_all()
+            batch.done.set()
+        return _result(batch.results[index])
+
+
+class _AsyncBatch:
+    """The items of a batch and, once processed, their results."""
+
+    def __init__(self):
+        self.items = []
+        self.results = []
+        self.full = asyncio.Event()
+        self.done = asyncio.Event()
+
+
+class AsyncMicroBatcher:
+    """Processes items submitted by concurrent coroutines in batches.
+
+    Like MicroBatcher, except that process_batch is a coroutine function
+    and submit must be awaited. Each batch is processed in its own task, so
+    a submitter that is cancelled does not hold up the others. It must be
+    used from a single event loop.
+    """
+
+    def __init__(self, process_batch, max_batch_size, max_delay_seconds=0):
+        self._process_batch = process_batch
+        self._max_batch_size = max_batch_size
+        self._max_delay_seconds = max_delay_seconds
+        self._batch = None
+        self._processing = 0
+        # created by the first submit, in the event loop of the batcher
+        self._condition = None
+
+
+    @property
+    def max_batch_size(self):
+        return self._max_batch_size
+
+
+    @property
+    def max_delay_seconds(self):
+        return self._max_delay_seconds
+
+
+    async def submit(self, item):
+        """Adds an item to the next batch and returns its result once processed."""
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        if self._batch is None:
+            self._batch = _AsyncBatch()
+            asyncio.ensure_future(self._process_when_ready(self._batch))
+        batch = self._batch
+        index = len(batch.items)
+        batch.items.append(item)
+        if len(batch.items) >= self._max_batch_size:
+            self._batch = None
+            batch.full.set()
+            async with self._condition:
+                self._condition.notify_all()
+
+        await batch.done.wait()
+        return _result(batch.results[index])
+
+
+    async def _process_when_ready(self, batch):
+        if self._max_delay_seconds:
+            try:
+                await asyncio.wait_for(batch.full.wait(), self._max_delay_seconds)
+            except asyncio.TimeoutError:
+                pass
+        async with self._condition:
+            # more items join the batch while another batch is processed
+            await self._condition.wait_for(lambda: not self._processing or batch.full.is_set())
+            if self._batch is batch:
+                self._batch = None
+            self._processing += 1
+
+        try:
+            batch.results = await self._process_batch(batch.items)
+        except Exception as e:  # pylint: disable=broad-except
+            batch.results = [e] * len(batch.items)
+        finally:
+            async with self._condition:
+                self._processing -= 1
+                self._condition.notify_all()
+            batch.done.set()
+
+
+def _process(process_batch, items):
+    try:
+        return process_batch(items)
+    except Exception as e:  # pylint: disable=broad-except
+        return [e] * len(items)
+
+
+def _result(result):
+    if isinstance(result, Exception):
+        raise result
+    return result
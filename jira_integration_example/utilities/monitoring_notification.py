@@ -0,0 +1,234 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Model of the Cloud Monitoring notifications handled by the integrations.
+
+parse reads the fields used by the integrations out of a decoded
+notification and validates them once, into a Notification holding an
+Incident. Neither has an instance dictionary (the Incident is a
+namedtuple), so the many notifications queued during a burst take less
+memory than dictionaries would, and the incident state is an
+IncidentState.
+
+Notifications carry the version of their schema. Each version is read by
+the decoder registered for it in _DECODERS, looked up once per
+notification. Notifications without a version are read by the decoder of
+the latest version, and those of an unregistered minor version (e.g. a
+future '1.3') by the latest decoder of their major version, since minor
+versions only add fields. Other versions are refused with an
+UnsupportedVersionError.
+
+Typical usage example:
+
+  notification = parse(json.loads(data), required_fields=('incident_id',))
+  if notification.incident.state is IncidentState.OPEN:
+      ...
+"""
+
+import collections
+import enum
+
+
+class Error(Exception):
+    """Base class for all errors raised in this module."""
+
+
+class NotificationParseError(Error):
+    """Exception raised for errors in a monitoring notification format."""
+
+
+class UnknownIncidentStateError(Error):
+    """Exception raised for errors in an invalid incident state value."""
+
+
+class UnsupportedVersionError(Error):
+    """Exception raised when the schema version of a notification is not supported."""
+
+
+class IncidentState(str, enum.Enum):
+    """The state of an incident, which compares equal to its string value."""
+
+    OPEN = 'open'
+    CLOSED = 'closed'
+
+
+_IncidentTuple = collections.namedtuple(
+    '_IncidentTuple', ['incident_id', 'state', 'policy_name', 'condition_name', 'resource_name',
+                       'resource_type', 'policy_user_labels', 'severity', 'summary', 'url',
+                       'data'],
+    defaults=(None,) * 9)
+
+
+class Incident(_IncidentTuple):
+    """The incident a monitoring notification is about.
+
+    Attributes:
+        incident_id: The id of the incident.
+        state: The IncidentState of the incident.
+        policy_name: The name of the alerting policy of the incident.
+        condition_name: The name of the condition of the policy that is met.
+        resource_name: The name of the monitored resource.
+        resource_type: The type of the monitored resource (e.g. 'gce_instance').
+        policy_user_labels: A dictionary of the user labels of the policy.
+        severity: The severity of the policy (e.g. 'critical').
+        summary: The summary of the incident.
+        url: The URL of the incident in the Cloud Console.
+        data: The 'incident' dictionary of the notification, with all of its
+            fields.
+
+    The fields that are not required when parsing are None if they are
+    missing, except policy_user_labels, which is then empty.
+    """
+
+    __slots__ = ()
+
+    # the fields that are read from the keys of the same name
+    FIELDS = ('incident_id', 'policy_name', 'condition_name', 'resource_name', 'summary',
+              'url')
+
+    def __new__(cls, *args, **kwargs):
+        incident = super().__new__(cls, *args, **kwargs)
+        if incident.policy_user_labels is None or incident.data is None:
+            incident = incident._replace(policy_user_labels=incident.policy_user_labels or {},
+                                         data=incident.data if incident.data is not None else {})
+        return incident
+
+
+    def __repr__(self):
+        return f'<Incident {self.incident_id} {self.state.value}>'
+
+
+class Notification:
+    """A monitoring notification.
+
+    Attributes:
+        incident: The Incident the notification is about.
+        version: The version of the notification format (e.g. '1.2'), or
+            None if it is missing.
+    """
+
+    __slots__ = ('incident', 'version')
+
+    def __init__(self, incident, version=None):
+        self.incident = incident
+        self.version = version
+
+
+    def __eq__(self, other):
+        if not isinstance(other, Notification):
+            return NotImplemented
+        return (self.incident, self.version) == (other.incident, other.version)
+
+
+    def __repr__(self):
+        return f'<Notification {self.incident!r}>'
+
+
+def _decode_v1_1(incident_data):
+    """Returns the fields of an incident of schema version 1.1, which are all flat."""
+    fields = {name: incident_data[name] for name in Incident.FIELDS if name in incident_data}
+    resource = incident_data.get('resource')
+    if isinstance(resource, dict):
+        fields['resource_type'] = resource.get('type')
+    policy_user_labels = incident_data.get('policy_user_labels')
+    if isinstance(policy_user_labels, dict):
+        fields['policy_user_labels'] = policy_user_labels
+    return fields
+
+
+def _decode_v1_2(incident_data):
+    """Returns the fields of an incident of schema version 1.2.
+
+    Version 1.2 adds the severity, and the condition and metric objects,
+    whose display names stand in for the flat names when those are missing.
+    """
+    fields = _decode_v1_1(incident_data)
+    fields['severity'] = incident_data.get('severity')
+    if 'condition_name' not in fields:
+        condition = incident_data.get('condition')
+        if isinstance(condition, dict) and 'displayName' in condition:
+            fields['condition_name'] = condition['displayName']
+    if 'resource_name' not in fields and 'resource_display_name' in incident_data:
+        fields['resource_name'] = incident_data['resource_display_name']
+    return fields
+
+
+# the decoder of the incident of each schema version
+_DECODERS = {
+    '1.1': _decode_v1_1,
+    '1.2': _decode_v1_2,
+}
+
+# the decoder of the latest version of each major version, for the minor
+# versions that are not in _DECODERS
+_LATEST_DECODERS = {
+    '1': _decode_v1_2,
+}
+
+
+def _decoder(version):
+    """Returns the decoder of the incident of a schema version.
+
+    Raises:
+        UnsupportedVersionError: If the version is not supported.
+    """
+    if version is None:
+        return _LATEST_DECODERS['1']
+    if isinstance(version, str):
+        decoder = _DECODERS.get(version)
+        if decoder is not None:
+            return decoder
+        decoder = _LATEST_DECODERS.get(version.partition('.')[0])
+        if decoder is not None:
+            return decoder
+    raise UnsupportedVersionError(f'Notification schema version {version!r} is not supported')
+
+
+def parse(notification, required_fields=()):
+    """Builds a Notification from a decoded monitoring notification.
+
+    Args:
+        notification: The dictionary containing the notification data.
+        required_fields: The names of the Incident.FIELDS that must be in the
+            incident (as decoded for the schema version of the notification),
+            in the order they are checked. The incident and its state are
+            always required.
+
+    Returns:
+        The Notification.
+
+    Raises:
+        NotificationParseError: If the notification is missing required dict key.
+        UnknownIncidentStateError: If the incident state is not open or closed.
+        UnsupportedVersionError: If the schema version is not supported.
+    """
+    incident_data = notification.get('incident') if isinstance(notification, dict) else None
+    if not isinstance(incident_data, dict):
+        raise NotificationParseError("Notification is missing required dict key: 'incident'")
+    version = notification.get('version')
+    fields = _decoder(version)(incident_data)
+
+    if 'state' not in incident_data:
+        raise NotificationParseError("Notification is missing required dict key: 'state'")
+    for name in required_fields:
+        if name not in fields:
+            raise NotificationParseError(f"Notification is missing required dict key: '{name}'")
+
+    try:
+        state = IncidentState(incident_data['state'])
+    except ValueError:
+        raise UnknownIncidentStateError('Incident state must be "open" or "closed"') from None
+
+    incident = Incident(fields.pop('incident_id', None), state, data=incident_data, **fields)
+    return Notification(incident, version)
@@ -0,0 +1,94 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Signs Jira requests with OAuth1 RSA-SHA1 without re-parsing the RSA key.
+
+oauthlib parses the PEM encoded RSA key again for every request it signs,
+which costs more CPU than computing the signature itself. RsaSha1Client
+is an oauthlib Client that parses each key once: parsed keys are cached
+by their PEM text, so a new version of the key secret is parsed once and
+then reused as well. get_signer also caches the signer of each version of
+the OAuth credentials.
+
+Typical usage example:
+
+  signer = get_signer(oauth_dict)
+  url, headers, body = signer.sign(url, http_method='GET')
+
+  # with the jira library, whose OAuth1 auth builds its own client
+  auth = requests_oauthlib.OAuth1(..., signature_method=oauth1.SIGNATURE_RSA,
+                                  client_class=RsaSha1Client)
+"""
+
+import binascii
+import functools
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from oauthlib import oauth1
+
+
+# the number of versions of the key and credentials kept parsed, enough for
+# a key rotation that overlaps with requests still using the old version
+_MAX_CACHED_VERSIONS = 4
+
+
+@functools.lru_cache(maxsize=_MAX_CACHED_VERSIONS)
+def load_private_key(key_cert):
+    """Returns the parsed RSA private key of a PEM encoded key, parsing each key once."""
+    if isinstance(key_cert, str):
+        key_cert = key_cert.encode('utf-8')
+    return serialization.load_pem_private_key(key_cert, password=None,
+                                              backend=default_backend())
+
+
+def _sign_rsa_sha1(base_string, client):
+    """Computes the RSA-SHA1 signature of a signature base string, like oauthlib does."""
+    signature = load_private_key(client.rsa_key).sign(base_string.encode('ascii'),
+                                                      padding.PKCS1v15(), hashes.SHA1())
+    return binascii.b2a_base64(signature)[:-1].decode('ascii')
+
+
+class RsaSha1Client(oauth1.Client):
+    """An oauthlib Client whose RSA-SHA1 signatures reuse the parsed key."""
+
+    SIGNATURE_METHODS = dict(oauth1.Client.SIGNATURE_METHODS,
+                             **{oauth1.SIGNATURE_RSA: _sign_rsa_sha1})
+
+
+@functools.lru_cache(maxsize=_MAX_CACHED_VERSIONS)
+def _get_signer(consumer_key, access_token, access_token_secret, key_cert):
+    return RsaSha1Client(consumer_key,
+                         resource_owner_key=access_token,
+                         resource_owner_secret=access_token_secret,
+                         signature_method=oauth1.SIGNATURE_RSA,
+                         rsa_key=key_cert)
+
+
+def get_signer(oauth):
+    """Returns the signer of a version of the OAuth credentials.
+
+    The signer is created once for each version of the credentials and is
+    safe to share between threads, since signing does not change it.
+
+    Args:
+        oauth: A dictionary with the 'access_token', 'access_token_secret',
+            'consumer_key' and 'key_cert' used to sign requests.
+
+    Returns:
+        An RsaSha1Client signing requests with the credentials.
+    """
+    return _get_signer(oauth['consumer_key'], oauth['access_token'],
+                       oauth['access_token_secret'], oauth['key_cert'])
@@ -16,20 +16,114 @@
 
 This module defines functions and errors to handle input from Google Monitoring,
 such as Pub/Sub notifications.
+
+decode_notification goes from the raw body of a Pub/Sub push request to the
+notification dictionary: the push message and the notification are parsed
+from bytes, and the data is base64-decoded without first being encoded or
+copied into another string. The JSON is parsed with orjson if it is
+installed, and with the json module otherwise.
+
+read_body (and read_body_async) read the body of a push request in chunks,
+failing with a PayloadTooLargeError as soon as it is over the size limit,
+so an oversized body is never buffered in full. decode_notification checks
+the size of the decoded data before decoding it.
 """
 
 import base64
 import binascii
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, json is used instead
+    orjson = None
 
 
 class Error(Exception):
     """Base class for all errors raised in this module."""
 
 
+class MessageDecodeError(Error):
+    """Raised when the body of a Pub/Sub push request is not valid JSON."""
+
+
 class DataParseError(Error):
     """Raised when the encoded 'data' field of a Pub/Sub message cannot be parsed."""
 
 
+class NotificationDecodeError(Error):
+    """Raised when the decoded 'data' of a Pub/Sub message is not a JSON notification."""
+
+
+class PayloadTooLargeError(Error):
+    """Raised when a Pub/Sub push request, or its decoded 'data', is over the size limit."""
+
+
+# the size of the chunks the body of a request is read in
+_CHUNK_SIZE = 64 * 1024
+
+
+# the exceptions raised by _json_loads for invalid JSON (orjson.JSONDecodeError
+# is a subclass of json.JSONDecodeError, UnicodeDecodeError is raised for
+# bytes that are not UTF-8)
+_JSON_ERRORS = (ValueError,)
+
+
+def _json_loads(data):
+    """Parses JSON from bytes (or a string) with the fastest available parser."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _check_body_size(size, max_size):
+    if size > max_size:
+        raise PayloadTooLargeError(f'Pub/Sub push request is over {max_size} bytes')
+
+
+def read_body(stream, max_size, content_length=None):
+    """Reads the body of a Pub/Sub push request, up to a size limit.
+
+    Args:
+        stream: The file-like object the body is read from.
+        max_size: The maximum size of the body, in bytes.
+        content_length: The Content-Length of the request, or None if it is
+            not known (e.g. for a chunked request).
+
+    Returns:
+        The body, as a bytearray.
+
+    Raises:
+        PayloadTooLargeError: If the body is over max_size bytes, which is
+            raised without reading the body if its Content-Length is over
+            the limit, and otherwise as soon as the limit is exceeded.
+    """
+    if content_length is not None:
+        _check_body_size(content_length, max_size)
+    body = bytearray()
+    while True:
+        # reads one byte past the limit, to tell a body of max_size bytes
+        # from a longer one
+        chunk = stream.read(min(_CHUNK_SIZE, max_size + 1 - len(body)))
+        if not chunk:
+            return body
+        body += chunk
+        _check_body_size(len(body), max_size)
+
+
+async def read_body_async(stream, max_size, content_length=None):
+    """Asynchronous version of read_body, for an aiohttp StreamReader."""
+    if content_length is not None:
+        _check_body_size(content_length, max_size)
+    body = bytearray()
+    while True:
+        chunk = await stream.read(min(_CHUNK_SIZE, max_size + 1 - len(body)))
+        if not chunk:
+            return body
+        body += chunk
+        _check_body_size(len(body), max_size)
+
+
 def parse_data_from_message(pubsub_received_message):
     """Parses notification messages from Pub/Sub.
 
@@ -59,3 +153,57 @@ def parse_data_from_message(pubsub_received_message):
     data_string = data_string.strip()
 
     return data_string
+
+
+def decode_notification(body, max_data_size=None):
+    """Decodes the notification of a Pub/Sub push request from its raw body.
+
+    This is equivalent to parsing the body as JSON, then calling
+    parse_data_from_message and parsing its result as JSON, but makes fewer
+    copies of the payload.
+
+    Args:
+        body: The body of the request, as bytes (or a bytearray), or None if
+            the request does not have a JSON body.
+        max_data_size: The maximum size of the decoded data, in bytes, or
+            None for no limit.
+
+    Returns:
+        The notification, usually a dictionary.
+
+    Raises:
+        MessageDecodeError: If the body is not valid JSON.
+        DataParseError: If the data cannot be parsed.
+        NotificationDecodeError: If the decoded data is not valid JSON.
+        PayloadTooLargeError: If the decoded data is over max_data_size bytes.
+    """
+    if body is None:
+        raise DataParseError('invalid Pub/Sub message format')
+    try:
+        pubsub_received_message = _json_loads(body)
+    except _JSON_ERRORS as e:
+        raise MessageDecodeError('Failed to decode JSON object') from e
+
+    try:
+        data_base64_string = pubsub_received_message['message']['data']
+    except (KeyError, TypeError) as e:
+        raise DataParseError('invalid Pub/Sub message format') from e
+    if not isinstance(data_base64_string, str):
+        raise DataParseError('data should be in a string format')
+    # every 4 base64 characters decode to 3 bytes, less up to 2 for the padding
+    if max_data_size is not None and len(data_base64_string) // 4 * 3 - 2 > max_data_size:
+        raise PayloadTooLargeError(f'Pub/Sub message data is over {max_data_size} bytes')
+
+    try:
+        data_bytes = binascii.a2b_base64(data_base64_string)
+    except (binascii.Error, ValueError) as e:
+        raise DataParseError('data should be base64-encoded') from e
+    if max_data_size is not None and len(data_bytes) > max_data_size:
+        raise PayloadTooLargeError(f'Pub/Sub message data is over {max_data_size} bytes')
+
+    # the JSON parsers skip leading and trailing whitespace themselves
+    try:
+        return _json_loads(data_bytes)
+    except _JSON_ERRORS as e:
+        raise NotificationDecodeError(
+            f'Notification could not be decoded due to the following exception: {e}') from e
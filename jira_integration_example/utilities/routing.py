@@ -0,0 +1,208 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Routes monitoring notifications to Jira projects (and servers).
+
+A routing table is a list of routes, each a dictionary with:
+
+  project: The key or id of the Jira project to create issues in.
+  jira_url: Optional, the URL of the Jira server of the project, if it is
+      not the default server.
+  policy_names: Optional, a list of alerting policy names to match.
+  resource_types: Optional, a list of monitored resource types (e.g.
+      'gce_instance') to match.
+  user_labels: Optional, a dictionary of policy user labels that must all
+      be set to the given values.
+
+A notification is routed by the first route whose conditions all match
+it. The Router checks the table when it is created, and indexes the routes
+by policy name, so that matching a notification only checks the routes
+that can match its policy.
+
+Typical usage example:
+
+  router = Router([{'policy_names': ['disk policy'], 'project': 'STOR'},
+                   {'user_labels': {'team': 'web'}, 'project': 'WEB',
+                    'jira_url': 'https://web.atlassian.net'}])
+  destination = router.match(incident)  # None for the default project
+"""
+
+import collections
+import threading
+
+
+class Error(Exception):
+    """Base class for all errors raised in this module."""
+
+
+class RouteError(Error):
+    """Exception raised when a route of the routing table is invalid."""
+
+
+# where a notification is delivered; a jira_url of None is the default server
+Destination = collections.namedtuple('Destination', ['jira_url', 'jira_project'])
+
+_Route = collections.namedtuple(
+    '_Route', ['policy_names', 'resource_types', 'user_labels', 'destination'])
+
+_ROUTE_KEYS = frozenset(['project', 'jira_url', 'policy_names', 'resource_types',
+                         'user_labels'])
+
+
+class Router:
+    """Matches notifications against a routing table."""
+
+    def __init__(self, routes):
+        """Checks and indexes the routes.
+
+        Args:
+            routes: The list of routes, see the module docstring.
+
+        Raises:
+            RouteError: If a route is invalid.
+        """
+        self._routes = tuple(_compile_route(index, route)
+                             for index, route in enumerate(routes))
+        policy_names = set()
+        for route in self._routes:
+            policy_names.update(route.policy_names or ())
+        # the routes that can match a policy, in the order of the table
+        self._any_policy_routes = tuple(route for route in self._routes
+                                        if route.policy_names is None)
+        self._routes_by_policy = {
+            policy_name: tuple(route for route in self._routes
+                               if route.policy_names is None
+                               or policy_name in route.policy_names)
+            for policy_name in policy_names}
+
+
+    def __len__(self):
+        return len(self._routes)
+
+
+    def projects(self, jira_url=None):
+        """Returns the set of projects routed to on a Jira server (the default one if None)."""
+        return {route.destination.jira_project for route in self._routes
+                if route.destination.jira_url == jira_url}
+
+
+    def match(self, incident):
+        """Returns the Destination of the notifications of an incident.
+
+        Args:
+            incident: The monitoring_notification.Incident of a notification.
+
+        Returns:
+            The Destination of the first matching route, or None if no route
+            matches, in which case the notification goes to the default
+            project.
+        """
+        routes = self._routes_by_policy.get(incident.policy_name, self._any_policy_routes)
+        for route in routes:
+            if route.resource_types is not None and (
+                    incident.resource_type not in route.resource_types):
+                continue
+            if route.user_labels and not all(
+                    incident.policy_user_labels.get(key) == value
+                    for key, value in route.user_labels):
+                continue
+            return route.destination
+        return None
+
+
+def _compile_route(index, route):
+    """Checks a route of the routing table and returns it as a _Route."""
+    if not isinstance(route, dict) or not isinstance(route.get('project'), str):
+        raise RouteError(f'Route {index} must be a dictionary with a "project"')
+    unknown_keys = set(route) - _ROUTE_KEYS
+    if unknown_keys:
+        raise RouteError(f'Route {index} has unknown keys: {", ".join(sorted(unknown_keys))}')
+
+    conditions = {}
+    for key in ('policy_names', 'resource_types'):
+        values = route.get(key)
+        if values is not None and (isinstance(values, str) or not all(
+                isinstance(value, str) for value in values)):
+            raise RouteError(f'The {key} of route {index} must be a list of strings')
+        conditions[key] = frozenset(values) if values is not None else None
+
+    user_labels = route.get('user_labels') or {}
+    if not isinstance(user_labels, dict):
+        raise RouteError(f'The user_labels of route {index} must be a dictionary')
+
+    return _Route(policy_names=conditions['policy_names'],
+                  resource_types=conditions['resource_types'],
+                  user_labels=tuple(user_labels.items()),
+                  destination=Destination(jira_url=route.get('jira_url'),
+                                          jira_project=route['project']))
+
+
+class DestinationPool:
+    """A bounded pool of the clients (and their caches) of each Jira server.
+
+    The clients of a server are created on its first use. Once max_size
+    servers are pooled, the least recently used one is dropped from the
+    pool (but not closed, since requests in flight may still use it).
+
+    Attributes:
+        max_size: The maximum number of servers whose clients are kept.
+    """
+
+    def __init__(self, create_clients, max_size):
+        """Initializes the pool.
+
+        Args:
+            create_clients: A callable that receives the URL of a Jira server
+                and returns its clients.
+            max_size: The maximum number of servers whose clients are kept.
+        """
+        self._create_clients = create_clients
+        self._max_size = max_size
+        self._clients = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+
+    def __len__(self):
+        return len(self._clients)
+
+
+    def get(self, jira_url):
+        """Returns the clients of a Jira server, creating them if needed.
+
+        The clients are created without holding the lock of the pool, since
+        creating them may make requests to the server, so a slow server
+        does not hold up the requests to the other ones. If the clients of
+        a server are created twice at once, the first ones pooled are kept.
+        """
+        with self._lock:
+            clients = self._clients.get(jira_url)
+            if clients is not None:
+                self._clients.move_to_end(jira_url)
+                return clients
+
+        created_clients = self._create_clients(jira_url)
+        with self._lock:
+            clients = self._clients.get(jira_url)
+            if clients is not None:
+                self._clients.move_to_end(jira_url)
+                return clients
+            self._clients[jira_url] = created_clients
+            if len(self._clients) > self._max_size:
+                self._clients.popitem(last=False)
+            return created_clients
@@ -26,7 +26,6 @@ Typical usage example:
 
 import abc
 import os
-from google.cloud import secretmanager
 
 
 class Secret(abc.ABC):
@@ -76,7 +75,12 @@ class GoogleSecretManagerSecret(Secret):
         self._project_id = project_id
         self._secret_name = secret_name
         self._version = version
-        self._client = client or secretmanager.SecretManagerServiceClient()
+        if client is None:
+            # imported here since google.cloud.secretmanager (and with it gRPC
+            # and protobuf) takes a noticeable part of the cold start to import
+            from google.cloud import secretmanager  # pylint: disable=import-outside-toplevel
+            client = secretmanager.SecretManagerServiceClient()
+        self._client = client
 
 
     def get_secret_value(self):
@@ -0,0 +1,192 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs Cloud Monitoring Notification Integration app with aiohttp.
+
+This is an asyncio-native alternative to main.py that accepts the same
+Pub/Sub push requests and answers them with the same messages and HTTP
+status codes. Since delivering a notification is almost entirely spent
+waiting on the Hue bridge, a single process can keep hundreds of
+deliveries in flight. The number of deliveries handled at once is capped
+by MAX_IN_FLIGHT_REQUESTS (lowered while the third party service is slow,
+see admission_control.py), requests over the cap are refused with a 429
+status, and all deliveries share one connection pool.
+
+To serve it with gunicorn:
+
+  $ gunicorn --bind :8080 --worker-class aiohttp.GunicornWebWorker async_main:app
+"""
+
+import asyncio
+import logging
+import os
+
+import aiohttp
+from aiohttp import web
+
+import config
+from utilities import (pubsub, philips_hue, admission_control, graceful_shutdown,
+                       monitoring_notification, push_auth)
+
+
+app_config = config.load()
+logging.basicConfig(level=app_config.LOGGING_LEVEL)
+
+# logger inherits the logging level and handlers of the root logger
+logger = logging.getLogger(__name__)
+
+
+async def handle_pubsub_message(request):
+    # only pushes of the configured subscription are accepted, if configured;
+    # the certificates were fetched at startup, so this does not block
+    push_token_verifier = request.app['push_token_verifier']
+    if push_token_verifier is not None:
+        try:
+            push_token_verifier.verify(request.headers.get('Authorization'))
+        except push_auth.AuthenticationError as e:
+            logger.warning(e)
+            return web.Response(text=str(e), status=401)
+        except push_auth.CertsFetchError as e:
+            logger.error(e)
+            return web.Response(text=str(e), status=503)
+
+    # refuse new work when over capacity, so Pub/Sub slows down its pushes; the
+    # request body is not read yet, so the memory held by requests stays bounded
+    try:
+        with request.app['admission_control'].admit():
+            return await _handle_admitted_pubsub_message(request)
+    except admission_control.OverloadedError as e:
+        logger.warning(e)
+        return web.Response(text=str(e), status=429)
+
+
+async def _handle_admitted_pubsub_message(request):
+    # decode the notification straight from the body (which is only read if
+    # it is JSON, like Flask does); oversized bodies are refused before they
+    # are read in full
+    app_settings = request.app['config']
+    try:
+        body = None
+        if request.content_type == 'application/json':
+            body = await pubsub.read_body_async(request.content,
+                                                app_settings['MAX_REQUEST_BYTES'],
+                                                request.content_length)
+        monitoring_notification_dict = pubsub.decode_notification(
+            body, app_settings['MAX_NOTIFICATION_BYTES'])
+    except pubsub.PayloadTooLargeError as e:
+        logger.error(e)
+        return web.Response(text=str(e), status=413)
+    except pubsub.Error as e:
+        logger.error(e)
+        return web.Response(text=str(e), status=400)
+
+    # refuse new work once a shutdown began, so Pub/Sub redelivers it elsewhere
+    try:
+        with request.app['graceful_shutdown'].delivery():
+            message, status = await send_monitoring_notification_to_third_party(
+                request.app, monitoring_notification_dict)
+    except graceful_shutdown.ShuttingDownError as e:
+        logger.warning(e)
+        return web.Response(text=str(e), status=503)
+    return web.Response(text=message, status=status)
+
+
+async def send_monitoring_notification_to_third_party(app, notification):
+    """Send a given monitoring notification to a third party service.
+
+    Args:
+        app: The aiohttp application holding the config and Philips Hue client.
+        notification: The dictionary containing the notification data.
+
+    Returns:
+        A tuple containing an HTTP response message and HTTP status code
+        indicating whether or not sending the notification to the third
+        party service was successful.
+    """
+    app_settings = app['config']
+    try:
+        hue_value = philips_hue.get_target_hue_from_monitoring_notification(
+            notification, app_settings['POLICY_HUE_MAPPING'])
+        await app['philips_hue_client'].set_color(app_settings['LIGHT_ID'], hue_value)
+    except (philips_hue.Error, monitoring_notification.Error) as e:
+        logger.error(e)
+        return (str(e), 400)
+
+    return (repr(hue_value), 200)
+
+
+async def _philips_hue_client_context(app):
+    """Creates the Philips Hue client and its shared connection pool for the app's lifetime."""
+    app_settings = app['config']
+    connector = aiohttp.TCPConnector(limit=app_settings['HTTP_POOL_SIZE'])
+    timeout = aiohttp.ClientTimeout(total=app_settings['HTTP_TIMEOUT_SECONDS'])
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        app['philips_hue_client'] = philips_hue.AsyncPhilipsHueClient(
+            app_settings['BRIDGE_IP_ADDRESS'], app_settings['USERNAME'], session)
+        yield
+        # handlers have finished (or were cancelled) by now; flush while the
+        # connection pool is still open
+        app['graceful_shutdown'].wait_and_flush()
+
+
+async def _fetch_push_auth_certs(app):
+    """Fetches the certificates push tokens are verified with, before requests are served."""
+    await asyncio.get_running_loop().run_in_executor(
+        None, app['push_token_verifier'].refresh_certs)
+
+
+async def _begin_shutdown(app):
+    """Refuses new deliveries once aiohttp begins its graceful shutdown.
+
+    aiohttp then waits for the in-flight handlers (for at most the
+    gunicorn graceful timeout) before it runs the cleanup contexts.
+    """
+    app['graceful_shutdown'].begin()
+
+
+def create_app(settings):
+    """Creates the aiohttp application.
+
+    Args:
+        settings: A config object whose uppercase attributes are used as
+            the settings of the application (e.g. the result of config.load()).
+
+    Returns:
+        The aiohttp application.
+    """
+    aiohttp_app = web.Application()
+    aiohttp_app['config'] = {key: getattr(settings, key)
+                             for key in dir(settings) if key.isupper()}
+    aiohttp_app.cleanup_ctx.append(_philips_hue_client_context)
+    aiohttp_app['graceful_shutdown'] = graceful_shutdown.GracefulShutdown(
+        settings.SHUTDOWN_GRACE_PERIOD_SECONDS)
+    aiohttp_app['admission_control'] = admission_control.AdmissionController(
+        settings.MAX_IN_FLIGHT_REQUESTS, settings.ADMISSION_TARGET_LATENCY_SECONDS)
+    aiohttp_app['push_token_verifier'] = push_auth.from_config(aiohttp_app['config'])
+    if aiohttp_app['push_token_verifier'] is not None:
+        aiohttp_app.on_startup.append(_fetch_push_auth_certs)
+    aiohttp_app.on_shutdown.append(_begin_shutdown)
+    aiohttp_app.router.add_post('/', handle_pubsub_message)
+    return aiohttp_app
+
+
+app = create_app(app_config)
+
+
+if __name__ == '__main__':
+    PORT = int(os.getenv('PORT')) if os.getenv('PORT') else 8080
+
+    # This is used when running locally. Gunicorn can be used to run the
+    # application on Cloud Run, see the module docstring.
+    web.run_app(app, host='127.0.0.1', port=PORT)
@@ -29,6 +29,53 @@ class PhilipsHueConfig:
     DEBUG = False
     LIGHT_ID = '1'
 
+    # Settings of the asyncio serving mode (async_main.py). At most
+    # MAX_IN_FLIGHT_REQUESTS notifications are handled at once (further
+    # requests are refused with a 429 status), and all of them share a
+    # pool of at most HTTP_POOL_SIZE connections to the Hue bridge.
+    MAX_IN_FLIGHT_REQUESTS = 512
+    HTTP_POOL_SIZE = 10
+    HTTP_TIMEOUT_SECONDS = 10
+
+    # Cloud Run sends SIGKILL 10 seconds after SIGTERM. Deliveries in flight
+    # at SIGTERM are given this many seconds to finish, and deliveries that
+    # arrive after SIGTERM are refused with a 503 status, so that Pub/Sub
+    # redelivers them to another instance.
+    SHUTDOWN_GRACE_PERIOD_SECONDS = 8
+
+    # When more than ADMISSION_MAX_IN_FLIGHT notifications are being
+    # delivered at once, further notifications are refused with a 429
+    # status, so that Pub/Sub slows down its pushes instead of letting
+    # requests queue up. While deliveries take longer than
+    # ADMISSION_TARGET_LATENCY_SECONDS this limit is lowered, and it grows
+    # back once they are faster. ADMISSION_MAX_IN_FLIGHT should be lower than
+    # the gunicorn threads per worker, so that spare threads can refuse
+    # requests right away (the asyncio serving mode uses
+    # MAX_IN_FLIGHT_REQUESTS instead).
+    ADMISSION_MAX_IN_FLIGHT = 8
+    ADMISSION_TARGET_LATENCY_SECONDS = 5
+
+    # Pub/Sub push requests over MAX_REQUEST_BYTES are refused with a 413
+    # status while their body is read (right away if their Content-Length
+    # is over it), so they are never buffered in full. So are those whose
+    # notification is over MAX_NOTIFICATION_BYTES once base64-decoded.
+    MAX_REQUEST_BYTES = 512 * 1024
+    MAX_NOTIFICATION_BYTES = 256 * 1024
+
+    # Pub/Sub push requests must have an OIDC token of the push subscription's
+    # service account PUSH_AUTH_SERVICE_ACCOUNT_EMAIL, issued for
+    # PUSH_AUTH_AUDIENCE (the audience set on the subscription), when both are
+    # set (see utilities/push_auth.py), and are otherwise refused with a 401
+    # status. Google's signing certificates are fetched when a worker starts
+    # and refreshed in the background every PUSH_AUTH_CERTS_REFRESH_SECONDS.
+    # At most PUSH_AUTH_MAX_CACHED_TOKENS verified tokens are cached until
+    # they expire. Setting only one of PUSH_AUTH_AUDIENCE and
+    # PUSH_AUTH_SERVICE_ACCOUNT_EMAIL fails the start of the app.
+    PUSH_AUTH_AUDIENCE = None
+    PUSH_AUTH_SERVICE_ACCOUNT_EMAIL = None
+    PUSH_AUTH_CERTS_REFRESH_SECONDS = 60 * 60
+    PUSH_AUTH_MAX_CACHED_TOKENS = 1000
+
     # Mappings between Google Cloud alerting policy names
     # and HSB color system hue values between 0 and 65535.
     # Each mapping indicates what hues the light bulb should
@@ -22,12 +22,14 @@
 # [START run_pubsub_server_setup]
 import logging
 import os
-import json
+import threading
 
-from flask import Flask, request
+from flask import Flask, current_app, request
+import requests
 
 import config
-from utilities import pubsub, philips_hue
+from utilities import (pubsub, philips_hue, admission_control, graceful_shutdown,
+                       monitoring_notification, push_auth)
 
 
 app_config = config.load()
@@ -36,34 +38,66 @@ logging.basicConfig(level=app_config.LOGGING_LEVEL)
 # logger inherits the logging level and handlers of the root logger
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-app.config.from_object(app_config)
+# guards the lazy creation of the Philips Hue client of this process
+_philips_hue_client_lock = threading.Lock()
 # [END run_pubsub_server_setup]
 
 
 # [START run_pubsub_handler]
-@app.route('/', methods=['POST'])
 def handle_pubsub_message():
-    pubsub_received_message = request.get_json()
-
-    # parse the Pub/Sub data
+    # only pushes of the configured subscription are accepted, if configured
+    push_token_error = _verify_push_token()
+    if push_token_error is not None:
+        return push_token_error
+
+    # decode the notification straight from the body, without a copy of the
+    # Pub/Sub message as a dictionary or of the data as a string; oversized
+    # bodies are refused before they are read in full
     try:
-        pubsub_data_string = pubsub.parse_data_from_message(pubsub_received_message)
-    except pubsub.DataParseError as e:
+        body = None
+        if request.is_json:
+            body = pubsub.read_body(request.stream, current_app.config['MAX_REQUEST_BYTES'],
+                                    request.content_length)
+        monitoring_notification_dict = pubsub.decode_notification(
+            body, current_app.config['MAX_NOTIFICATION_BYTES'])
+    except pubsub.PayloadTooLargeError as e:
+        logger.error(e)
+        return (str(e), 413)
+    except pubsub.Error as e:
         logger.error(e)
         return (str(e), 400)
 
-    # load the notification from the data
+    # refuse new work once a shutdown began, so Pub/Sub redelivers it elsewhere,
+    # and when over capacity, so Pub/Sub slows down its pushes
     try:
-        monitoring_notification_dict = json.loads(pubsub_data_string)
-    except json.JSONDecodeError as e:
-        logger.error(e)
-        return (f'Notification could not be decoded due to the following exception: {e}', 400)
-
-    return send_monitoring_notification_to_third_party(monitoring_notification_dict)
+        with current_app.extensions['graceful_shutdown'].delivery(), \
+                current_app.extensions['admission_control'].admit():
+            return send_monitoring_notification_to_third_party(monitoring_notification_dict)
+    except graceful_shutdown.ShuttingDownError as e:
+        logger.warning(e)
+        return (str(e), 503)
+    except admission_control.OverloadedError as e:
+        logger.warning(e)
+        return (str(e), 429)
 # [END run_pubsub_handler]
 
 
+def _verify_push_token():
+    """Returns the error response for a push without a valid token, or None if it is accepted."""
+    push_token_verifier = current_app.extensions['push_token_verifier']
+    if push_token_verifier is None:
+        return None
+    try:
+        push_token_verifier.verify(request.headers.get('Authorization'))
+    except push_auth.AuthenticationError as e:
+        logger.warning(e)
+        return (str(e), 401)
+    except push_auth.CertsFetchError as e:
+        logger.error(e)
+        return (str(e), 503)
+    return None
+
+
 def send_monitoring_notification_to_third_party(notification):
     """Send a given monitoring notification to a third party service.
 
@@ -76,20 +110,86 @@ def send_monitoring_notification_to_third_party(notification):
         party service was successful.
     """
 
-    philips_hue_client = philips_hue.PhilipsHueClient(app.config['BRIDGE_IP_ADDRESS'],
-                                                      app.config['USERNAME'])
+    philips_hue_client = get_philips_hue_client()
 
     try:
         hue_value = philips_hue.get_target_hue_from_monitoring_notification(
-            notification, app.config["POLICY_HUE_MAPPING"])
-        philips_hue_client.set_color(app.config['LIGHT_ID'], hue_value)
-    except philips_hue.Error as e:
+            notification, current_app.config["POLICY_HUE_MAPPING"])
+        philips_hue_client.set_color(current_app.config['LIGHT_ID'], hue_value)
+    except (philips_hue.Error, monitoring_notification.Error) as e:
         logger.error(e)
         return (str(e), 400)
 
     return (repr(hue_value), 200)
 
 
+def get_philips_hue_client():
+    """Returns the Philips Hue client of the current process, creating it if needed.
+
+    The client (and the connection pool of its HTTP session) is shared by
+    all request threads of a process. It is normally created right after
+    gunicorn forks the process (see init_worker_clients), and otherwise
+    on the first request.
+    """
+    philips_hue_client = current_app.extensions.get('philips_hue_client')
+    if philips_hue_client is None:
+        with _philips_hue_client_lock:
+            philips_hue_client = current_app.extensions.get('philips_hue_client')
+            if philips_hue_client is None:
+                philips_hue_client = philips_hue.PhilipsHueClient(
+                    current_app.config['BRIDGE_IP_ADDRESS'], current_app.config['USERNAME'],
+                    session=requests.Session())
+                current_app.extensions['philips_hue_client'] = philips_hue_client
+    return philips_hue_client
+
+
+def init_worker_clients(flask_app):
+    """Creates the third party clients of the current process.
+
+    Meant to be called in each worker process after it is forked (see
+    post_fork in gunicorn.conf.py), so that connection pools are never
+    shared between processes and the first request of a worker does not
+    pay for creating them.
+
+    Args:
+        flask_app: The Flask app whose clients to create.
+    """
+    flask_app.extensions.pop('philips_hue_client', None)
+    if flask_app.extensions['push_token_verifier'] is not None:
+        flask_app.extensions['push_token_verifier'].refresh_certs()
+    with flask_app.app_context():
+        get_philips_hue_client()
+
+
+def create_app(settings):
+    """Creates the Flask app.
+
+    All secrets are resolved here, when the config object is copied into
+    the Flask config. When gunicorn preloads the app (see gunicorn.conf.py),
+    this happens once in the master process and the resolved config is
+    inherited by every forked worker. No third party clients are created
+    here, since their connections must not be shared across a fork.
+
+    Args:
+        settings: The config object to use (e.g. the result of config.load()).
+
+    Returns:
+        The Flask app.
+    """
+    flask_app = Flask(__name__)
+    flask_app.config.from_object(settings)
+    flask_app.extensions['graceful_shutdown'] = graceful_shutdown.GracefulShutdown(
+        settings.SHUTDOWN_GRACE_PERIOD_SECONDS)
+    flask_app.extensions['admission_control'] = admission_control.AdmissionController(
+        settings.ADMISSION_MAX_IN_FLIGHT, settings.ADMISSION_TARGET_LATENCY_SECONDS)
+    flask_app.extensions['push_token_verifier'] = push_auth.from_config(flask_app.config)
+    flask_app.add_url_rule('/', view_func=handle_pubsub_message, methods=['POST'])
+    return flask_app
+
+
+app = create_app(app_config)
+
+
 if __name__ == '__main__':
     PORT = int(os.getenv('PORT')) if os.getenv('PORT') else 8080
 
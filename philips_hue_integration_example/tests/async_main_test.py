@@ -0,0 +1,135 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the asyncio serving mode in async_main.py.
+
+The Philips Hue bridge is replaced by a local aiohttp server that answers
+requests like the callback in philips_hue_mock.py.
+"""
+
+import asyncio
+import base64
+import json
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import async_main
+import config
+from utilities import push_auth
+
+
+class _BridgeTestConfig(config.TestPhilipsHueConfig):
+    """Test config whose bridge address is filled in by the fixture."""
+
+    BRIDGE_IP_ADDRESS = None
+
+
+async def _bridge_put_state(request):
+    if request.match_info['light_id'] != '1':
+        return web.Response(status=400, text='invalid Philips Hue url')
+
+    body_dict = json.loads(await request.text())
+    return web.Response(text=str([{'success': {'/lights/1/state/on': str(body_dict['on']).lower()}},
+                                  {'success': {'/lights/1/state/hue': f"{body_dict['hue']}"}}]))
+
+
+@pytest.fixture
+def post():
+    def post_to_app(light_id='1', **kwargs):
+        async def send():
+            bridge = web.Application()
+            bridge.router.add_put('/api/{username}/lights/{light_id}/state', _bridge_put_state)
+            async with TestServer(bridge) as bridge_server:
+                settings = _BridgeTestConfig()
+                settings.BRIDGE_IP_ADDRESS = f'{bridge_server.host}:{bridge_server.port}'
+                settings.LIGHT_ID = light_id
+                app = async_main.create_app(settings)
+                async with TestClient(TestServer(app)) as client:
+                    response = await client.post('/', **kwargs)
+                    return response.status, await response.read()
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(send())
+        finally:
+            loop.close()
+
+    return post_to_app
+
+
+def test_empty_payload(post):
+    status, data = post(json='')
+
+    assert status == 400
+    assert b'invalid Pub/Sub message format' in data
+
+
+def test_nonstring_notification_message(post):
+    status, data = post(json={'message': {'data': True}})
+
+    assert status == 400
+    assert b'data should be in a string format' in data
+
+
+def test_invalid_incident_message(post):
+    data = base64.b64encode(b'{"invalid": "error"}').decode()
+
+    status, response_data = post(json={'message': {'data': data}})
+
+    assert status == 400
+    assert b'Notification is missing required dict key' in response_data
+
+
+def test_nondefault_open_incident_alert_message(post):
+    message = '{"incident": {"policy_name": "policyB", "state": "open"}}'
+    data = base64.b64encode(message.encode()).decode()
+
+    status, response_data = post(json={'message': {'data': data}})
+
+    assert status == 200
+    expected_response_data = repr(config.TestPhilipsHueConfig.POLICY_HUE_MAPPING
+                                  ['policyB']['open']).encode()
+    assert response_data == expected_response_data
+
+
+def test_default_closed_incident_alert_message(post):
+    message = '{"incident": {"policy_name": "unknown_policy", "state": "closed"}}'
+    data = base64.b64encode(message.encode()).decode()
+
+    status, response_data = post(json={'message': {'data': data}})
+
+    assert status == 200
+    expected_response_data = repr(config.TestPhilipsHueConfig.POLICY_HUE_MAPPING
+                                  ['default']['closed']).encode()
+    assert response_data == expected_response_data
+
+
+def test_bad_bridge_request(post):
+    message = '{"incident": {"policy_name": "policyB", "state": "open"}}'
+    data = base64.b64encode(message.encode()).decode()
+
+    status, response_data = post(light_id='2', json={'message': {'data': data}})
+
+    assert status == 400
+    assert response_data == b'invalid Philips Hue url'
+
+
+def test_create_app_with_partial_push_auth_config():
+    class PushAuthTestConfig(config.TestPhilipsHueConfig):
+        PUSH_AUTH_SERVICE_ACCOUNT_EMAIL = 'push@project.iam.gserviceaccount.com'
+
+    with pytest.raises(push_auth.ConfigError, match='^PUSH_AUTH_AUDIENCE'):
+        async_main.create_app(PushAuthTestConfig())
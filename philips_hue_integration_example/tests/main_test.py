@@ -23,7 +23,7 @@ import re
 import pytest
 
 import main
-from utilities import philips_hue, philips_hue_mock
+from utilities import admission_control, graceful_shutdown, philips_hue, philips_hue_mock
 
 
 @pytest.fixture
@@ -35,7 +35,14 @@ def config():
 @pytest.fixture
 def flask_client():
     main.app.testing = True
-    return main.app.test_client()
+    # each test starts without a Philips Hue client, as a freshly forked worker does
+    main.app.extensions.pop('philips_hue_client', None)
+    yield main.app.test_client()
+    main.app.extensions['graceful_shutdown'] = graceful_shutdown.GracefulShutdown(
+        main.app.config['SHUTDOWN_GRACE_PERIOD_SECONDS'])
+    main.app.extensions['admission_control'] = admission_control.AdmissionController(
+        main.app.config['ADMISSION_MAX_IN_FLIGHT'],
+        main.app.config['ADMISSION_TARGET_LATENCY_SECONDS'])
 
 
 @pytest.fixture
@@ -183,3 +190,58 @@ def test_default_closed_incident_alert_message(flask_client, philips_hue_client,
     expected_response_data = repr(config['POLICY_HUE_MAPPING']
                                   ['default']['closed']).encode()
     assert response.data == expected_response_data
+
+
+def test_init_worker_clients(config):
+    inherited_philips_hue_client = object()
+    flask_app = main.create_app(main.app_config)
+    flask_app.extensions['philips_hue_client'] = inherited_philips_hue_client
+    flask_app.config.from_object('config.TestPhilipsHueConfig')
+
+    main.init_worker_clients(flask_app)
+
+    philips_hue_client = flask_app.extensions['philips_hue_client']
+    assert philips_hue_client is not inherited_philips_hue_client
+    assert philips_hue_client.bridge_ip_address == config['BRIDGE_IP_ADDRESS']
+    assert philips_hue_client.username == config['USERNAME']
+
+
+def test_philips_hue_client_is_reused_across_requests(flask_client, requests_mock, config):
+    message = '{"incident": {"policy_name": "policyB", "state": "open"}}'
+    data = base64.b64encode(message.encode()).decode()
+    matcher = re.compile(f"http://{config['BRIDGE_IP_ADDRESS']}/api/{config['USERNAME']}")
+    requests_mock.register_uri('PUT', matcher,
+                               text=philips_hue_mock.mock_hue_put_response)
+
+    flask_client.post('/', json={'message': {'data': data}})
+    philips_hue_client = main.app.extensions['philips_hue_client']
+    flask_client.post('/', json={'message': {'data': data}})
+
+    assert main.app.extensions['philips_hue_client'] is philips_hue_client
+    assert requests_mock.call_count == 2
+
+
+def test_incident_alert_message_while_shutting_down(flask_client, requests_mock):
+    message = '{"incident": {"policy_name": "policyB", "state": "open"}}'
+    data = base64.b64encode(message.encode()).decode()
+    main.app.extensions['graceful_shutdown'].begin()
+
+    response = flask_client.post('/', json={'message': {'data': data}})
+
+    assert response.status_code == 503
+    assert response.data == b'Service is shutting down'
+    assert requests_mock.call_count == 0
+
+
+def test_incident_alert_message_while_overloaded(flask_client, requests_mock):
+    message = '{"incident": {"policy_name": "policyB", "state": "open"}}'
+    data = base64.b64encode(message.encode()).decode()
+    main.app.extensions['admission_control'] = admission_control.AdmissionController(
+        max_in_flight=1, target_latency_seconds=5)
+
+    with main.app.extensions['admission_control'].admit():
+        response = flask_client.post('/', json={'message': {'data': data}})
+
+    assert response.status_code == 429
+    assert b'Service is overloaded' in response.data
+    assert requests_mock.call_count == 0
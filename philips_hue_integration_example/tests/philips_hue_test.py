@@ -84,6 +84,18 @@ def test_get_target_hue_from_incident_invalid_state():
     assert str(e.value) == expected_error_value
 
 
+def test_get_target_hue_from_incident_state_without_hue():
+    notification = {'incident': {'policy_name': 'policyA', 'state': 'closed'}}
+    policy_hue_mapping = {'default': {'open': 65280}}
+
+    with pytest.raises(philips_hue.UnknownIncidentStateError) as e:
+        philips_hue.get_target_hue_from_monitoring_notification(notification,
+                                                                policy_hue_mapping)
+
+    assert str(e.value) == ("Incident state for Google Cloud alerting policy 'policyA' "
+                            "must be one of: ['open']; actual: 'closed'")
+
+
 def test_get_target_hue_with_nondefault_open_incident():
     policy_name = 'policyB'
     incident_state = 'open'
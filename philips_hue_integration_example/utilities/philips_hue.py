@@ -23,17 +23,23 @@ callback functions that interact with a Philips Hue client.
 import json
 import requests
 
+from utilities import monitoring_notification
+from utilities.monitoring_notification import (NotificationParseError,
+                                               UnknownIncidentStateError)
 
-class Error(Exception):
-    """Base class for all errors raised in this module."""
-
+__all__ = ['Error', 'NotificationParseError', 'UnknownIncidentStateError', 'BadAPIRequestError',
+           'PhilipsHueClient', 'AsyncPhilipsHueClient',
+           'get_target_hue_from_monitoring_notification']
 
-class NotificationParseError(Error):
-    """Exception raised for errors in a monitoring notification format."""
 
+class Error(Exception):
+    """Base class for all errors raised in this module.
 
-class UnknownIncidentStateError(Error):
-    """Exception raised for errors in an invalid incident state value."""
+    Errors in the format of a notification are raised as the
+    NotificationParseError, UnknownIncidentStateError and
+    UnsupportedVersionError of monitoring_notification (the first two are
+    also available from this module).
+    """
 
 
 class BadAPIRequestError(Error):
@@ -48,10 +54,14 @@ class PhilipsHueClient():
     Attributes:
         bridge_ip_address: IP address of the Hue bridge system to connect to.
         username: Authorized user string to make API calls.
+        session: The requests Session used to send requests, so that its
+            connection pool is reused (if None, each request opens a new
+            connection).
     """
-    def __init__(self, bridge_ip_address, username):
+    def __init__(self, bridge_ip_address, username, session=None):
         self._bridge_ip_address = bridge_ip_address
         self._username = username
+        self._session = session or requests
 
 
     @property
@@ -78,13 +88,72 @@ class PhilipsHueClient():
         Returns:
             HTTP Response from the Philips Hue API.
         """
-        response = requests.put(url=f'http://{self._bridge_ip_address}/api/{self._username}/lights/{light_id}/state',
-                                data=json.dumps({"on": True, "hue": hue}))
-        if response.status_code != 200:
-            raise BadAPIRequestError(response.text)
+        url, data = _set_color_request(self._bridge_ip_address, self._username, light_id, hue)
+        response = self._session.put(url=url, data=data)
+        _check_response(response.status_code, response.text)
         return response
 
 
+class AsyncPhilipsHueClient():
+    """Client for interacting with Philips Hue APIs from asyncio code.
+
+    Mirrors PhilipsHueClient with coroutines. Requests are sent through an
+    aiohttp ClientSession that is meant to be shared, so that all concurrent
+    deliveries reuse one connection pool.
+
+    Attributes:
+        bridge_ip_address: IP address of the Hue bridge system to connect to.
+        username: Authorized user string to make API calls.
+        session: The aiohttp ClientSession used to send requests.
+    """
+    def __init__(self, bridge_ip_address, username, session):
+        self._bridge_ip_address = bridge_ip_address
+        self._username = username
+        self._session = session
+
+
+    @property
+    def bridge_ip_address(self):
+        return self._bridge_ip_address
+
+
+    @property
+    def username(self):
+        return self._username
+
+
+    async def set_color(self, light_id, hue):
+        """Sets the color of the light to a specified hue value.
+
+        Args:
+            light_id:  The id to pass to the Philips Hue API to
+                specify the light to set a color for.
+            hue: Hue of the light (corresponding to HSB color system).
+                Takes values from 0 to 65535.
+
+        Returns:
+            The text of the HTTP response from the Philips Hue API.
+        """
+        url, data = _set_color_request(self._bridge_ip_address, self._username, light_id, hue)
+        async with self._session.put(url, data=data) as response:
+            text = await response.text()
+
+        _check_response(response.status, text)
+        return text
+
+
+def _set_color_request(bridge_ip_address, username, light_id, hue):
+    """Returns the URL and body of the request setting the color of a light."""
+    url = f'http://{bridge_ip_address}/api/{username}/lights/{light_id}/state'
+    return url, json.dumps({"on": True, "hue": hue})
+
+
+def _check_response(status, text):
+    """Raises a BadAPIRequestError if the Philips Hue API rejected a request."""
+    if status != 200:
+        raise BadAPIRequestError(text)
+
+
 # TODO(https://github.com/googleinterns/cloud-monitoring-notification-delivery-integration-sample-code/issues/10):
 # Currently specific to Philips Hue, but will be generalized to trigger
 # whatever notification system the client chooses.
@@ -98,7 +167,8 @@ def get_target_hue_from_monitoring_notification(notification,
     is about and whether the incident is open or closed.
 
     Args:
-        notification: A dictionary containing the notification data.
+        notification: A monitoring_notification.Notification, or a
+            dictionary containing the notification data.
         policy_hue_mapping: A dictionary mapping Google Cloud alerting
             policy names to hue values. Indicates what hue the light
             bulb should light up when receiving a notification about an
@@ -111,26 +181,40 @@ def get_target_hue_from_monitoring_notification(notification,
         corresponds to the HSB color system.
 
     Raises:
-        UnknownIncidentStateError: If the incident state is not open or closed.
+        UnknownIncidentStateError: If the incident state is not open or closed,
+            or has no hue for the policy.
         NotificationParseError: If notification is missing required dict key.
     """
+    if not isinstance(notification, monitoring_notification.Notification):
+        try:
+            notification = monitoring_notification.parse(notification,
+                                                         required_fields=('policy_name',))
+        except UnknownIncidentStateError:
+            # the policy name is checked before the state, so it is there
+            incident = notification['incident']
+            raise _unknown_incident_state_error(incident['policy_name'], incident['state'],
+                                                policy_hue_mapping) from None
+    policy_name = notification.incident.policy_name
+    incident_state = notification.incident.state.value
+
     try:
-        policy_name = notification["incident"]["policy_name"]
-        incident_state = notification["incident"]["state"]
+        hue_value = _incident_state_to_hue_mapping(policy_name,
+                                                   policy_hue_mapping)[incident_state]
     except KeyError:
-        raise NotificationParseError("Notification is missing required dict key")
+        raise _unknown_incident_state_error(policy_name, incident_state,
+                                            policy_hue_mapping) from None
 
+    return hue_value
+
+
+def _incident_state_to_hue_mapping(policy_name, policy_hue_mapping):
     if policy_name in policy_hue_mapping:
-        incident_state_to_hue_mapping = policy_hue_mapping[policy_name]
-    else:
-        incident_state_to_hue_mapping = policy_hue_mapping["default"]
+        return policy_hue_mapping[policy_name]
+    return policy_hue_mapping["default"]
 
-    try:
-        hue_value = incident_state_to_hue_mapping[incident_state]
-    except KeyError:
-        expected_states = list(incident_state_to_hue_mapping.keys())
-        raise UnknownIncidentStateError(
-            f"Incident state for Google Cloud alerting policy '{policy_name}' "
-            f"must be one of: {expected_states}; actual: '{incident_state}'")
 
-    return hue_value
+def _unknown_incident_state_error(policy_name, incident_state, policy_hue_mapping):
+    expected_states = list(_incident_state_to_hue_mapping(policy_name, policy_hue_mapping).keys())
+    return UnknownIncidentStateError(
+        f"Incident state for Google Cloud alerting policy '{policy_name}' "
+        f"must be one of: {expected_states}; actual: '{incident_state}'")
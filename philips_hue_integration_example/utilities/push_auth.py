@@ -0,0 +1,322 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Verifies the OIDC tokens of authenticated Pub/Sub push requests.
+
+A push subscription with authentication sends a Google-signed OIDC token
+of its service account in the Authorization header of each push request.
+PushTokenVerifier checks its signature, audience, issuer and service
+account email.
+
+Google's signing certificates are kept in process by GoogleCerts. They
+are fetched when a worker starts (or on first use), and refreshed in a
+background thread once they are older than refresh_seconds, or when a token is signed
+with a key they do not have (which is refused until the refresh is done),
+so verifying a token never waits for a request to Google. Verified tokens
+are cached until they expire, and Pub/Sub reuses a token for many pushes,
+so most pushes are verified with a dictionary lookup instead of an RSA
+signature check. google.auth and requests are only imported once tokens are
+verified, so importing this module does not slow down the cold start of
+apps that do not verify them.
+
+Typical usage example:
+
+  verifier = PushTokenVerifier(audience='https://my-service.a.run.app',
+                               service_account_email='push@my-project.iam.gserviceaccount.com')
+  verifier.refresh_certs()
+  ...
+  claims = verifier.verify(request.headers.get('Authorization'))
+"""
+
+import base64
+import collections
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from utilities import ttl_cache
+
+logger = logging.getLogger(__name__)
+
+
+class Error(Exception):
+    """Base class for all errors raised in this module."""
+
+
+class AuthenticationError(Error):
+    """Exception raised when a push request does not have a valid token."""
+
+
+class CertsFetchError(Error):
+    """Exception raised when Google's signing certificates cannot be fetched."""
+
+
+class ConfigError(Error):
+    """Exception raised when push token verification is only partly configured."""
+
+
+# the PEM certificates of the keys Google signs OIDC tokens with, by key id
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+
+_GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+# Google's OIDC tokens are valid for an hour, so cached tokens never
+# outlive this (their own expiry is checked as well)
+_MAX_TOKEN_LIFETIME_SECONDS = 60 * 60
+
+# the minimum time between two refreshes of the certificates, so tokens
+# signed with unknown keys cannot make the verifier fetch them repeatedly
+_MIN_REFRESH_INTERVAL_SECONDS = 60
+
+_FetchedCerts = collections.namedtuple('_FetchedCerts', ['certs', 'fetched_at'])
+
+
+def fetch_google_certs(timeout_seconds=10):
+    """Fetches Google's signing certificates.
+
+    Returns:
+        A dictionary mapping key ids to PEM certificates.
+
+    Raises:
+        CertsFetchError: If the certificates cannot be fetched.
+    """
+    import requests  # pylint: disable=import-outside-toplevel
+
+    try:
+        response = requests.get(GOOGLE_CERTS_URL, timeout=timeout_seconds)
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, ValueError) as e:
+        raise CertsFetchError(f'Google signing certificates could not be fetched: {e}') from e
+
+
+class GoogleCerts:
+    """Google's signing certificates, fetched once and refreshed in the background."""
+
+    def __init__(self, refresh_seconds=60 * 60, fetch_certs=fetch_google_certs, *,
+                 clock=time.time):
+        """Initializes the certificates, without fetching them.
+
+        Args:
+            refresh_seconds: The age after which the certificates are
+                refreshed.
+            fetch_certs: A callable returning Google's signing certificates
+                (see fetch_google_certs).
+            clock: A callable returning the current time in seconds since the
+                epoch.
+        """
+        self._refresh_seconds = refresh_seconds
+        self._fetch_certs = fetch_certs
+        self._clock = clock
+        self._fetched = _FetchedCerts(None, None)
+        self._last_refresh_at = None
+        self._refresh_thread = None
+        self._lock = threading.Lock()
+
+
+    def refresh(self):
+        """Fetches Google's signing certificates.
+
+        Raises:
+            CertsFetchError: If the certificates cannot be fetched.
+        """
+        with self._lock:
+            self._last_refresh_at = self._clock()
+        certs = self._fetch_certs()
+        with self._lock:
+            self._fetched = _FetchedCerts(certs, self._clock())
+
+
+    def certs_for(self, key_id):
+        """Returns the certificates to verify a token signed with a key with.
+
+        Only the first use (when the certificates were not fetched when the
+        worker started) waits for them to be fetched.
+
+        Raises:
+            CertsFetchError: If the certificates were never fetched, and
+                cannot be fetched.
+        """
+        with self._lock:
+            certs, fetched_at = self._fetched
+        if certs is None:
+            self.refresh()
+            with self._lock:
+                return self._fetched.certs
+        if key_id not in certs or self._clock() - fetched_at >= self._refresh_seconds:
+            self._refresh_in_background()
+        return certs
+
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if (self._refresh_thread is not None and self._refresh_thread.is_alive()) or (
+                    self._clock() - self._last_refresh_at < _MIN_REFRESH_INTERVAL_SECONDS):
+                return
+            self._last_refresh_at = self._clock()
+            self._refresh_thread = threading.Thread(target=self._refresh_or_log,
+                                                    name='push-auth-certs', daemon=True)
+            self._refresh_thread.start()
+
+
+    def _refresh_or_log(self):
+        try:
+            self.refresh()
+        except CertsFetchError as e:
+            # the certificates already fetched are used until a later refresh
+            logger.warning(e)
+
+
+class PushTokenVerifier:
+    """Verifies the OIDC tokens of push requests, with cached certificates and tokens.
+
+    Attributes:
+        audience: The audience the tokens must be issued for, as set on the
+            push subscription (by default the URL of the push endpoint).
+        service_account_email: The email of the service account the push
+            subscription authenticates as.
+    """
+
+    def __init__(self, audience, service_account_email, max_cached_tokens=1000, certs=None, *,
+                 clock=time.time):
+        """Initializes the verifier, without fetching the certificates.
+
+        Args:
+            audience: The audience the tokens must be issued for.
+            service_account_email: The email of the push service account.
+            max_cached_tokens: The maximum number of verified tokens cached.
+            certs: The GoogleCerts to verify the tokens with. By default,
+                certificates refreshed hourly.
+            clock: A callable returning the current time in seconds since the
+                epoch.
+
+        Raises:
+            Error: If the audience or service account email is missing.
+        """
+        if not audience or not service_account_email:
+            raise Error('Push token verification needs both an audience and a '
+                        'service account email')
+        self._audience = audience
+        self._service_account_email = service_account_email
+        self._certs = certs or GoogleCerts(clock=clock)
+        self._clock = clock
+        # sha256 of the token -> its claims
+        self._verified_tokens = ttl_cache.TtlCache(max_cached_tokens,
+                                                   _MAX_TOKEN_LIFETIME_SECONDS)
+
+
+    @property
+    def audience(self):
+        return self._audience
+
+
+    @property
+    def service_account_email(self):
+        return self._service_account_email
+
+
+    def refresh_certs(self):
+        """Fetches Google's signing certificates.
+
+        Raises:
+            CertsFetchError: If the certificates cannot be fetched.
+        """
+        self._certs.refresh()
+
+
+    def verify(self, authorization):
+        """Verifies the token of a push request.
+
+        Args:
+            authorization: The Authorization header of the request, or None
+                if it has none.
+
+        Returns:
+            The claims of the token.
+
+        Raises:
+            AuthenticationError: If the request does not have a valid token
+                of the service account for the audience.
+            CertsFetchError: If the certificates were never fetched, and
+                cannot be fetched.
+        """
+        scheme, _, token = (authorization or '').partition(' ')
+        if scheme.lower() != 'bearer' or not token:
+            raise AuthenticationError('Push request is missing a bearer token')
+
+        token_hash = hashlib.sha256(token.encode()).digest()
+        claims = self._verified_tokens.get(token_hash)
+        if claims is not None and claims['exp'] > self._clock():
+            return claims
+
+        from google.auth import jwt as google_jwt  # pylint: disable=import-outside-toplevel
+
+        certs = self._certs.certs_for(_key_id(token))
+        try:
+            claims = google_jwt.decode(token, certs=certs, audience=self._audience)
+        except ValueError as e:
+            raise AuthenticationError(f'Push token is invalid: {e}') from e
+        if claims.get('iss') not in _GOOGLE_ISSUERS:
+            raise AuthenticationError('Push token was not issued by Google')
+        if claims.get('email') != self._service_account_email or not claims.get(
+                'email_verified'):
+            raise AuthenticationError('Push token is not of the push service account')
+
+        self._verified_tokens.set(token_hash, claims)
+        return claims
+
+
+def from_config(config):
+    """Creates the verifier of push tokens configured by the PUSH_AUTH_* settings.
+
+    Args:
+        config: A mapping with the uppercase settings of the app (e.g. the
+            Flask config).
+
+    Returns:
+        A PushTokenVerifier, or None if neither PUSH_AUTH_AUDIENCE nor
+        PUSH_AUTH_SERVICE_ACCOUNT_EMAIL is set.
+
+    Raises:
+        ConfigError: If only one of PUSH_AUTH_AUDIENCE and
+            PUSH_AUTH_SERVICE_ACCOUNT_EMAIL is set.
+    """
+    audience = config['PUSH_AUTH_AUDIENCE']
+    service_account_email = config['PUSH_AUTH_SERVICE_ACCOUNT_EMAIL']
+    if not audience and not service_account_email:
+        return None
+    if not audience:
+        raise ConfigError('PUSH_AUTH_AUDIENCE must be set, since PUSH_AUTH_SERVICE_ACCOUNT_EMAIL '
+                          'is set and push tokens are verified')
+    if not service_account_email:
+        raise ConfigError('PUSH_AUTH_SERVICE_ACCOUNT_EMAIL must be set, since PUSH_AUTH_AUDIENCE '
+                          'is set and push tokens are verified')
+    return PushTokenVerifier(audience, service_account_email,
+                             config['PUSH_AUTH_MAX_CACHED_TOKENS'],
+                             GoogleCerts(config['PUSH_AUTH_CERTS_REFRESH_SECONDS']))
+
+
+def _key_id(token):
+    """Returns the id of the key a token is signed with, without verifying the token."""
+    header_segment = token.split('.', 1)[0]
+    try:
+        header = json.loads(base64.urlsafe_b64decode(
+            header_segment + '=' * (-len(header_segment) % 4)))
+    except ValueError as e:
+        raise AuthenticationError('Push token is malformed') from e
+    if not isinstance(header, dict):
+        raise AuthenticationError('Push token is malformed')
+    return header.get('kid')
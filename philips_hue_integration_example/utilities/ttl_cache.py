@@ -0,0 +1,101 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A bounded, thread-safe cache whose entries expire.
+
+Entries expire ttl_seconds after they were set. When the cache is full,
+setting a new key evicts the least recently set entry, so the memory used
+by the cache stays bounded no matter how many keys pass through it.
+
+Typical usage example:
+
+  pending_closes = TtlCache(max_size=10000, ttl_seconds=3600)
+  pending_closes.set(incident_id, True)
+  ...
+  if pending_closes.pop(incident_id):
+      close_issue_right_away()
+"""
+
+import collections
+import threading
+import time
+
+
+class TtlCache:
+    """Maps keys to values for at most ttl_seconds each.
+
+    Attributes:
+        max_size: The maximum number of entries kept.
+        ttl_seconds: The time in seconds after which an entry expires.
+    """
+
+    def __init__(self, max_size, ttl_seconds, clock=time.monotonic):
+        self._max_size = max_size
+        self._ttl_seconds = ttl_seconds
+        self._clock = clock
+        # key -> (expiry time, value), least recently set first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+
+    @property
+    def ttl_seconds(self):
+        return self._ttl_seconds
+
+
+    def __len__(self):
+        with self._lock:
+            self._remove_expired()
+            return len(self._entries)
+
+
+    def get(self, key, default=None):
+        """Returns the value of a key, or default if it is missing or expired."""
+        with self._lock:
+            self._remove_expired()
+            entry = self._entries.get(key)
+            return default if entry is None else entry[1]
+
+
+    def set(self, key, value):
+        """Sets the value of a key, evicting the oldest entry if the cache is full."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self._clock() + self._ttl_seconds, value)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+
+    def pop(self, key, default=None):
+        """Removes a key and returns its value, or default if it is missing or expired."""
+        with self._lock:
+            self._remove_expired()
+            entry = self._entries.pop(key, None)
+            return default if entry is None else entry[1]
+
+
+    def _remove_expired(self):
+        # entries are ordered by the time they were set, so the expired
+        # entries are all at the front
+        now = self._clock()
+        while self._entries:
+            expiry, _ = next(iter(self._entries.values()))
+            if expiry > now:
+                break
+            self._entries.popitem(last=False)
@@ -0,0 +1,480 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks the notification hot path of an integration example.
+
+Measures throughput and latency percentiles of Pub/Sub message parsing
+(including decoding a notification from the raw request body, the way the
+handlers used to and with pubsub.decode_notification),
+the integration specific notification handler (run against a stubbed
+third party client, so no network calls are made) and the full Flask
+request path through app.test_client(). Every benchmark is run for a
+small and a large notification payload, and the Flask request path is
+run for a single client as well as for concurrent clients. For Jira, the
+OAuth1 RSA-SHA1 signing of a request is also measured, with a freshly
+parsed RSA key (as oauthlib does) and with the cached signer.
+
+Results are printed as a table and can be written to a JSON file, which
+can later be passed back with --compare to report the change between
+two versions of the code.
+
+
+  How to use:
+
+  Show help message:
+    $ python3 benchmark.py --help
+
+  Run the Jira benchmarks and save the results:
+    $ python3 benchmark.py jira --output before.json
+
+  Run the Philips Hue benchmarks with 16 concurrent clients:
+    $ python3 benchmark.py philips_hue --concurrency 16
+
+  Compare the current code against previously saved results:
+    $ python3 benchmark.py jira --output after.json --compare before.json
+"""
+
+import argparse
+import base64
+import concurrent.futures
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_INTEGRATION_DIRECTORIES = {
+    'jira': os.path.join(_REPO_ROOT, 'jira_integration_example'),
+    'philips_hue': os.path.join(_REPO_ROOT, 'philips_hue_integration_example'),
+}
+
+# number of characters used to pad the free text fields of a large payload
+_LARGE_PAYLOAD_TEXT_SIZE = 32 * 1024
+
+_LATENCY_PERCENTILES = (50, 90, 99)
+
+
+def make_notification(payload_size, state='open', incident_id='0.abcdef123456',
+                      policy_name='policyA'):
+    """Builds a Cloud Monitoring notification dictionary.
+
+    Args:
+        payload_size: Either 'small', for a notification of a typical size,
+            or 'large', for a notification with long free text fields and
+            many resource labels.
+        state: The incident state, either 'open' or 'closed'.
+        incident_id: The id of the incident the notification is about.
+        policy_name: The name of the alerting policy that triggered the incident.
+
+    Returns:
+        A dictionary containing the notification data.
+    """
+    notification = {
+        'incident': {
+            'incident_id': incident_id,
+            'scoping_project_id': 'benchmark-project',
+            'url': f'https://console.cloud.google.com/monitoring/alerting/incidents/{incident_id}',
+            'started_at': 1596139200,
+            'ended_at': 1596139800 if state == 'closed' else None,
+            'state': state,
+            'summary': 'The metric exceeded its threshold of 3.0.',
+            'policy_name': policy_name,
+            'condition_name': 'test condition',
+            'resource_name': 'benchmark-instance',
+            'resource': {
+                'type': 'gce_instance',
+                'labels': {'instance_id': '1234567890123456789', 'zone': 'us-central1-f'},
+            },
+            'documentation': {'content': 'Restart the instance.', 'mime_type': 'text/markdown'},
+        },
+        'version': '1.2',
+    }
+
+    if payload_size == 'large':
+        incident = notification['incident']
+        incident['summary'] = 'x' * _LARGE_PAYLOAD_TEXT_SIZE
+        incident['documentation']['content'] = 'y' * _LARGE_PAYLOAD_TEXT_SIZE
+        incident['resource']['labels'].update(
+            {f'label_{i}': f'value_{i}' for i in range(256)})
+
+    return notification
+
+
+def make_pubsub_message(notification):
+    """Wraps a notification in a Pub/Sub push message.
+
+    Args:
+        notification: A dictionary containing the notification data.
+
+    Returns:
+        A dictionary containing the Pub/Sub push message.
+    """
+    data = base64.b64encode(json.dumps(notification).encode('utf-8')).decode('utf-8')
+    return {'message': {'data': data, 'message_id': '1'},
+            'subscription': 'projects/benchmark-project/subscriptions/benchmark'}
+
+
+class _StubResultList(list):
+    """A page of search results with the total number of matches, like JIRA's ResultList."""
+
+    def __init__(self, issues):
+        super().__init__(issues)
+        self.total = len(issues)
+
+
+class _StubJiraClient:  # pylint: disable=unused-argument
+    """Stands in for a JIRA client without making any network calls.
+
+    Its methods take the arguments of the JIRA methods they stand in for,
+    and ignore them.
+    """
+
+    @staticmethod
+    def create_issue(**fields):
+        return 'BENCH-1'
+
+
+    @staticmethod
+    def create_issues(field_list, prefetch=True):
+        return [{'status': 'Success', 'issue': f'BENCH-{index}', 'error': None,
+                 'input_fields': fields} for index, fields in enumerate(field_list)]
+
+
+    @staticmethod
+    def search_issues(jql_str, **kwargs):
+        return _StubResultList(['BENCH-1', 'BENCH-2'])
+
+
+    @staticmethod
+    def transition_issue(issue, transition, **kwargs):
+        return None
+
+
+def _load_integration(integration):
+    """Imports the main module of the given integration in test mode."""
+    os.environ['FLASK_APP_ENV'] = 'test'
+    sys.path.insert(0, _INTEGRATION_DIRECTORIES[integration])
+    import main  # pylint: disable=import-outside-toplevel,import-error
+
+    # the handlers log every notification, which would dominate the timings
+    logging.disable(logging.CRITICAL)
+    return main
+
+
+def _jira_benchmarks(main):
+    from oauthlib import oauth1  # pylint: disable=import-outside-toplevel
+    from utilities import jira_notification_handler, oauth_signing  # pylint: disable=import-outside-toplevel,import-error
+
+    stub_client = _StubJiraClient()
+    main.app.extensions['jira_client'] = stub_client
+    config = main.app.config
+    issue_templates = main.app.extensions['issue_templates']
+
+    def handler(notification):
+        return lambda: jira_notification_handler.update_jira_based_on_monitoring_notification(
+            stub_client, config['JIRA_PROJECT'], config['CLOSED_JIRA_ISSUE_STATUS'],
+            notification)
+
+    # signing a request to Jira with a freshly parsed key (as oauthlib does)
+    # and with the cached signer of the credentials
+    oauth_dict = _make_oauth_dict()
+    url = 'https://jira.example.com/rest/api/2/search?jql=labels+%3D+a&fields=labels'
+    oauthlib_client = oauth1.Client(oauth_dict['consumer_key'],
+                                    resource_owner_key=oauth_dict['access_token'],
+                                    resource_owner_secret=oauth_dict['access_token_secret'],
+                                    signature_method=oauth1.SIGNATURE_RSA,
+                                    rsa_key=oauth_dict['key_cert'])
+    cached_signer = oauth_signing.get_signer(oauth_dict)
+
+    return {
+        'open_notification_handler': handler,
+        'closed_notification_handler': lambda notification: handler(
+            dict(notification, incident=dict(notification['incident'], state='closed'))),
+        'oauth1_sign_uncached': lambda notification: lambda: oauthlib_client.sign(
+            url, http_method='GET'),
+        'oauth1_sign_cached': lambda notification: lambda: cached_signer.sign(
+            url, http_method='GET'),
+        # rendering the summary and description of an issue with templates
+        # that were parsed when the app was created
+        'issue_templates_render': lambda notification: lambda: issue_templates.render(
+            notification['incident']['policy_name'], notification['incident']),
+    }
+
+
+def _make_oauth_dict():
+    """Returns OAuth credentials with a newly generated RSA key."""
+    from cryptography.hazmat.primitives import serialization  # pylint: disable=import-outside-toplevel
+    from cryptography.hazmat.primitives.asymmetric import rsa  # pylint: disable=import-outside-toplevel
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    key_cert = private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption()).decode()
+    return {'access_token': 'benchmark-access-token',
+            'access_token_secret': 'benchmark-access-token-secret',
+            'consumer_key': 'benchmark-consumer-key',
+            'key_cert': key_cert}
+
+
+def _philips_hue_benchmarks(main):
+    from utilities import philips_hue  # pylint: disable=import-outside-toplevel,import-error
+
+    main.philips_hue.PhilipsHueClient.set_color = lambda self, light_id, hue: None
+    policy_hue_mapping = main.app.config['POLICY_HUE_MAPPING']
+
+    def target_hue(notification):
+        return lambda: philips_hue.get_target_hue_from_monitoring_notification(
+            notification, policy_hue_mapping)
+
+    return {'get_target_hue': target_hue}
+
+
+_INTEGRATION_BENCHMARKS = {
+    'jira': _jira_benchmarks,
+    'philips_hue': _philips_hue_benchmarks,
+}
+
+
+def _percentile(sorted_values, percentile):
+    index = min(len(sorted_values) - 1,
+                max(0, round(percentile / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_benchmark(operation_factory, iterations, concurrency, warmup):
+    """Times an operation, optionally from several concurrent clients.
+
+    Args:
+        operation_factory: A callable returning the operation to time. It is
+            called once per client, so that each client can hold its own
+            state (e.g. a Flask test client).
+        iterations: The total number of times the operation is run.
+        concurrency: The number of clients running the operation in parallel.
+        warmup: The number of untimed runs each client makes first.
+
+    Returns:
+        A dictionary with the throughput in operations per second and the
+        latency percentiles in milliseconds.
+    """
+    iterations_per_client = max(1, iterations // concurrency)
+
+    def run_client():
+        operation = operation_factory()
+        for _ in range(warmup):
+            operation()
+
+        latencies = []
+        for _ in range(iterations_per_client):
+            start = time.perf_counter()
+            operation()
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        latencies = run_client()
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(run_client) for _ in range(concurrency)]
+            latencies = [latency for future in futures for latency in future.result()]
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    latency_ms = {f'p{percentile}': _percentile(latencies, percentile) * 1000
+                  for percentile in _LATENCY_PERCENTILES}
+    latency_ms['mean'] = sum(latencies) / len(latencies) * 1000
+    latency_ms['max'] = latencies[-1] * 1000
+
+    return {
+        'iterations': len(latencies),
+        'throughput_ops_per_sec': len(latencies) / elapsed,
+        'latency_ms': latency_ms,
+    }
+
+
+def run_benchmarks(integration, iterations, concurrency, warmup):
+    """Runs every benchmark of an integration.
+
+    Args:
+        integration: The name of the integration, either 'jira' or 'philips_hue'.
+        iterations: The number of times each benchmark operation is run.
+        concurrency: The number of concurrent clients used for the
+            concurrent Flask request benchmark.
+        warmup: The number of untimed runs each client makes first.
+
+    Returns:
+        A list of dictionaries, one for each benchmark result.
+    """
+    main = _load_integration(integration)
+    from utilities import pubsub  # pylint: disable=import-outside-toplevel,import-error
+
+    handler_benchmarks = _INTEGRATION_BENCHMARKS[integration](main)
+
+    results = []
+
+    def record(name, payload_size, operation_factory, clients=1):
+        result = run_benchmark(operation_factory, iterations, clients, warmup)
+        result.update({'name': name, 'payload': payload_size, 'concurrency': clients})
+        results.append(result)
+        print(_format_result(result))
+
+    for payload_size in ('small', 'large'):
+        notification = make_notification(payload_size)
+        pubsub_message = make_pubsub_message(notification)
+        pubsub_body = json.dumps(pubsub_message)
+
+        # the loop variables are bound as default arguments, as the operations
+        # are created when recording
+        record('parse_data_from_message', payload_size,
+               lambda message=pubsub_message: lambda: pubsub.parse_data_from_message(message))
+
+        # from the raw request body to the notification dictionary, as the
+        # handlers did before (parsing the message, then base64-decoding the
+        # data into a string and parsing it) and with decode_notification
+        pubsub_body_bytes = pubsub_body.encode('utf-8')
+        record('decode_notification_legacy', payload_size,
+               lambda body=pubsub_body_bytes: lambda: json.loads(
+                   pubsub.parse_data_from_message(json.loads(body))))
+        record('decode_notification', payload_size,
+               lambda body=pubsub_body_bytes: lambda: pubsub.decode_notification(body))
+
+        for name, make_operation in handler_benchmarks.items():
+            operation = make_operation(notification)
+            record(name, payload_size, lambda operation=operation: operation)
+
+        def flask_request(body=pubsub_body):
+            client = main.app.test_client()
+            return lambda: client.post('/', data=body, content_type='application/json')
+
+        for clients in sorted({1, concurrency}):
+            record('flask_request', payload_size, flask_request, clients)
+
+    return results
+
+
+def _result_key(result):
+    return (result['name'], result['payload'], result['concurrency'])
+
+
+def _format_result(result):
+    latency_ms = result['latency_ms']
+    return (f"{result['name']:<30} {result['payload']:<6} c={result['concurrency']:<3} "
+            f"{result['throughput_ops_per_sec']:>12.1f} ops/s  "
+            f"p50={latency_ms['p50']:.4f}ms p90={latency_ms['p90']:.4f}ms "
+            f"p99={latency_ms['p99']:.4f}ms")
+
+
+def compare_results(baseline, current):
+    """Prints the change in throughput and median latency between two runs.
+
+    Args:
+        baseline: The benchmark results document of the earlier run.
+        current: The benchmark results document of the later run.
+    """
+    baseline_results = {_result_key(result): result for result in baseline['results']}
+
+    print(f"\nComparison against {baseline['metadata'].get('git_revision')}:")
+    for result in current['results']:
+        previous = baseline_results.get(_result_key(result))
+        if previous is None:
+            continue
+
+        throughput_ratio = (result['throughput_ops_per_sec'] /
+                            previous['throughput_ops_per_sec'])
+        p50_ratio = result['latency_ms']['p50'] / previous['latency_ms']['p50']
+        print(f"{result['name']:<30} {result['payload']:<6} c={result['concurrency']:<3} "
+              f"throughput x{throughput_ratio:.2f}  p50 x{p50_ratio:.2f}")
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=_REPO_ROOT, stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the notification hot path of an integration example')
+
+    parser.add_argument(
+        'integration',
+        choices=sorted(_INTEGRATION_DIRECTORIES),
+        help='integration example to benchmark'
+    )
+
+    parser.add_argument(
+        '--iterations',
+        type=int,
+        default=2000,
+        help='number of timed runs of each benchmark operation (default: 2000)'
+    )
+
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=8,
+        help='number of concurrent clients for the Flask request benchmark (default: 8)'
+    )
+
+    parser.add_argument(
+        '--warmup',
+        type=int,
+        default=50,
+        help='number of untimed runs each client makes first (default: 50)'
+    )
+
+    parser.add_argument(
+        '--output',
+        help='path of a JSON file to write the results to'
+    )
+
+    parser.add_argument(
+        '--compare',
+        help='path of a JSON file with earlier results to compare against'
+    )
+
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.integration, args.iterations, args.concurrency,
+                             args.warmup)
+    document = {
+        'metadata': {
+            'integration': args.integration,
+            'git_revision': _git_revision(),
+            'python_version': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.time(),
+        },
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(document, output_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            compare_results(json.load(baseline_file), document)
+
+
+if __name__ == '__main__':
+    main()
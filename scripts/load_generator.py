@@ -0,0 +1,498 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Generates synthetic Pub/Sub push load for a locally running integration.
+
+Unlike incident_script.py, which goes through Cloud Monitoring and takes
+minutes per incident, this script builds Cloud Monitoring notifications
+itself, wraps them in Pub/Sub push envelopes and posts them straight to
+a service (e.g. one started with `python3 main.py`). Generated incidents
+are spread over several alerting policies, each incident is opened and
+later closed, and a configurable share of the notifications is
+duplicated or delivered out of order, like Pub/Sub may do.
+
+Load is offered open-loop: requests are started at a target rate
+(evenly spaced or with Poisson arrivals) regardless of how quickly the
+service answers, so a slow service shows up as growing latency instead
+of a lower offered rate. Latency is measured from the scheduled start
+of each request. Latency percentiles, achieved rate and error rates are
+printed at the end of a run and can also be written to a JSON file.
+
+
+  How to use:
+
+  Show help message:
+    $ python3 load_generator.py --help
+
+  Send 1000 notifications at 50 requests per second:
+    $ python3 load_generator.py run --url http://127.0.0.1:8080/ --count 1000 --qps 50
+
+  Use Poisson arrivals, more duplicates and out-of-order deliveries:
+    $ python3 load_generator.py run --url http://127.0.0.1:8080/ --count 1000 --qps 50 \\
+        --arrival poisson --duplicate-rate 0.1 --out-of-order-rate 0.2
+
+  Write the generated notifications to a JSONL file instead of sending them:
+    $ python3 load_generator.py generate --count 1000 --output notifications.jsonl
+
+  Replay captured notifications (or Pub/Sub push envelopes) from a JSONL file:
+    $ python3 load_generator.py replay notifications.jsonl --url http://127.0.0.1:8080/ --qps 20
+"""
+
+import argparse
+import base64
+import collections
+import http.client
+import json
+import queue
+import random
+import threading
+import time
+import urllib.parse
+
+
+_LATENCY_PERCENTILES = (50, 90, 99)
+
+_RESOURCE_TYPES = ('gce_instance', 'cloud_run_revision', 'gae_app', 'k8s_container')
+
+# The rate requests are started at: 'qps' requests per second, with
+# arrivals either 'uniform', for evenly spaced requests, or 'poisson', for
+# exponentially distributed gaps drawn with the given random 'seed'
+Arrivals = collections.namedtuple('Arrivals', ['qps', 'arrival', 'seed'],
+                                  defaults=('uniform', None))
+
+
+def generate_notifications(count, policy_count=5, duplicate_rate=0.05,
+                           out_of_order_rate=0.05, seed=None):
+    """Generates a realistic sequence of Cloud Monitoring notifications.
+
+    Incidents are spread over the given number of alerting policies. Every
+    incident yields an "open" notification followed, some time later, by a
+    "closed" notification. A share of the notifications is delivered twice,
+    and a share of the incidents has its "closed" notification delivered
+    before its "open" notification.
+
+    Args:
+        count: The approximate number of notifications to generate.
+        policy_count: The number of distinct alerting policies.
+        duplicate_rate: The probability of a notification being duplicated.
+        out_of_order_rate: The probability of an incident's notifications
+            being delivered in reverse order.
+        seed: Seed of the random number generator, for reproducible runs.
+
+    Returns:
+        A list of dictionaries containing notification data.
+    """
+    rng = random.Random(seed)
+    policies = [f'policy-{i}' for i in range(policy_count)]
+
+    notifications = []
+    open_incidents = []
+    incident_number = 0
+    started_at = int(time.time())
+
+    while len(notifications) < count:
+        # keep a few incidents open at any time, so closes interleave with opens
+        if open_incidents and (len(open_incidents) > 10 or rng.random() < 0.5):
+            incident = open_incidents.pop(rng.randrange(len(open_incidents)))
+            closed = dict(incident, state='closed', ended_at=started_at + incident_number,
+                          summary=incident['summary'].replace('exceeded', 'returned below'))
+            sequence = [{'incident': closed, 'version': '1.2'}]
+        else:
+            incident_number += 1
+            incident = _make_incident(rng, policies, incident_number, started_at)
+            open_incidents.append(incident)
+            sequence = [{'incident': incident, 'version': '1.2'}]
+
+            if rng.random() < out_of_order_rate:
+                # deliver the close first and forget about the incident
+                open_incidents.pop()
+                closed = dict(incident, state='closed', ended_at=started_at + incident_number)
+                sequence.insert(0, {'incident': closed, 'version': '1.2'})
+
+        for notification in sequence:
+            notifications.append(notification)
+            if rng.random() < duplicate_rate:
+                notifications.append(notification)
+
+    return notifications[:count]
+
+
+def _make_incident(rng, policies, incident_number, started_at):
+    policy_name = rng.choice(policies)
+    resource_type = rng.choice(_RESOURCE_TYPES)
+    incident_id = f'0.{incident_number:012x}'
+    resource_name = f'{resource_type}-{rng.randrange(100)}'
+
+    return {
+        'incident_id': incident_id,
+        'scoping_project_id': 'load-test-project',
+        'url': f'https://console.cloud.google.com/monitoring/alerting/incidents/{incident_id}',
+        'started_at': started_at + incident_number,
+        'ended_at': None,
+        'state': 'open',
+        'summary': f'The metric for {resource_name} exceeded its threshold of 3.0.',
+        'policy_name': policy_name,
+        'condition_name': f'{policy_name} condition',
+        'resource_name': resource_name,
+        'resource': {'type': resource_type, 'labels': {'zone': 'us-central1-f'}},
+        'documentation': {'content': f'Runbook for {policy_name}.',
+                          'mime_type': 'text/markdown'},
+    }
+
+
+def make_push_envelope(notification, message_id):
+    """Wraps a notification in a Pub/Sub push request body.
+
+    Args:
+        notification: A dictionary containing the notification data.
+        message_id: The Pub/Sub message id to use.
+
+    Returns:
+        A dictionary in the format Pub/Sub uses for push requests.
+    """
+    data = base64.b64encode(json.dumps(notification).encode('utf-8')).decode('utf-8')
+    return {
+        'message': {
+            'data': data,
+            'attributes': {},
+            'messageId': str(message_id),
+            'publishTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'subscription': 'projects/load-test-project/subscriptions/alert-push-subscription',
+    }
+
+
+def load_jsonl(path):
+    """Loads captured notifications from a JSONL file as push request bodies.
+
+    Each line can either hold a notification or a complete Pub/Sub push
+    envelope (an object with a 'message' key), which is sent unchanged.
+
+    Args:
+        path: The path of the JSONL file.
+
+    Returns:
+        A list of dictionaries in the format Pub/Sub uses for push requests.
+    """
+    envelopes = []
+    with open(path) as jsonl_file:
+        for line in jsonl_file:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if 'message' not in record:
+                record = make_push_envelope(record, len(envelopes) + 1)
+            envelopes.append(record)
+    return envelopes
+
+
+class _Sender:
+    """Posts request bodies over a keep-alive connection per thread."""
+
+    def __init__(self, url, timeout):
+        parsed_url = urllib.parse.urlsplit(url)
+        self._connection_class = (http.client.HTTPSConnection if parsed_url.scheme == 'https'
+                                  else http.client.HTTPConnection)
+        self._netloc = parsed_url.netloc
+        self._path = parsed_url.path or '/'
+        self._timeout = timeout
+        self._local = threading.local()
+
+
+    def post(self, body):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._connection_class(self._netloc, timeout=self._timeout)
+            self._local.connection = connection
+
+        try:
+            connection.request('POST', self._path, body=body,
+                               headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            raise
+
+
+def drive(envelopes, url, arrivals, max_in_flight=64, timeout=30.0):
+    """Sends push request bodies to a service at an open-loop arrival rate.
+
+    Args:
+        envelopes: A list of dictionaries in the Pub/Sub push request format.
+        url: The URL of the push endpoint of the service.
+        arrivals: An Arrivals with the target rate of requests per second
+            and how their start times are distributed.
+        max_in_flight: The number of sender threads, which bounds the
+            number of requests that can be outstanding at once.
+        timeout: The timeout of a single request in seconds.
+
+    Returns:
+        A dictionary summarizing latencies, status codes and error rates.
+    """
+    rng = random.Random(arrivals.seed)
+    sender = _Sender(url, timeout)
+    bodies = [json.dumps(envelope).encode('utf-8') for envelope in envelopes]
+
+    work = queue.Queue()
+    latencies = []
+    status_counts = collections.Counter()
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            scheduled_time, body = item
+            try:
+                status = sender.post(body)
+            except (OSError, http.client.HTTPException) as e:
+                status = type(e).__name__
+            latency = time.perf_counter() - scheduled_time
+            with lock:
+                latencies.append(latency)
+                status_counts[status] += 1
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max_in_flight)]
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+    scheduled_time = start
+    for body in bodies:
+        delay = scheduled_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        work.put((scheduled_time, body))
+        gap = (rng.expovariate(arrivals.qps) if arrivals.arrival == 'poisson'
+               else 1 / arrivals.qps)
+        scheduled_time += gap
+
+    for _ in threads:
+        work.put(None)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return summarize(latencies, status_counts, elapsed, arrivals.qps)
+
+
+def _percentile(sorted_values, percentile):
+    index = min(len(sorted_values) - 1,
+                max(0, round(percentile / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, status_counts, elapsed, target_qps):
+    """Summarizes the outcome of a load run.
+
+    Args:
+        latencies: A list of request latencies in seconds.
+        status_counts: A mapping of HTTP status codes (or exception names,
+            for requests that failed without a response) to request counts.
+        elapsed: The duration of the run in seconds.
+        target_qps: The rate of requests per second that was offered.
+
+    Returns:
+        A dictionary summarizing latencies, status codes and error rates.
+    """
+    total = sum(status_counts.values())
+    server_errors = sum(count for status, count in status_counts.items()
+                        if not isinstance(status, int) or status >= 500)
+    client_errors = sum(count for status, count in status_counts.items()
+                        if isinstance(status, int) and 400 <= status < 500)
+
+    latencies = sorted(latencies)
+    latency_ms = {}
+    if latencies:
+        latency_ms = {f'p{percentile}': _percentile(latencies, percentile) * 1000
+                      for percentile in _LATENCY_PERCENTILES}
+        latency_ms['max'] = latencies[-1] * 1000
+
+    return {
+        'requests': total,
+        'target_qps': target_qps,
+        'achieved_qps': total / elapsed if elapsed else 0.0,
+        'latency_ms': latency_ms,
+        'status_counts': {str(status): count for status, count in sorted(
+            status_counts.items(), key=lambda item: str(item[0]))},
+        'client_error_rate': client_errors / total if total else 0.0,
+        'server_error_rate': server_errors / total if total else 0.0,
+    }
+
+
+def _print_summary(summary):
+    print(f"requests:          {summary['requests']}")
+    print(f"target rate:       {summary['target_qps']:.1f} req/s")
+    print(f"achieved rate:     {summary['achieved_qps']:.1f} req/s")
+    for name, value in summary['latency_ms'].items():
+        print(f"latency {name + ':':<10} {value:.2f} ms")
+    print(f"status codes:      {summary['status_counts']}")
+    print(f"4xx error rate:    {summary['client_error_rate']:.2%}")
+    print(f"5xx error rate:    {summary['server_error_rate']:.2%}")
+
+
+def _add_generation_arguments(parser):
+    parser.add_argument(
+        '--count',
+        type=int,
+        default=100,
+        help='number of notifications to generate (default: 100)'
+    )
+
+    parser.add_argument(
+        '--policies',
+        type=int,
+        default=5,
+        help='number of distinct alerting policies (default: 5)'
+    )
+
+    parser.add_argument(
+        '--duplicate-rate',
+        type=float,
+        default=0.05,
+        help='probability of a notification being delivered twice (default: 0.05)'
+    )
+
+    parser.add_argument(
+        '--out-of-order-rate',
+        type=float,
+        default=0.05,
+        help='probability of an incident being closed before it is opened (default: 0.05)'
+    )
+
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='seed for reproducible notification sequences and arrivals'
+    )
+
+
+def _add_load_arguments(parser):
+    parser.add_argument(
+        '--url',
+        default='http://127.0.0.1:8080/',
+        help='push endpoint of the service (default: http://127.0.0.1:8080/)'
+    )
+
+    parser.add_argument(
+        '--qps',
+        type=float,
+        default=10.0,
+        help='target rate of requests per second (default: 10)'
+    )
+
+    parser.add_argument(
+        '--arrival',
+        choices=['uniform', 'poisson'],
+        default='uniform',
+        help='distribution of request start times (default: uniform)'
+    )
+
+    parser.add_argument(
+        '--max-in-flight',
+        type=int,
+        default=64,
+        help='maximum number of outstanding requests (default: 64)'
+    )
+
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=30.0,
+        help='timeout of a single request in seconds (default: 30)'
+    )
+
+    parser.add_argument(
+        '--output',
+        help='path of a JSON file to write the summary to'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=('Generate synthetic Pub/Sub push load or replay captured '
+                     'notifications against a local service'))
+
+    subparsers = parser.add_subparsers(dest='command')
+
+    generate_parser = subparsers.add_parser(
+        'generate',
+        help='write generated notifications to a JSONL file'
+    )
+    _add_generation_arguments(generate_parser)
+    generate_parser.add_argument(
+        '--output',
+        required=True,
+        help='path of the JSONL file to write'
+    )
+
+    run_parser = subparsers.add_parser(
+        'run',
+        help='generate notifications and send them to a service'
+    )
+    _add_generation_arguments(run_parser)
+    _add_load_arguments(run_parser)
+
+    replay_parser = subparsers.add_parser(
+        'replay',
+        help='send notifications from a JSONL file to a service'
+    )
+    replay_parser.add_argument(
+        'path',
+        help='JSONL file with one notification or push envelope per line'
+    )
+    replay_parser.add_argument(
+        '--seed',
+        type=int,
+        help='seed for reproducible arrivals'
+    )
+    _add_load_arguments(replay_parser)
+
+    args = parser.parse_args()
+
+    if args.command is None:
+        print('See available arguments with: $ python3 load_generator.py -h')
+        return
+
+    if args.command == 'replay':
+        envelopes = load_jsonl(args.path)
+    else:
+        notifications = generate_notifications(args.count, args.policies,
+                                               args.duplicate_rate,
+                                               args.out_of_order_rate, args.seed)
+        if args.command == 'generate':
+            with open(args.output, 'w') as output_file:
+                for notification in notifications:
+                    output_file.write(json.dumps(notification) + '\n')
+            print(f'Wrote {len(notifications)} notifications to {args.output}')
+            return
+        envelopes = [make_push_envelope(notification, message_id)
+                     for message_id, notification in enumerate(notifications, start=1)]
+
+    summary = drive(envelopes, args.url, Arrivals(args.qps, args.arrival, args.seed),
+                    args.max_in_flight, args.timeout)
+    _print_summary(summary)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(summary, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
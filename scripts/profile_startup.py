@@ -0,0 +1,214 @@
+# Copyright 2020 Google, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Profiles the cold start of an integration example.
+
+Starts a fresh Python process that imports the integration's main module
+(which loads the config and creates the app, like a new Cloud Run instance
+does) with Python's import time profiling (-X importtime) turned on, and
+reports where the startup time goes:
+
+  * the time spent importing each top-level package, and
+  * the time spent initializing the app (loading the config, resolving
+    secrets and creating the app), and optionally the time spent creating
+    the third party clients of a worker.
+
+With --max-startup-ms the script exits with a non-zero status when the
+startup takes longer than the given budget, so it can be used as a
+regression check for the cold start time.
+
+
+  How to use:
+
+  Show help message:
+    $ python3 profile_startup.py --help
+
+  Profile the startup of the Jira integration with the test config:
+    $ python3 profile_startup.py jira
+
+  Profile the startup with the dev config, including client creation:
+    $ python3 profile_startup.py jira --env dev --with-clients
+
+  Fail if the startup takes longer than 1.5 seconds:
+    $ python3 profile_startup.py jira --max-startup-ms 1500
+"""
+
+import argparse
+import collections
+import json
+import os
+import subprocess
+import sys
+
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_INTEGRATION_DIRECTORIES = {
+    'jira': os.path.join(_REPO_ROOT, 'jira_integration_example'),
+    'philips_hue': os.path.join(_REPO_ROOT, 'philips_hue_integration_example'),
+}
+
+# Runs in the profiled process; prints the phase timings as JSON on stdout.
+_PROFILED_STARTUP = '''
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+if {with_clients}:
+    main.init_worker_clients(main.app)
+clients_created = time.perf_counter()
+print(json.dumps({{'import_main_ms': (imported - start) * 1000,
+                   'init_worker_clients_ms': (clients_created - imported) * 1000}}))
+'''
+
+
+def parse_import_times(importtime_output):
+    """Parses the output of -X importtime.
+
+    Args:
+        importtime_output: The text written to stderr by python -X importtime.
+
+    Returns:
+        A list of (module name, self time in microseconds, cumulative time
+        in microseconds, nesting level) tuples in the order they were logged.
+    """
+    import_times = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip())) // 2
+        import_times.append((name.strip(), int(self_us), int(cumulative_us), level))
+    return import_times
+
+
+def profile_startup(integration, environment='test', with_clients=False):
+    """Profiles the startup of an integration in a fresh process.
+
+    Args:
+        integration: The name of the integration, either 'jira' or 'philips_hue'.
+        environment: The config environment to start with (FLASK_APP_ENV).
+        with_clients: Whether to also create the third party clients of a
+            worker (which connects to the third party service).
+
+    Returns:
+        A dictionary with the total startup time, the app initialization
+        and client creation times, and the import time of each top-level
+        package, all in milliseconds.
+    """
+    process_environment = dict(os.environ, FLASK_APP_ENV=environment)
+    completed_process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         _PROFILED_STARTUP.format(with_clients=with_clients)],
+        cwd=_INTEGRATION_DIRECTORIES[integration], env=process_environment,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+        check=True)
+
+    phases = json.loads(completed_process.stdout.strip().splitlines()[-1])
+    import_times = parse_import_times(completed_process.stderr)
+
+    # -X importtime logs a module after everything it imports, so the modules
+    # imported by main are the nested entries right before main's own entry
+    main_index = next(index for index, (name, _, _, level) in enumerate(import_times)
+                      if name == 'main' and level == 0)
+    main_self_us = import_times[main_index][1]
+    first_index = main_index
+    while first_index > 0 and import_times[first_index - 1][3] > 0:
+        first_index -= 1
+
+    package_import_us = collections.Counter()
+    for name, self_us, _, _ in import_times[first_index:main_index]:
+        package_import_us[name.split('.')[0]] += self_us
+
+    return {
+        'integration': integration,
+        'environment': environment,
+        'startup_ms': phases['import_main_ms'] + phases['init_worker_clients_ms'],
+        'imports_ms': sum(package_import_us.values()) / 1000,
+        'app_init_ms': main_self_us / 1000,
+        'init_worker_clients_ms': phases['init_worker_clients_ms'],
+        'package_import_ms': {package: import_us / 1000 for package, import_us
+                              in package_import_us.most_common()},
+    }
+
+
+def _print_profile(profile, top):
+    print(f"Startup of the {profile['integration']} integration "
+          f"({profile['environment']} config): {profile['startup_ms']:.1f} ms")
+    print(f"  imports:               {profile['imports_ms']:8.1f} ms")
+    print(f"  app init (main.py):    {profile['app_init_ms']:8.1f} ms")
+    print(f"  worker client init:    {profile['init_worker_clients_ms']:8.1f} ms")
+    print('\nSlowest top-level package imports (self time of all their modules):')
+    for package, import_ms in list(profile['package_import_ms'].items())[:top]:
+        print(f'  {package:<30} {import_ms:8.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Profile the cold start of an integration example')
+
+    parser.add_argument(
+        'integration',
+        choices=sorted(_INTEGRATION_DIRECTORIES),
+        help='integration example to profile'
+    )
+
+    parser.add_argument(
+        '--env',
+        default='test',
+        choices=['prod', 'dev', 'test'],
+        help='config environment to start with (default: test)'
+    )
+
+    parser.add_argument(
+        '--with-clients',
+        action='store_true',
+        help='also create the third party clients of a worker'
+    )
+
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=15,
+        help='number of top-level packages to list (default: 15)'
+    )
+
+    parser.add_argument(
+        '--output',
+        help='path of a JSON file to write the profile to'
+    )
+
+    parser.add_argument(
+        '--max-startup-ms',
+        type=float,
+        help='exit with a non-zero status if the startup takes longer than this'
+    )
+
+    args = parser.parse_args()
+
+    profile = profile_startup(args.integration, args.env, args.with_clients)
+    _print_profile(profile, args.top)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(profile, output_file, indent=2)
+
+    if args.max_startup_ms is not None and profile['startup_ms'] > args.max_startup_ms:
+        print(f"\nStartup took {profile['startup_ms']:.1f} ms, which exceeds the budget "
+              f'of {args.max_startup_ms:.1f} ms')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,3 +4,23 @@ export FLASK_APP_ENV=test
 pytest philips_hue_integration_example
 pytest jira_integration_example/tests/jira_notification_handler_test.py
 pytest jira_integration_example/tests/main_test.py
+pytest jira_integration_example/tests/async_main_test.py
+pytest jira_integration_example/tests/jira_async_client_test.py
+pytest jira_integration_example/tests/jira_rest_client_test.py
+pytest jira_integration_example/tests/jira_bulk_create_test.py
+pytest jira_integration_example/tests/oauth_signing_test.py
+pytest jira_integration_example/tests/jira_auth_test.py
+pytest jira_integration_example/tests/startup_test.py
+pytest jira_integration_example/tests/benchmark_test.py
+pytest jira_integration_example/tests/graceful_shutdown_test.py
+pytest jira_integration_example/tests/admission_control_test.py
+pytest jira_integration_example/tests/keyed_locks_test.py
+pytest jira_integration_example/tests/ttl_cache_test.py
+pytest jira_integration_example/tests/flap_suppression_test.py
+pytest jira_integration_example/tests/digest_test.py
+pytest jira_integration_example/tests/micro_batch_test.py
+pytest jira_integration_example/tests/issue_templates_test.py
+pytest jira_integration_example/tests/routing_test.py
+pytest jira_integration_example/tests/monitoring_notification_test.py
+pytest jira_integration_example/tests/pubsub_test.py
+pytest jira_integration_example/tests/push_auth_test.py